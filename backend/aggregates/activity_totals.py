@@ -0,0 +1,94 @@
+"""Per-period activity totals, maintained from deltas.
+
+Each activity contributes (distance, duration_s, activities=1) to the bucket
+of every period containing its date. A write turns into the difference
+between the contributions after and before it, so aggregates are updated in
+place instead of being recomputed from the activity history.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+PERIODS = ("week", "month")
+# Per-user stats also keep daily buckets for the trend chart
+STATS_PERIODS = ("day", "week", "month")
+METRICS = ("distance", "duration_s", "activities")
+
+
+def period_start(day: date, period: str) -> date:
+    if period == "day":
+        return day
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown period {period!r}")
+
+
+def next_period_start(start: date, period: str) -> date:
+    if period == "day":
+        return start + timedelta(days=1)
+    if period == "week":
+        return start + timedelta(days=7)
+    if period == "month":
+        return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    raise ValueError(f"Unknown period {period!r}")
+
+
+def period_starts(first: date, last: date, period: str) -> List[date]:
+    """Starts of every bucket overlapping [first, last]."""
+    starts, start = [], period_start(first, period)
+    while start <= last:
+        starts.append(start)
+        start = next_period_start(start, period)
+    return starts
+
+
+def _day(value) -> date:
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+def duration_seconds(value) -> int:
+    """Seconds in an activity `time` ("HH:MM:SS", optionally with fractions)."""
+    if hasattr(value, "hour"):
+        return value.hour * 3600 + value.minute * 60 + value.second
+    hours, minutes, seconds = str(value).split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(float(seconds))
+
+
+def contributions(activity: Dict[str, Any], periods: Sequence[str] = PERIODS) -> List[Tuple[Tuple[str, date], Dict[str, int]]]:
+    day = _day(activity["date"])
+    values = {"distance": int(activity["distance"]), "duration_s": duration_seconds(activity["time"]), "activities": 1}
+    return [((period, period_start(day, period)), values) for period in periods]
+
+
+def activity_deltas(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]],
+                    periods: Sequence[str] = PERIODS) -> List[Dict[str, Any]]:
+    """Bucket deltas for one activity write: create (before=None), update, or delete (after=None)."""
+    totals: Dict[Tuple[str, date], Dict[str, int]] = defaultdict(lambda: dict.fromkeys(METRICS, 0))
+    for sign, activity in ((-1, before), (1, after)):
+        if activity is None:
+            continue
+        for key, values in contributions(activity, periods):
+            for metric, value in values.items():
+                totals[key][metric] += sign * value
+    return [
+        {"period": period, "period_start": start.isoformat(), **values}
+        for (period, start), values in totals.items()
+        if any(values.values())
+    ]
+
+
+def aggregate_activities(activities: Iterable[Dict[str, Any]], periods: Sequence[str] = PERIODS) -> List[Dict[str, Any]]:
+    """Bucket totals of many activities in one pass, for bulk rebuilds."""
+    totals: Dict[Tuple[str, str, date], Dict[str, int]] = defaultdict(lambda: dict.fromkeys(METRICS, 0))
+    for activity in activities:
+        user = activity["user_reference"]
+        for (period, start), values in contributions(activity, periods):
+            bucket = totals[(user, period, start)]
+            for metric, value in values.items():
+                bucket[metric] += value
+    return [
+        {"user_reference": user, "period": period, "period_start": start.isoformat(), **values}
+        for (user, period, start), values in totals.items()
+    ]
@@ -0,0 +1,67 @@
+"""Concurrent throughput of the sync vs async handler against a local PostgREST stand-in.
+
+The sync path runs on a 40-worker pool, matching Starlette's default
+threadpool; the async path awaits every request on one event loop.
+
+Run from backend/:  python -m benchmarks.bench_async_vs_sync
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from supabase import create_client
+from supabase_handler.supabase_handler import supabase_handler
+from supabase_handler.async_supabase_handler import async_supabase_handler
+from benchmarks.standins import postgrest_standin
+
+THREADPOOL_SIZE = 40
+REQUESTS = 400
+UPSTREAM_LATENCY = 0.05
+USERS = 20
+IN_FLIGHT = 200
+
+
+def run_sync(url: str) -> float:
+    handler = supabase_handler.__new__(supabase_handler)
+    handler.supabase = create_client(url, "standin-key")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(THREADPOOL_SIZE) as pool:
+        list(pool.map(lambda i: handler.get_user_activities(f"user-{i % USERS}"), range(REQUESTS)))
+    return time.perf_counter() - start
+
+
+async def run_async(url: str) -> float:
+    handler = async_supabase_handler(url=url, key="standin-key", max_connections=IN_FLIGHT)
+    # Mirrors a server holding IN_FLIGHT open requests at a time
+    in_flight = asyncio.Semaphore(IN_FLIGHT)
+
+    async def one(i):
+        async with in_flight:
+            return await handler.get_user_activities(f"user-{i % USERS}")
+
+    try:
+        await one(0)
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(REQUESTS)))
+        return time.perf_counter() - start
+    finally:
+        await handler.aclose()
+
+
+def main():
+    with postgrest_standin(latency=UPSTREAM_LATENCY) as standin:
+        standin.seed("activities", [
+            {"route": "Loop", "time": "00:30:00", "distance": 5000, "date": "2025-11-24",
+             "avgSpeed": 3, "title": f"Drive {i}", "user_reference": f"user-{i % USERS}"}
+            for i in range(200)
+        ])
+        floor = REQUESTS / (1 / UPSTREAM_LATENCY * THREADPOOL_SIZE)
+        print(f"{REQUESTS} concurrent list requests, {UPSTREAM_LATENCY * 1000:.0f}ms upstream latency")
+        print(f"  threadpool-bound floor ({THREADPOOL_SIZE} workers): {floor * 1000:.0f}ms")
+        elapsed = run_sync(standin.base_url)
+        print(f"  sync  handler: {elapsed * 1000:7.0f}ms  {REQUESTS / elapsed:7.0f} req/s")
+        elapsed = asyncio.run(run_async(standin.base_url))
+        print(f"  async handler: {elapsed * 1000:7.0f}ms  {REQUESTS / elapsed:7.0f} req/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""End-to-end load scenarios against the real app and a local Supabase stand-in.
+
+The API runs under uvicorn on a local port; PostgREST, GoTrue and the JWKS
+endpoint are served by `postgrest_standin` with `--upstream-latency` added to
+every upstream call. Tokens are ES256 JWTs signed by a throwaway key the
+stand-in publishes, so the full verification path is exercised.
+
+Scenarios:
+    signup   signup storm: sign up then sign in many users at once
+    ingest   every driver creates a route and uploads a synthetic drive in batches
+    poll     clients poll activity and route lists, revalidating with ETags
+    fetch    route detail and simplified point fetches at random zoom levels
+
+Run from backend/:
+    python -m benchmarks.bench_e2e --scenario all --concurrency 50
+    python -m benchmarks.bench_e2e --json run.json --baseline previous.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+from benchmarks.common import make_signing_key, sign_token
+from benchmarks.load import (
+    api_client, api_server, latency_recorder, print_report, run_concurrently, compare_reports, save_report
+)
+from benchmarks.standins import postgrest_standin
+from benchmarks.synthetic import activity_row, drive_points, route_row, user_emails
+
+SCENARIOS = ("signup", "ingest", "poll", "fetch")
+KID = "bench-e2e"
+
+
+async def scenario_signup(client: api_client, ctx, args):
+    async def one(email):
+        await client.request("POST /signup/", "POST", "/signup/", params={"email": email, "password": "bench-pass"})
+        await client.request("POST /signin/", "POST", "/signin/", params={"email": email, "password": "bench-pass"})
+
+    emails = list(user_emails(args.users * 5, prefix="storm"))
+    await run_concurrently([lambda e=e: one(e) for e in emails], args.concurrency)
+
+
+async def scenario_ingest(client: api_client, ctx, args):
+    async def one(seed):
+        token = ctx["tokens"][seed % len(ctx["tokens"])]
+        points = drive_points(seed, duration_s=args.drive_seconds)
+        response = await client.request("POST /routes/", "POST", "/routes/", token, json=route_row(seed, points))
+        route_id = response.json()["id"]
+        ctx["route_ids"].append(route_id)
+        for start in range(0, len(points), args.batch_size):
+            batch = [dict(p, route_id=route_id) for p in points[start:start + args.batch_size]]
+            await client.request("POST /points/batch", "POST", "/points/batch", token, json=batch)
+
+    await run_concurrently([lambda s=s: one(s) for s in range(args.users)], args.concurrency)
+
+
+async def scenario_poll(client: api_client, ctx, args):
+    etags = {}
+
+    async def one(i):
+        token = ctx["tokens"][i % len(ctx["tokens"])]
+        for label, url in (("GET /activities/", "/activities/?limit=20"), ("GET /routes/", "/routes/?limit=20")):
+            key = (token, url)
+            headers = {"If-None-Match": etags[key]} if key in etags else {}
+            response = await client.request(label, "GET", url, token, headers=headers)
+            if "etag" in response.headers:
+                etags[key] = response.headers["etag"]
+
+    await run_concurrently([lambda i=i: one(i) for i in range(args.requests)], args.concurrency)
+
+
+async def scenario_fetch(client: api_client, ctx, args):
+    route_ids = ctx["route_ids"]
+    if not route_ids:
+        print("  fetch: no routes ingested, run with the ingest scenario", file=sys.stderr)
+        return
+    rng = random.Random(7)
+
+    async def one(i):
+        token = ctx["tokens"][i % len(ctx["tokens"])]
+        route_id = rng.choice(route_ids)
+        await client.request("GET /routes/{route_id}", "GET", f"/routes/{route_id}", token)
+        await client.request(
+            "GET /routes/{route_id}/points", "GET", f"/routes/{route_id}/points", token,
+            params={"zoom": rng.randint(8, 18)},
+        )
+
+    await run_concurrently([lambda i=i: one(i) for i in range(args.requests)], args.concurrency)
+
+
+async def run(args, base_url: str, tokens, user_ids):
+    results = {}
+    ctx = {"tokens": tokens, "user_ids": user_ids, "route_ids": []}
+    scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+    if "fetch" in scenarios and "ingest" not in scenarios:
+        scenarios = ("ingest",) + scenarios
+    for name in scenarios:
+        recorder = latency_recorder()
+        client = api_client(base_url, recorder, max_connections=args.concurrency)
+        try:
+            await globals()[f"scenario_{name}"](client, ctx, args)
+        finally:
+            recorder.stop()
+            await client.aclose()
+        results[name] = recorder.report()
+        print_report(f"{name} ({recorder.finished - recorder.started:.2f}s)", results[name])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=40, help="Synthetic drivers (and drives)")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per polling/fetch scenario")
+    parser.add_argument("--drive-seconds", type=float, default=1200.0)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--upstream-latency", type=float, default=0.002, help="Seconds added to each upstream call")
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--baseline", help="Compare p95 against a previous --json report")
+    args = parser.parse_args()
+
+    private_pem, public_jwk = make_signing_key(KID)
+    signer = lambda user_id: sign_token(private_pem, KID, user_id)
+    with postgrest_standin({"keys": [public_jwk]}, latency=args.upstream_latency, token_signer=signer) as standin:
+        user_ids = [f"bench-user-{i}" for i in range(args.users)]
+        tokens = [signer(uid) for uid in user_ids]
+        standin.seed("activities", [activity_row(i, user_ids[i % args.users]) for i in range(args.users * 25)])
+        with api_server(standin.base_url) as server:
+            print(f"API {server.base_url}, upstream {standin.base_url} (+{args.upstream_latency * 1000:.0f}ms)")
+            results = asyncio.run(run(args, server.base_url, tokens, user_ids))
+        print(f"upstream requests: {standin.requests}")
+
+    if args.json:
+        save_report(args.json, results)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_reports(results, json.load(f))
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
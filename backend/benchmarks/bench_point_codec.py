@@ -0,0 +1,54 @@
+"""Payload size and server-side decode cost: JSON point lists vs packed columns.
+
+Run from backend/:  python -m benchmarks.bench_point_codec
+"""
+import gzip
+import json
+from typing import List
+import numpy as np
+from pydantic import TypeAdapter
+from ingest import point_codec
+from benchmarks.common import timeit, print_row
+
+
+def synthetic_drive(count: int, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    lat = 47.37 + np.cumsum(rng.normal(0, 1e-4, count))
+    lng = 8.54 + np.cumsum(rng.normal(0, 1e-4, count))
+    timestamp_ms = 1_732_442_400_000 + np.arange(count, dtype=np.int64) * 2000
+    return lat, lng, timestamp_ms
+
+
+def main():
+    from main import PointCreate
+
+    adapter = TypeAdapter(List[PointCreate])
+    for count in (1_000, 20_000):
+        lat, lng, timestamp_ms = synthetic_drive(count)
+        rows = point_codec.to_rows(lat, lng, timestamp_ms)
+        json_body = json.dumps(rows).encode()
+        raw_body = point_codec.encode_points(lat, lng, timestamp_ms, point_codec.ENCODING_RAW)
+        delta_body = point_codec.encode_points(lat, lng, timestamp_ms, point_codec.ENCODING_DELTA)
+
+        print(f"{count} points")
+        for name, body in (("json", json_body), ("packed raw", raw_body), ("packed delta", delta_body)):
+            print(f"  {name:<14} {len(body):>10} bytes  gzip {len(gzip.compress(body)):>10} bytes")
+
+        def json_path():
+            points = adapter.validate_json(json_body)
+            data = []
+            for point in points:
+                point_dict = point.model_dump(exclude_none=True)
+                point_dict["timestamp"] = point_dict["timestamp"].isoformat()
+                data.append(point_dict)
+            return data
+
+        iterations = max(5, 200_000 // count)
+        print_row("  decode json (pydantic)", timeit(json_path, iterations))
+        print_row("  decode packed raw", timeit(lambda: point_codec.to_rows(*point_codec.decode_points(raw_body)), iterations))
+        print_row("  decode packed delta", timeit(lambda: point_codec.to_rows(*point_codec.decode_points(delta_body)), iterations))
+        print_row("  decode delta, arrays only", timeit(lambda: point_codec.decode_points(delta_body), iterations))
+
+
+if __name__ == "__main__":
+    main()
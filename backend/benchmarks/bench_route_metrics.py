@@ -0,0 +1,56 @@
+"""Route metrics throughput at 10k-1M points per route, plus a batch refresh run.
+
+Run from backend/:  python -m benchmarks.bench_route_metrics
+"""
+import asyncio
+import time
+import numpy as np
+from geo.route_metrics import compute_route_metrics, parse_timestamps
+from ingest import point_codec
+from jobs.route_refresh import refresh_routes
+from supabase_handler.async_supabase_handler import async_supabase_handler
+from benchmarks.standins import postgrest_standin
+
+
+def synthetic_arrays(count: int, seed: int = 3):
+    rng = np.random.default_rng(seed)
+    lat = 47.37 + np.cumsum(rng.normal(0, 5e-5, count))
+    lng = 8.54 + np.cumsum(rng.normal(0, 5e-5, count))
+    timestamp_ms = 1_732_442_400_000 + np.arange(count, dtype=np.int64) * 2000
+    return lat, lng, timestamp_ms
+
+
+def bench_engine():
+    for count in (10_000, 100_000, 1_000_000):
+        lat, lng, timestamp_ms = synthetic_arrays(count)
+        iso = np.datetime_as_string(timestamp_ms.astype("datetime64[ms]"), unit="ms").tolist()
+        iso = [t + "+00:00" for t in iso]
+
+        start = time.perf_counter()
+        timestamps = parse_timestamps(iso)
+        parse_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        metrics = compute_route_metrics(lat, lng, timestamps)
+        compute_s = time.perf_counter() - start
+        print(f"{count:>9} points  parse {parse_s * 1000:8.1f}ms  metrics {compute_s * 1000:8.1f}ms "
+              f"({count / compute_s / 1e6:6.1f}M points/s)  {metrics['distanceKm']:.1f}km, {len(metrics['splitsS'])} splits")
+
+
+async def bench_batch_job(routes: int = 40, points_per_route: int = 5_000):
+    with postgrest_standin() as standin:
+        for route_id in range(1, routes + 1):
+            standin.seed("ROUTE", [{"id": route_id, "distanceKm": 1.0, "avgSpeedKmh": 1.0}])
+            standin.seed("POINTS", point_codec.to_rows(*synthetic_arrays(points_per_route, route_id), route_id))
+        handler = async_supabase_handler(url=standin.base_url, key="standin-key")
+        try:
+            report = await refresh_routes(handler, list(range(1, routes + 1)), concurrency=8, lods=False)
+        finally:
+            await handler.aclose()
+    print(f"batch job: {report['routes']} routes / {report['points']} points in {report['seconds']:.2f}s "
+          f"({report['points'] / report['seconds']:.0f} points/s end to end, failures: {len(report['failures'])})")
+
+
+if __name__ == "__main__":
+    bench_engine()
+    asyncio.run(bench_batch_job())
@@ -0,0 +1,50 @@
+"""Segment matching: spatial candidates vs comparing a route with every segment.
+
+Run from backend/:  python -m benchmarks.bench_segments
+"""
+import time
+from collections import defaultdict
+from benchmarks.synthetic import drive_points
+from geo.route_metrics import points_to_arrays
+from geo.segments import candidate_cells, match_route, segment_geometry
+
+DRIVES = 100
+SEGMENTS_PER_DRIVE = 20
+
+
+def main():
+    drives = [drive_points(seed, duration_s=1800) for seed in range(DRIVES)]
+    segments = []
+    for seed, points in enumerate(drives):
+        for k in range(SEGMENTS_PER_DRIVE):
+            start = 50 + k * 80
+            segment = segment_geometry(points[start:start + 120])
+            segment["id"] = len(segments) + 1
+            segments.append(segment)
+    by_cell = defaultdict(list)
+    for segment in segments:
+        by_cell[segment["start_cell"]].append(segment)
+    print(f"{len(segments)} segments, {DRIVES} routes of {len(drives[0])} points")
+
+    routes = [({"id": i, "user_reference": f"user-{i}"}, points) for i, points in enumerate(drives[:20])]
+
+    start = time.perf_counter()
+    brute = sum(len(match_route(route, points, segments)) for route, points in routes)
+    brute_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexed = 0
+    compared = 0
+    for route, points in routes:
+        lat, lng, _ = points_to_arrays(points)
+        candidates = [s for cell in candidate_cells(lat, lng) for s in by_cell.get(cell, ())]
+        compared += len(candidates)
+        indexed += len(match_route(route, points, candidates))
+    indexed_s = time.perf_counter() - start
+
+    print(f"  brute force    {brute_s / len(routes) * 1000:8.1f}ms/route  {len(segments):6d} comparisons  {brute} efforts")
+    print(f"  cell candidates{indexed_s / len(routes) * 1000:8.1f}ms/route  {compared // len(routes):6d} comparisons  {indexed} efforts")
+
+
+if __name__ == "__main__":
+    main()
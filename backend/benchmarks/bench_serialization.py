@@ -0,0 +1,76 @@
+"""Per-endpoint response cost: validated vs trusted rows, stdlib json vs orjson.
+
+Each endpoint is called through the real app (in-process, read cache warm,
+PostgREST stand-in without added latency), so the numbers are the request's
+own CPU time: auth, routing, validation and encoding. The three modes switch
+instrumentation.responses at run time:
+
+    validated+json    response_model / jsonable_encoder, stdlib encoder (the old path)
+    validated+orjson  response_model / jsonable_encoder, orjson
+    trusted+orjson    storage rows sent as they are, orjson
+
+Run from backend/:  python -m benchmarks.bench_serialization
+"""
+import argparse
+import os
+from benchmarks.common import make_signing_key, sign_token, timeit, print_row
+from benchmarks.standins import postgrest_standin
+from benchmarks.synthetic import activity_row, generate_drive
+from ingest import point_codec
+
+MODES = (("validated+json", False, "json"), ("validated+orjson", False, "orjson"), ("trusted+orjson", True, "orjson"))
+USER = "bench-user"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=5000, help="points in the benchmark route")
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    private_pem, public_jwk = make_signing_key("bench-serialization")
+    with postgrest_standin({"keys": [public_jwk]}) as standin:
+        os.environ["SUPABASE_URL"] = standin.base_url
+        os.environ["SUPABASE_KEY"] = "standin-key"
+        from fastapi.testclient import TestClient
+        from instrumentation import responses
+        import main as api
+
+        standin.seed("activities", [activity_row(i, USER) for i in range(500)])
+        headers = {"Authorization": "Bearer " + sign_token(private_pem, "bench-serialization", USER),
+                   "Accept-Encoding": "identity"}
+        with TestClient(api.app) as client:
+            route_id = client.post("/routes/", headers=headers, json={
+                "startedAt": "2025-11-24T10:00:00Z", "endedAt": "2025-11-24T11:00:00Z",
+                "distanceKm": 10.0, "avgSpeedKmh": 30.0,
+            }).json()["id"]
+            for i in range(api.MAX_PAGE_SIZE - 1):
+                client.post("/routes/", headers=headers, json={
+                    "startedAt": f"2025-10-{1 + i % 28:02d}T10:00:00Z", "endedAt": f"2025-10-{1 + i % 28:02d}T11:00:00Z",
+                    "distanceKm": 5.0 + i, "avgSpeedKmh": 25.0,
+                })
+            lat, lng, timestamp_ms = generate_drive(7, duration_s=args.points)
+            client.post(f"/points/batch/packed?route_id={route_id}", headers=headers,
+                        content=point_codec.encode_points(lat, lng, timestamp_ms))
+            point_ids = [p["id"] for p in client.get(f"/routes/{route_id}/points", headers=headers).json()["points"]]
+            bbox = f"{lng.min()},{lat.min()},{lng.max()},{lat.max()}"
+
+            endpoints = [
+                ("GET /activities/", f"/activities/?limit={api.MAX_PAGE_SIZE}"),
+                ("GET /routes/", f"/routes/?limit={api.MAX_PAGE_SIZE}"),
+                ("GET /points/?bbox", f"/points/?bbox={bbox}&limit={api.MAX_BBOX_POINTS}"),
+                ("GET /points/?ids", "/points/?ids=" + ",".join(map(str, point_ids[:api.MAX_MULTI_GET_IDS]))),
+                ("GET /routes/{id}/points", f"/routes/{route_id}/points"),
+            ]
+            for name, url in endpoints:
+                body = client.get(url, headers=headers)
+                print(f"{name}  ({len(body.content)} bytes)")
+                for mode, trusted, encoder in MODES:
+                    responses.TRUST_STORAGE_ROWS = trusted
+                    responses.RESPONSE_JSON_ENCODER = encoder
+                    client.get(url, headers=headers)
+                    print_row(f"  {mode}", timeit(lambda: client.get(url, headers=headers), args.iterations))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""Level-of-detail build cost and per-level point counts for synthetic tracks.
+
+Run from backend/:  python -m benchmarks.bench_simplify
+"""
+import time
+import numpy as np
+from geo.route_lod import LOD_TOLERANCES_M
+from geo.simplify import simplify_levels
+
+
+def main():
+    rng = np.random.default_rng(11)
+    for count in (10_000, 100_000, 1_000_000):
+        lat = 47.37 + np.cumsum(rng.normal(0, 5e-5, count))
+        lng = 8.54 + np.cumsum(rng.normal(0, 5e-5, count))
+        start = time.perf_counter()
+        levels = simplify_levels(lat, lng, LOD_TOLERANCES_M)
+        elapsed = time.perf_counter() - start
+        counts = "  ".join(f"{tol:g}m: {len(idx)}" for tol, idx in levels.items())
+        print(f"{count:>9} points  build {elapsed * 1000:8.1f}ms  {counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Viewport queries through the cell index vs a bounding-box scan, on SQLite.
+
+Run from backend/:  python -m benchmarks.bench_spatial
+"""
+import asyncio
+import os
+import tempfile
+import time
+import numpy as np
+from benchmarks.synthetic import generate_drive, route_row
+from ingest import point_codec
+from storage.sqlite_backend import sqlite_backend
+
+ROUTES = 200
+DRIVE_SECONDS = 3600
+QUERIES = 200
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = sqlite_backend(os.path.join(tmp, "spatial.db"))
+        for seed in range(ROUTES):
+            lat, lng, timestamp_ms = generate_drive(seed, duration_s=DRIVE_SECONDS)
+            rows = point_codec.to_rows(lat, lng, timestamp_ms, None)
+            route = await backend.create_route(route_row(seed, rows))
+            await backend.create_points_batch([dict(r, route_id=route["id"]) for r in rows])
+        total = ROUTES * DRIVE_SECONDS
+        print(f"{total} points in {ROUTES} routes")
+
+        rng = np.random.default_rng(0)
+        anchors = [generate_drive(int(s), duration_s=DRIVE_SECONDS) for s in rng.integers(0, ROUTES, 20)]
+        for half_deg in (0.001, 0.005, 0.02):
+            boxes = []
+            for i in range(QUERIES):
+                lat, lng, _ = anchors[i % len(anchors)]
+                j = int(rng.integers(0, len(lat)))
+                boxes.append((lat[j] - half_deg, lng[j] - half_deg, lat[j] + half_deg, lng[j] + half_deg))
+
+            start = time.perf_counter()
+            found = 0
+            for box in boxes:
+                found += len(await backend.get_points_in_bbox(*box, columns=["id"]))
+            indexed = (time.perf_counter() - start) / QUERIES
+
+            def scan(conn, box):
+                return conn.execute(
+                    'select id from "POINTS" not indexed where lat between ? and ? and lng between ? and ?',
+                    (box[0], box[2], box[1], box[3]),
+                ).fetchall()
+
+            start = time.perf_counter()
+            for box in boxes[:20]:
+                await backend._read(scan, box)
+            scanned = (time.perf_counter() - start) / 20
+            print(f"  box +-{half_deg:<6} avg {found / QUERIES:8.0f} points  cell index {indexed * 1000:7.2f}ms  "
+                  f"full scan {scanned * 1000:7.2f}ms  ({scanned / indexed:5.1f}x)")
+        await backend.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""The same workload on both storage backends, side by side.
+
+The Supabase backend talks to the local PostgREST stand-in (so it pays the
+HTTP hop and JSON encoding, with --upstream-latency added per call); the
+SQLite backend runs on a temporary WAL database. The read cache is disabled
+for both so every read reaches storage.
+
+Run from backend/:  python -m benchmarks.bench_storage_backends
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from benchmarks.standins import postgrest_standin
+from benchmarks.synthetic import activity_row, drive_points, route_row
+from supabase_handler.async_supabase_handler import async_supabase_handler
+from supabase_handler.read_cache import read_cache
+from storage.sqlite_backend import sqlite_backend
+
+ALLOWED = ["id", "route", "time", "distance", "date", "avgSpeed", "title", "user_reference"]
+
+
+async def timed(label, fn, count, concurrency, results):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            await fn(i)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    elapsed = time.perf_counter() - start
+    results[label] = (count, elapsed)
+
+
+async def workload(backend, args):
+    # Uncached reads: entries expire as soon as they are written
+    backend.cache = read_cache(ttl=0)
+    users = [f"user-{i}" for i in range(args.users)]
+    results = {}
+    route_ids = []
+
+    async def create_activity(i):
+        await backend.create_activity(activity_row(i, users[i % len(users)]), users[i % len(users)])
+
+    async def ingest(i):
+        points = drive_points(i, duration_s=args.drive_seconds)
+        route = await backend.create_route(route_row(i, points))
+        route_ids.append(route["id"])
+        for start in range(0, len(points), 500):
+            await backend.create_points_batch([dict(p, route_id=route["id"]) for p in points[start:start + 500]])
+
+    async def list_page(i):
+        await backend.list_user_activities(users[i % len(users)], 20, allowed_fields=ALLOWED)
+
+    async def get_activity(i):
+        await backend.get_activity_by_id(1 + i % (args.users * 10), users[i % len(users)])
+
+    async def route_points(i):
+        await backend.get_points_by_route(route_ids[i % len(route_ids)])
+
+    await timed("create activity", create_activity, args.users * 10, args.concurrency, results)
+    await timed("ingest route + points", ingest, args.routes, args.concurrency, results)
+    await timed("list activities page", list_page, args.requests, args.concurrency, results)
+    await timed("get activity by id", get_activity, args.requests, args.concurrency, results)
+    await timed("get points by route", route_points, args.requests // 10, args.concurrency, results)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare storage backends on one workload")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--routes", type=int, default=20)
+    parser.add_argument("--drive-seconds", type=float, default=1800.0)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--upstream-latency", type=float, default=0.002)
+    args = parser.parse_args()
+
+    with postgrest_standin(latency=args.upstream_latency) as standin:
+        async def run_supabase():
+            backend = async_supabase_handler(url=standin.base_url, key="standin-key")
+            try:
+                return await workload(backend, args)
+            finally:
+                await backend.aclose()
+        supabase_results = asyncio.run(run_supabase())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        async def run_sqlite():
+            backend = sqlite_backend(os.path.join(tmp, "bench.db"))
+            try:
+                return await workload(backend, args)
+            finally:
+                await backend.aclose()
+        sqlite_results = asyncio.run(run_sqlite())
+
+    print(f"concurrency {args.concurrency}, supabase upstream latency {args.upstream_latency * 1000:.0f}ms")
+    print(f"  {'operation':<24} {'ops':>6} {'supabase ops/s':>15} {'sqlite ops/s':>13} {'speedup':>8}")
+    for label, (count, supabase_s) in supabase_results.items():
+        _, sqlite_s = sqlite_results[label]
+        print(f"  {label:<24} {count:>6} {count / supabase_s:>15.0f} {count / sqlite_s:>13.0f} {supabase_s / sqlite_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Per-request JWT verification cost, before and after the token cache.
+
+Run from backend/:  python -m benchmarks.bench_verify_jwt
+"""
+from jose import jwt
+from benchmarks.common import make_signing_key, sign_token, bare_handler, timeit, print_row
+
+ITERATIONS = 2000
+
+
+def legacy_verify(jwks: dict, token: str) -> dict:
+    # The pre-cache path: parse header, scan the JWKS linearly, decode with a raw JWK dict
+    header = jwt.get_unverified_header(token)
+    kid = header.get("kid")
+    for key in jwks.get("keys", []):
+        if key.get("kid") == kid:
+            return jwt.decode(token, key, algorithms=[header.get("alg", "RS256")], options={"verify_aud": False})
+    raise Exception(f"Matching key not found in JWKS for kid: {kid}")
+
+
+def main():
+    # A realistic key set: the active key plus a few rotated-out ones
+    keys = [make_signing_key(f"kid-{i}") for i in range(4)]
+    private_pem, public_jwk = keys[-1]
+    jwks = {"keys": [k[1] for k in keys]}
+    token = sign_token(private_pem, public_jwk["kid"], "bench-user")
+
+    handler = bare_handler(jwks)
+
+    print_row("before: full decode", timeit(lambda: legacy_verify(jwks, token), ITERATIONS))
+
+    handler.token_cache.max_entries = 0
+    print_row("after: pre-built key, no cache", timeit(lambda: handler.verify_jwt(token), ITERATIONS))
+
+    handler.token_cache.max_entries = 4096
+    handler.verify_jwt(token)
+    print_row("after: cached token", timeit(lambda: handler.verify_jwt(token), ITERATIONS))
+
+
+if __name__ == "__main__":
+    main()
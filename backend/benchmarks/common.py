@@ -0,0 +1,62 @@
+import time
+import statistics
+from typing import Callable, Dict, Any, Tuple
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from jose import jwk, jwt
+
+
+def make_signing_key(kid: str = "bench-key") -> Tuple[str, Dict[str, Any]]:
+    """Generate an ES256 key pair, returning (private PEM, public JWK)."""
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+    public_jwk = jwk.construct(public_pem, "ES256").to_dict()
+    public_jwk["kid"] = kid
+    return private_pem, public_jwk
+
+
+def sign_token(private_pem: str, kid: str, sub: str, ttl: int = 3600) -> str:
+    now = int(time.time())
+    claims = {"sub": sub, "aud": "authenticated", "iat": now, "exp": now + ttl}
+    return jwt.encode(claims, private_pem, algorithm="ES256", headers={"kid": kid})
+
+
+def bare_handler(jwks: Dict[str, Any], jwks_url: str = "http://127.0.0.1:9/jwks.json"):
+    """A supabase_handler wired to an in-memory JWKS, without a Supabase client."""
+    from supabase_handler.supabase_handler import supabase_handler
+    from supabase_handler.jwt_cache import token_cache
+    from supabase_handler.jwks_manager import jwks_manager
+
+    handler = supabase_handler.__new__(supabase_handler)
+    handler.jwks_url = jwks_url
+    handler.token_cache = token_cache()
+    handler.jwks_manager = jwks_manager(jwks_url)
+    handler.jwks_manager.load(jwks)
+    return handler
+
+
+def timeit(fn: Callable[[], Any], iterations: int) -> Dict[str, float]:
+    """Run fn repeatedly and return per-call latency stats in microseconds."""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {
+        "mean_us": statistics.fmean(samples),
+        "p50_us": samples[len(samples) // 2],
+        "p99_us": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+    }
+
+
+def print_row(name: str, stats: Dict[str, float]):
+    print(f"{name:<32} mean {stats['mean_us']:>10.1f}us  p50 {stats['p50_us']:>10.1f}us  p99 {stats['p99_us']:>10.1f}us")
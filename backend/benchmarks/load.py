@@ -0,0 +1,145 @@
+"""Load-generation plumbing: the API under test, a latency recorder and reports."""
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+import httpx
+import numpy as np
+
+
+class latency_recorder:
+    """Collects per-endpoint request latencies and status codes."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def record(self, label: str, seconds: float, status_code: int):
+        self.samples.setdefault(label, []).append(seconds)
+        if status_code >= 400:
+            self.errors[label] = self.errors.get(label, 0) + 1
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        report = {}
+        for label, samples in sorted(self.samples.items()):
+            ms = np.asarray(samples) * 1000
+            p50, p95, p99 = np.percentile(ms, (50, 95, 99))
+            report[label] = {
+                "requests": len(samples),
+                "errors": self.errors.get(label, 0),
+                "throughput_rps": len(samples) / elapsed if elapsed > 0 else 0.0,
+                "mean_ms": float(ms.mean()),
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99),
+                "max_ms": float(ms.max()),
+            }
+        return report
+
+
+def print_report(title: str, report: Dict[str, Dict[str, float]]):
+    print(title)
+    print(f"  {'endpoint':<34} {'reqs':>6} {'err':>5} {'req/s':>8} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'maxms':>8}")
+    for label, row in report.items():
+        print(
+            f"  {label:<34} {row['requests']:>6} {row['errors']:>5} {row['throughput_rps']:>8.1f}"
+            f" {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['max_ms']:>8.1f}"
+        )
+
+
+def compare_reports(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.2) -> List[str]:
+    """Endpoints whose p95 grew by more than `tolerance` versus a saved run."""
+    regressions = []
+    for scenario, endpoints in current.items():
+        for label, row in endpoints.items():
+            before = baseline.get(scenario, {}).get(label)
+            if before and row["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+                regressions.append(
+                    f"{scenario} {label}: p95 {before['p95_ms']:.1f}ms -> {row['p95_ms']:.1f}ms"
+                )
+    return regressions
+
+
+class api_client:
+    """httpx client that records every call under an endpoint label."""
+
+    def __init__(self, base_url: str, recorder: latency_recorder, max_connections: int = 100):
+        self.recorder = recorder
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=60.0,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def request(self, label: str, method: str, url: str, token: Optional[str] = None, **kwargs) -> httpx.Response:
+        headers = kwargs.pop("headers", {})
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        start = time.perf_counter()
+        response = await self.client.request(method, url, headers=headers, **kwargs)
+        self.recorder.record(label, time.perf_counter() - start, response.status_code)
+        return response
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class api_server:
+    """Serves main.app with uvicorn on a background thread, pointed at `supabase_url`.
+
+    main.py builds its handlers at import time, so the environment has to be
+    set before the first import.
+    """
+
+    def __init__(self, supabase_url: str, port: int = 0):
+        import uvicorn
+
+        os.environ["SUPABASE_URL"] = supabase_url
+        os.environ.setdefault("SUPABASE_KEY", "standin-key")
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        import main
+
+        self.app = main.app
+        config = uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+        self.server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        sock = self.server.servers[0].sockets[0]
+        host, port = sock.getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self._thread.join()
+
+
+async def run_concurrently(jobs, concurrency: int):
+    """Await the coroutine factories in `jobs`, at most `concurrency` at a time."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(job):
+        async with semaphore:
+            return await job()
+
+    return await asyncio.gather(*(run(job) for job in jobs))
+
+
+def save_report(path: str, report: Dict[str, Any]):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
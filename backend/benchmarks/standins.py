@@ -0,0 +1,419 @@
+"""Local stand-ins for the Supabase services the backend talks to."""
+import json
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Callable, Dict, Any, List, Optional
+from urllib.parse import urlsplit, parse_qsl
+
+
+class _threaded_server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class _standin_server:
+    """Threaded HTTP server on 127.0.0.1 that dispatches to `handle(...)`."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def _dispatch(self):
+                standin.requests += 1
+                if standin.latency:
+                    time.sleep(standin.latency)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                parts = urlsplit(self.path)
+                status, payload, headers = standin.handle(
+                    self.command, parts.path, parse_qsl(parts.query), body, self.headers
+                )
+                data = json.dumps(payload).encode() if payload is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = do_DELETE = _dispatch
+
+            def log_message(self, *args):
+                pass
+
+        self.server = _threaded_server(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def handle(self, method, path, query, body, headers):
+        return 404, {"message": "not found"}, None
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class jwks_standin(_standin_server):
+    """Serves a JWKS document and counts how often it is fetched."""
+
+    def __init__(self, jwks: Dict[str, Any], max_age: int = 600, latency: float = 0.0):
+        super().__init__(latency)
+        self.jwks = jwks
+        self.max_age = max_age
+        self.url = f"{self.base_url}/auth/v1/.well-known/jwks.json"
+
+    def handle(self, method, path, query, body, headers):
+        return 200, self.jwks, {"Cache-Control": f"public, max-age={self.max_age}"}
+
+
+class postgrest_standin(jwks_standin):
+    """In-memory PostgREST tables plus the GoTrue/JWKS endpoints we use.
+
+    Supports `select`, eq/neq/lt/lte/gt/gte/in filters, `order`, `limit`
+    and `offset`, inserts (single or bulk, merge- and ignore-duplicates upserts),
+    PATCH and DELETE on /rest/v1/<table>, plus the /rest/v1/rpc/<function>
+    calls defined in migrations/, which covers the supabase handlers.
+
+    With a `token_signer(user_id) -> jwt`, signup and token grants return
+    access tokens the API will accept, so clients can authenticate
+    end to end. User ids are stable per email. `max_rows` caps every GET
+    and every set of rows an RPC returns, the way PostgREST's max-rows
+    setting does.
+    """
+
+    def __init__(
+        self,
+        jwks: Optional[Dict[str, Any]] = None,
+        latency: float = 0.0,
+        token_signer: Optional[Callable[[str], str]] = None,
+        max_rows: Optional[int] = None,
+    ):
+        super().__init__(jwks or {"keys": []}, latency=latency)
+        self.token_signer = token_signer
+        self.max_rows = max_rows
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self._next_id: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def seed(self, table: str, rows: List[Dict[str, Any]]):
+        with self._lock:
+            for row in rows:
+                self._insert(table, dict(row))
+
+    def _insert(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        if "id" not in row:
+            row["id"] = self._next_id.get(table, 1)
+        self._next_id[table] = max(self._next_id.get(table, 1), row["id"] + 1)
+        self.tables.setdefault(table, []).append(row)
+        return row
+
+    def _upsert(self, table: str, row: Dict[str, Any], keys: List[str]) -> Dict[str, Any]:
+        for existing in self.tables.setdefault(table, []):
+            if all(existing.get(k) == row.get(k) for k in keys):
+                existing.update(row)
+                return existing
+        return self._insert(table, row)
+
+    def _add_deltas(self, table, keys, deltas):
+        rows = self.tables.setdefault(table, [])
+        for delta in deltas:
+            key = tuple(delta[k] for k in keys)
+            row = next((r for r in rows if tuple(r.get(k) for k in keys) == key), None)
+            if row is None:
+                row = dict(zip(keys, key), distance=0, duration_s=0, activities=0)
+                rows.append(row)
+            for metric in ("distance", "duration_s", "activities"):
+                row[metric] += delta[metric]
+            if row["activities"] <= 0:
+                rows.remove(row)
+
+    # Same effect as the functions in migrations/. Those in _JSON_FUNCTIONS return
+    # one JSON value, which max-rows does not cut, rather than a set of rows
+    _JSON_FUNCTIONS = {"heatmap_tile_bins"}
+
+    def _rpc_apply_leaderboard_deltas(self, deltas):
+        self._add_deltas("GROUP_LEADERBOARD", ("group_id", "period", "period_start", "user_reference"), deltas)
+
+    def _rpc_apply_user_stats_deltas(self, deltas):
+        self._add_deltas("USER_STATS", ("user_reference", "period", "period_start"), deltas)
+
+    def _rpc_apply_heatmap_deltas(self, deltas):
+        rows = self.tables.setdefault("HEATMAP_CELL", [])
+        keys = ("user_reference", "zoom", "bin_x", "bin_y")
+        index = {tuple(r[k] for k in keys): r for r in rows}
+        for delta in deltas:
+            key = tuple(delta[k] for k in keys)
+            row = index.get(key)
+            if row is None:
+                row = index[key] = dict(zip(keys, key), count=0)
+                rows.append(row)
+            row["count"] += delta["count"]
+        self.tables["HEATMAP_CELL"] = [r for r in rows if r["count"] > 0]
+
+    def _rpc_delete_route_points(self, p_route_id, p_limit):
+        rows = self.tables.setdefault("POINTS", [])
+        doomed = {id(r) for r in [r for r in rows if r.get("route_id") == p_route_id][:p_limit]}
+        self.tables["POINTS"] = [r for r in rows if id(r) not in doomed]
+        return len(doomed)
+
+    def _rpc_append_live_points(self, p_route_id, p_seq, p_points):
+        route = next((r for r in self.tables.get("ROUTE", []) if r.get("id") == p_route_id), None)
+        if route is None or (route.get("live_seq") or 0) >= p_seq:
+            return 0
+        route["live_seq"] = p_seq
+        for point in p_points:
+            self._insert("POINTS", dict(point, route_id=p_route_id))
+        return len(p_points)
+
+    def _rpc_nearest_route_points(self, p_lo, p_hi, p_min_lat, p_max_lat, p_min_lng, p_max_lng,
+                                  p_lat, p_lng, p_kx2, p_max_d2, p_limit=None):
+        nearest = {}
+        for r in self.tables.get("POINTS", []):
+            if r.get("route_id") is None or r.get("cell") is None:
+                continue
+            if not any(lo <= r["cell"] < hi for lo, hi in zip(p_lo, p_hi)):
+                continue
+            if not (p_min_lat <= r["lat"] <= p_max_lat and p_min_lng <= r["lng"] <= p_max_lng):
+                continue
+            d2 = (r["lat"] - p_lat) ** 2 + p_kx2 * (r["lng"] - p_lng) ** 2
+            if d2 <= p_max_d2 and (r["route_id"] not in nearest or d2 < nearest[r["route_id"]][0]):
+                nearest[r["route_id"]] = (d2, r)
+        rows = sorted(nearest.values(), key=lambda n: n[0])[:p_limit]
+        return [{"route_id": r["route_id"], "lat": r["lat"], "lng": r["lng"]} for _, r in rows]
+
+    def _rpc_record_segment_efforts(self, p_efforts):
+        best = {}
+        for effort in p_efforts:
+            key = (effort["segment_id"], effort["user_reference"])
+            if key not in best or effort["elapsed_s"] < best[key]["elapsed_s"]:
+                best[key] = effort
+        rows = self.tables.setdefault("SEGMENT_EFFORT", [])
+        kept = []
+        for key, effort in best.items():
+            row = next((r for r in rows if (r["segment_id"], r["user_reference"]) == key), None)
+            if row is None:
+                row = dict(effort)
+                rows.append(row)
+            elif effort["elapsed_s"] < row["elapsed_s"]:
+                row.update(effort)
+            else:
+                continue
+            kept.append(dict(row))
+        return kept
+
+    def _rpc_create_group(self, p_name, p_user_reference):
+        now = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime())
+        group = self._insert("GROUPS", {"name": p_name, "created_by": p_user_reference, "created_at": now})
+        self._insert("GROUP_MEMBER", {"group_id": group["id"], "user_reference": p_user_reference, "joined_at": now})
+        return [dict(group)]
+
+    def _rpc_update_activity(self, p_id, p_user_reference, p_changes):
+        for row in self.tables.get("activities", []):
+            if row.get("id") == p_id and row.get("user_reference") == p_user_reference:
+                before = dict(row)
+                row.update(p_changes)
+                return [{"before": before, "after": dict(row)}]
+        return []
+
+    def _rpc_heatmap_tile_bins(self, p_users, p_zoom, p_min_x, p_max_x, p_min_y, p_max_y):
+        bins = {}
+        for r in self.tables.get("HEATMAP_CELL", []):
+            if (r["user_reference"] in p_users and r["zoom"] == p_zoom
+                    and p_min_x <= r["bin_x"] <= p_max_x and p_min_y <= r["bin_y"] <= p_max_y):
+                key = (r["bin_x"], r["bin_y"])
+                bins[key] = bins.get(key, 0) + r["count"]
+        return [{"bin_x": x, "bin_y": y, "count": n} for (x, y), n in bins.items()]
+
+    def _rpc_route_user_ids(self):
+        users = sorted({r["user_reference"] for r in self.tables.get("ROUTE", []) if r.get("user_reference")})
+        return [{"user_reference": u} for u in users]
+
+    def _rpc_activity_user_ids(self):
+        users = sorted({r["user_reference"] for r in self.tables.get("activities", [])})
+        return [{"user_reference": u} for u in users]
+
+    _OPERATORS = {
+        "eq": lambda a, b: a == b,
+        "neq": lambda a, b: a != b,
+        "lt": lambda a, b: a < b,
+        "lte": lambda a, b: a <= b,
+        "gt": lambda a, b: a > b,
+        "gte": lambda a, b: a >= b,
+    }
+    _RESERVED = {"select", "order", "limit", "offset", "on_conflict", "columns", "or", "and"}
+
+    @staticmethod
+    def _coerce(value: str, like):
+        # Query operands arrive as text; compare them as the column's type
+        try:
+            if isinstance(like, bool):
+                return value == "true"
+            if isinstance(like, int):
+                return float(value) if "." in value else int(value)
+            if isinstance(like, float):
+                return float(value)
+        except ValueError:
+            pass
+        return value
+
+    @staticmethod
+    def _split_top_level(text):
+        # Split "a,and(b,c),d" on commas outside parentheses and quotes
+        parts, depth, quoted, current = [], 0, False, ""
+        i = 0
+        while i < len(text):
+            ch = text[i]
+            if quoted and ch == "\\":
+                current += text[i:i + 2]
+                i += 2
+                continue
+            if ch == '"':
+                quoted = not quoted
+            elif not quoted and ch == "(":
+                depth += 1
+            elif not quoted and ch == ")":
+                depth -= 1
+            elif not quoted and depth == 0 and ch == ",":
+                parts.append(current)
+                current = ""
+                i += 1
+                continue
+            current += ch
+            i += 1
+        if current:
+            parts.append(current)
+        return parts
+
+    def _parse_condition(self, text):
+        for logic in ("and", "or"):
+            if text.startswith(logic + "("):
+                inner = [self._parse_condition(t) for t in self._split_top_level(text[len(logic) + 1:-1])]
+                return (logic, inner)
+        col, op, operand = text.split(".", 2)
+        if len(operand) >= 2 and operand[0] == operand[-1] == '"':
+            operand = operand[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+        return (col, op, operand)
+
+    def _filters(self, query):
+        filters = []
+        for col, value in query:
+            if col in ("or", "and"):
+                filters.append(self._parse_condition(f"{col}{value}"))
+                continue
+            if col in self._RESERVED or "." not in value:
+                continue
+            op, _, operand = value.partition(".")
+            if op == "in":
+                filters.append((col, "in", [v.strip('"') for v in operand.strip("()").split(",")]))
+            elif op in self._OPERATORS:
+                filters.append((col, op, operand))
+        return filters
+
+    def _matches(self, row, filters):
+        for condition in filters:
+            if condition[0] in ("and", "or") and isinstance(condition[1], list):
+                results = (self._matches(row, [c]) for c in condition[1])
+                if not (all(results) if condition[0] == "and" else any(results)):
+                    return False
+                continue
+            col, op, operand = condition
+            value = row.get(col)
+            if value is None:
+                return False
+            if op == "in":
+                if str(value) not in operand:
+                    return False
+            else:
+                operand = self._coerce(operand, value)
+                if type(operand) is str and type(value) is not str:
+                    value = str(value)
+                if not self._OPERATORS[op](value, operand):
+                    return False
+        return True
+
+    @staticmethod
+    def _shape(rows, query):
+        params = dict(query)
+        order = params.get("order")
+        for term in reversed(order.split(",") if order else []):
+            col, _, direction = term.partition(".")
+            rows.sort(key=lambda r: (r.get(col) is None, r.get(col)), reverse=direction.startswith("desc"))
+        offset = int(params.get("offset", 0))
+        limit = params.get("limit")
+        rows = rows[offset:offset + int(limit)] if limit is not None else rows[offset:]
+        select = params.get("select", "*")
+        if select != "*":
+            columns = select.split(",")
+            rows = [{c: r.get(c) for c in columns} for r in rows]
+        return rows
+
+    def handle(self, method, path, query, body, headers):
+        if path.endswith("/.well-known/jwks.json"):
+            return super().handle(method, path, query, body, headers)
+        if path.startswith("/auth/v1/"):
+            email = (body or {}).get("email")
+            user_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"standin:{email}")) if email else f"user-{int(time.time())}"
+            token = self.token_signer(user_id) if self.token_signer else "standin"
+            user = {"id": user_id, "email": email}
+            return 200, {"access_token": token, "token_type": "bearer", "expires_in": 3600, "user": user}, None
+        if not path.startswith("/rest/v1/"):
+            return 404, {"message": "not found"}, None
+
+        table = path[len("/rest/v1/"):]
+        if table.startswith("rpc/"):
+            name = table[len("rpc/"):]
+            handler = getattr(self, f"_rpc_{name}", None)
+            if handler is None or method != "POST":
+                return 404, {"message": "function not found"}, None
+            with self._lock:
+                result = handler(**(body or {}))
+            if isinstance(result, list) and query:
+                # PostgREST filters, orders and limits the rows of table functions too
+                filters = self._filters(query)
+                result = self._shape([r for r in result if self._matches(r, filters)], query)
+            if isinstance(result, list) and self.max_rows is not None and name not in self._JSON_FUNCTIONS:
+                result = result[:self.max_rows]
+            return (204 if result is None else 200), result, None
+        filters = self._filters(query)
+        with self._lock:
+            rows = self.tables.setdefault(table, [])
+            if method == "GET":
+                found = self._shape([dict(r) for r in rows if self._matches(r, filters)], query)
+                # Like PostgREST's max-rows: silently cut off, no error
+                return 200, found[:self.max_rows] if self.max_rows is not None else found, None
+            if method == "POST":
+                items = body if isinstance(body, list) else [body]
+                conflict = dict(query).get("on_conflict")
+                prefer = headers.get("Prefer") or ""
+                if conflict and "resolution=merge-duplicates" in prefer:
+                    return 201, [dict(self._upsert(table, dict(item), conflict.split(","))) for item in items], None
+                if conflict and "resolution=ignore-duplicates" in prefer:
+                    keys = conflict.split(",")
+                    fresh = [
+                        item for item in items
+                        if not any(all(r.get(k) == item.get(k) for k in keys) for r in rows)
+                    ]
+                    return 201, [dict(self._insert(table, dict(item))) for item in fresh], None
+                return 201, [dict(self._insert(table, dict(item))) for item in items], None
+            if method == "PATCH":
+                matched = [r for r in rows if self._matches(r, filters)]
+                for r in matched:
+                    r.update(body or {})
+                return 200, [dict(r) for r in matched], None
+            if method == "DELETE":
+                matched = [r for r in rows if self._matches(r, filters)]
+                self.tables[table] = [r for r in rows if not self._matches(r, filters)]
+                return 200, matched, None
+        return 405, {"message": "method not allowed"}, None
@@ -0,0 +1,89 @@
+"""Synthetic GPS drives and users for load generation.
+
+Drives follow a smoothly wandering heading with speed that accelerates,
+cruises and occasionally stops, sampled at a fixed rate with GPS noise, so
+simplification, metrics and codecs see realistic data rather than lines.
+"""
+import math
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from geo.simplify import EARTH_RADIUS_M
+
+# Cities to start drives around (lat, lng)
+ORIGINS = ((52.5200, 13.4050), (48.8566, 2.3522), (40.7128, -74.0060), (35.6762, 139.6503), (-33.8688, 151.2093))
+
+
+def generate_drive(
+    seed: int,
+    duration_s: float = 1800.0,
+    hz: float = 1.0,
+    cruise_kmh: float = 50.0,
+    start: Optional[datetime] = None,
+    noise_m: float = 3.0,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(lat, lng, timestamp_ms) arrays for one drive."""
+    rng = np.random.default_rng(seed)
+    count = max(2, int(duration_s * hz))
+    dt = 1.0 / hz
+
+    # Target speed: cruise with slow variation, dropping to zero at random stops
+    target = cruise_kmh / 3.6 * (1 + 0.25 * np.sin(np.cumsum(rng.normal(0, 0.02, count))))
+    stops = rng.random(count) < dt / 300.0
+    for index in np.flatnonzero(stops):
+        target[index:index + int(rng.integers(10, 60) * hz)] = 0.0
+    # First-order lag so speed ramps instead of jumping
+    speed = np.empty(count)
+    speed[0] = 0.0
+    alpha = min(1.0, dt / 8.0)
+    for i in range(1, count):
+        speed[i] = speed[i - 1] + alpha * (target[i] - speed[i - 1])
+
+    heading = np.cumsum(rng.normal(0, 0.03, count)) + rng.uniform(0, 2 * math.pi)
+    step = speed * dt
+    origin_lat, origin_lng = ORIGINS[seed % len(ORIGINS)]
+    north = np.cumsum(step * np.cos(heading)) + rng.normal(0, noise_m, count)
+    east = np.cumsum(step * np.sin(heading)) + rng.normal(0, noise_m, count)
+    lat = origin_lat + np.degrees(north / EARTH_RADIUS_M)
+    lng = origin_lng + np.degrees(east / (EARTH_RADIUS_M * math.cos(math.radians(origin_lat))))
+
+    start = start or datetime(2025, 11, 24, 8, 0, tzinfo=timezone.utc) + timedelta(hours=seed % 240)
+    start_ms = int(start.timestamp() * 1000)
+    timestamp_ms = start_ms + np.arange(count, dtype=np.int64) * int(dt * 1000)
+    return lat, lng, timestamp_ms
+
+
+def drive_points(seed: int, **kwargs) -> List[Dict[str, Any]]:
+    """A drive as PointCreate payloads."""
+    lat, lng, timestamp_ms = generate_drive(seed, **kwargs)
+    timestamps = np.datetime_as_string(timestamp_ms.astype("datetime64[ms]"), unit="ms", timezone="UTC")
+    return [{"lat": a, "lng": b, "timestamp": t} for a, b, t in zip(lat.tolist(), lng.tolist(), timestamps.tolist())]
+
+
+def route_row(seed: int, points: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """A RouteCreate payload spanning `points`."""
+    return {
+        "startedAt": points[0]["timestamp"],
+        "endedAt": points[-1]["timestamp"],
+        "distanceKm": round(5 + seed % 20 + random.random(), 2),
+        "avgSpeedKmh": round(30 + seed % 40 + random.random(), 2),
+    }
+
+
+def activity_row(seed: int, user_id: str) -> Dict[str, Any]:
+    day = datetime(2025, 1, 1) + timedelta(days=seed % 365)
+    return {
+        "route": f"Loop {seed % 17}",
+        "time": f"0{seed % 3}:{seed % 60:02d}:00",
+        "distance": 1000 + seed * 37 % 20000,
+        "date": day.date().isoformat(),
+        "avgSpeed": 1 + seed % 9,
+        "title": f"Drive {seed}",
+        "user_reference": user_id,
+    }
+
+
+def user_emails(count: int, prefix: str = "driver") -> Iterator[str]:
+    for i in range(count):
+        yield f"{prefix}{i}@bench.carva.test"
@@ -0,0 +1,131 @@
+"""Stream routes out as GPX or GeoJSON, one route or a zip of many.
+
+Points are read EXPORT_PAGE_POINTS at a time through keyset pages
+(list_route_points) and serialized as each page arrives, so the first bytes
+go out after one page and memory stays flat however long the route is.
+
+GeoJSON keeps per-point times in `properties.coordTimes`, the convention GPX
+converters use. The Feature is written geometry first and the times are
+spooled to a temporary file (on disk past EXPORT_SPOOL_BYTES) during the
+same pass, so both arrays come from one consistent read.
+
+Zips are written to a non-seekable sink: entries carry data descriptors
+instead of sizes up front, and each compressed chunk is handed on as soon
+as it is produced.
+"""
+import json
+import os
+import tempfile
+import zipfile
+from typing import Any, AsyncIterator, Dict, List, Optional
+from xml.sax.saxutils import escape, quoteattr
+
+EXPORT_PAGE_POINTS = int(os.getenv("EXPORT_PAGE_POINTS", "2000"))
+EXPORT_PAGE_ROUTES = 100
+EXPORT_SPOOL_BYTES = 1 << 20
+
+# format -> (media type, file extension)
+EXPORT_FORMATS = {
+    "gpx": ("application/gpx+xml", "gpx"),
+    "geojson": ("application/geo+json", "geojson"),
+}
+
+ROUTE_PROPERTIES = ("id", "startedAt", "endedAt", "distanceKm", "avgSpeedKmh", "durationS",
+                    "movingTimeS", "maxSpeedKmh", "avgMovingSpeedKmh")
+
+
+async def route_point_pages(handler, route_id: int, fields: Optional[List[str]] = None,
+                            page_size: int = EXPORT_PAGE_POINTS) -> AsyncIterator[List[Dict[str, Any]]]:
+    cursor = None
+    while True:
+        rows, cursor = await handler.list_route_points(route_id, page_size, cursor, fields)
+        if rows:
+            yield rows
+        if cursor is None:
+            return
+
+
+async def gpx_chunks(handler, route: Dict[str, Any]) -> AsyncIterator[str]:
+    name = escape(f"Route {route['id']}")
+    started = f"<metadata><time>{escape(str(route['startedAt']))}</time></metadata>" if route.get("startedAt") else ""
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<gpx version="1.1" creator="Carva" xmlns="http://www.topografix.com/GPX/1/1">\n'
+        f"{started}<trk><name>{name}</name><trkseg>\n"
+    )
+    async for rows in route_point_pages(handler, route["id"], ["lat", "lng", "timestamp"]):
+        yield "".join(
+            f'<trkpt lat={quoteattr(str(p["lat"]))} lon={quoteattr(str(p["lng"]))}>'
+            f'<time>{escape(str(p["timestamp"]))}</time></trkpt>\n'
+            for p in rows
+        )
+    yield "</trkseg></trk>\n</gpx>\n"
+
+
+async def geojson_chunks(handler, route: Dict[str, Any]) -> AsyncIterator[str]:
+    properties = {k: route.get(k) for k in ROUTE_PROPERTIES}
+    yield '{"type":"Feature","geometry":{"type":"LineString","coordinates":['
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES, mode="w+") as times:
+        separator = ""
+        async for rows in route_point_pages(handler, route["id"], ["lat", "lng", "timestamp"]):
+            yield separator + ",".join(f'[{p["lng"]},{p["lat"]}]' for p in rows)
+            times.write(separator + ",".join(json.dumps(p["timestamp"]) for p in rows))
+            separator = ","
+        yield ']},"properties":' + json.dumps(properties)[:-1] + ',"coordTimes":['
+        times.seek(0)
+        while True:
+            chunk = times.read(64 * 1024)
+            if not chunk:
+                break
+            yield chunk
+    yield "]}}\n"
+
+
+SERIALIZERS = {"gpx": gpx_chunks, "geojson": geojson_chunks}
+
+
+async def route_chunks(handler, route: Dict[str, Any], fmt: str) -> AsyncIterator[bytes]:
+    """One route as `fmt`, in encoded chunks."""
+    async for chunk in SERIALIZERS[fmt](handler, route):
+        yield chunk.encode()
+
+
+class _zip_sink:
+    # Write-only, no tell(): zipfile then streams with data descriptors
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+async def user_routes_zip(handler, user_id: str, fmt: str) -> AsyncIterator[bytes]:
+    """Every route `user_id` created, one `route-<id>.<ext>` entry each, as a zip stream."""
+    extension = EXPORT_FORMATS[fmt][1]
+    sink = _zip_sink()
+    archive = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED)
+    cursor = None
+    while True:
+        routes, cursor = await handler.list_user_routes(user_id, EXPORT_PAGE_ROUTES, cursor)
+        for route in routes:
+            with archive.open(f"route-{route['id']}.{extension}", "w") as entry:
+                async for chunk in route_chunks(handler, route, fmt):
+                    entry.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+        if cursor is None:
+            break
+    archive.close()
+    yield sink.drain()
@@ -0,0 +1,113 @@
+"""Per-zoom point density grids behind the heatmap tiles.
+
+Zoom z (0..HEATMAP_MAX_ZOOM) is a Web Mercator grid of 2^z * HEATMAP_TILE_BINS
+bins per axis, so map tile (z, x, y) covers bins [x*B, (x+1)*B) by
+[y*B, (y+1)*B) and one tile read is a range scan of at most B*B rows. Each
+user's point count per bin is kept in HEATMAP_CELL and added to as points
+are written (heatmap_deltas); a group heatmap sums its members' bins.
+
+Points are projected once, at the finest zoom; a coarser bin is the finer
+bin index shifted right, so every level comes out of the same arrays.
+"""
+import os
+import struct
+import zlib
+from typing import Any, Dict, Iterable, List, Set, Tuple
+import numpy as np
+
+HEATMAP_MAX_ZOOM = int(os.getenv("HEATMAP_MAX_ZOOM", "16"))
+HEATMAP_TILE_BINS = 64
+TILE_SIZE = 256
+# Points per bin drawn at full intensity at the finest zoom. Tracks are lines,
+# so a bin one zoom out collects about twice as many points.
+HEATMAP_SATURATION = float(os.getenv("HEATMAP_SATURATION", "20"))
+MAX_MERCATOR_LAT = 85.05112878
+
+# Intensity -> RGBA colour stops: clear, blue, cyan, yellow, red
+_STOPS = np.array([0.0, 0.25, 0.5, 0.75, 1.0])
+_COLOURS = np.array([
+    [0, 0, 255, 0],
+    [0, 0, 255, 160],
+    [0, 255, 255, 200],
+    [255, 255, 0, 230],
+    [255, 0, 0, 255],
+], dtype=np.float64)
+
+
+def mercator_bins(lat, lng) -> Tuple[np.ndarray, np.ndarray]:
+    """Bin indices (int64) of the points at HEATMAP_MAX_ZOOM."""
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT)
+    lng = np.asarray(lng, dtype=np.float64)
+    scale = float((1 << HEATMAP_MAX_ZOOM) * HEATMAP_TILE_BINS)
+    x = (lng + 180.0) / 360.0
+    phi = np.radians(lat)
+    y = (1.0 - np.log(np.tan(phi) + 1.0 / np.cos(phi)) / np.pi) / 2.0
+    top = scale - 1
+    return (np.clip(np.floor(x * scale), 0, top).astype(np.int64),
+            np.clip(np.floor(y * scale), 0, top).astype(np.int64))
+
+
+def heatmap_deltas(lat, lng, sign: int = 1) -> List[Dict[str, Any]]:
+    """HEATMAP_CELL count changes for adding (sign 1) or removing (-1) the points, every zoom."""
+    if not len(lat):
+        return []
+    bin_x, bin_y = mercator_bins(lat, lng)
+    deltas = []
+    for zoom in range(HEATMAP_MAX_ZOOM + 1):
+        shift = HEATMAP_MAX_ZOOM - zoom
+        keys, counts = np.unique(((bin_x >> shift) << 32) | (bin_y >> shift), return_counts=True)
+        deltas.extend(
+            {"zoom": zoom, "bin_x": k >> 32, "bin_y": k & 0xFFFFFFFF, "count": sign * c}
+            for k, c in zip(keys.tolist(), counts.tolist())
+        )
+    return deltas
+
+
+def affected_tiles(deltas: Iterable[Dict[str, Any]]) -> Set[Tuple[int, int, int]]:
+    """(z, x, y) of every tile the deltas change."""
+    return {(d["zoom"], d["bin_x"] // HEATMAP_TILE_BINS, d["bin_y"] // HEATMAP_TILE_BINS) for d in deltas}
+
+
+def tile_bin_range(z: int, x: int, y: int) -> Tuple[int, int, int, int]:
+    """Inclusive (min_x, max_x, min_y, max_y) bin bounds of a tile."""
+    return (x * HEATMAP_TILE_BINS, (x + 1) * HEATMAP_TILE_BINS - 1,
+            y * HEATMAP_TILE_BINS, (y + 1) * HEATMAP_TILE_BINS - 1)
+
+
+def tile_grid(rows: List[Dict[str, Any]], x: int, y: int) -> np.ndarray:
+    """B x B counts (row = y) from HEATMAP_CELL rows, summing rows of several users."""
+    grid = np.zeros((HEATMAP_TILE_BINS, HEATMAP_TILE_BINS), dtype=np.float64)
+    if rows:
+        cols = np.fromiter((r["bin_x"] for r in rows), dtype=np.int64, count=len(rows)) - x * HEATMAP_TILE_BINS
+        lines = np.fromiter((r["bin_y"] for r in rows), dtype=np.int64, count=len(rows)) - y * HEATMAP_TILE_BINS
+        counts = np.fromiter((r["count"] for r in rows), dtype=np.float64, count=len(rows))
+        np.add.at(grid, (lines, cols), counts)
+    return grid
+
+
+def grid_cells(grid: np.ndarray) -> List[List[int]]:
+    """Non-empty bins as [column, row, count], for the vector form of a tile."""
+    lines, cols = np.nonzero(grid)
+    return [[c, r, int(n)] for r, c, n in zip(lines.tolist(), cols.tolist(), grid[lines, cols].tolist())]
+
+
+def _png(rgba: np.ndarray) -> bytes:
+    height, width, _ = rgba.shape
+    raw = np.concatenate((np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, -1)), axis=1).tobytes()
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b"")
+
+
+def render_png(grid: np.ndarray, z: int) -> bytes:
+    """A TILE_SIZE square RGBA PNG of the counts, on a log scale that is the same for every tile of a zoom."""
+    saturation = HEATMAP_SATURATION * 2.0 ** (HEATMAP_MAX_ZOOM - z)
+    intensity = np.clip(np.log1p(grid) / np.log1p(saturation), 0.0, 1.0)
+    rgba = np.stack([np.interp(intensity, _STOPS, _COLOURS[:, i]) for i in range(4)], axis=-1)
+    rgba[grid == 0] = 0
+    scale = TILE_SIZE // HEATMAP_TILE_BINS
+    rgba = np.repeat(np.repeat(rgba.round().astype(np.uint8), scale, axis=0), scale, axis=1)
+    return _png(rgba)
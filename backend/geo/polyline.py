@@ -0,0 +1,72 @@
+"""Compact encodings of a route's points for GET /routes/{route_id}/points.
+
+`polyline` is Google's encoded polyline: coordinates scaled by 10^precision
+and rounded, each one stored as the difference to the previous point,
+zig-zag folded and written five bits per character. `columnar` returns the
+fields as parallel arrays, so every key is written once instead of once per
+point. Both keep the points' order.
+
+The encoder works on whole arrays: the deltas, the five-bit groups and
+their continuation bits are computed with numpy and only the final bytes
+are decoded to a string.
+"""
+from typing import Any, Dict, List
+import numpy as np
+
+POINT_FORMATS = ("points", "polyline", "columnar")
+DEFAULT_PRECISION = 5
+MAX_PRECISION = 7
+COLUMNS = ("id", "lat", "lng", "timestamp")
+
+# A zig-zagged delta of up to 2 * 360 * 10^7 fits in 7 groups of 5 bits
+_GROUPS = 7
+_SHIFTS = np.arange(_GROUPS, dtype=np.int64) * 5
+
+
+def encode_polyline(lat, lng, precision: int = DEFAULT_PRECISION) -> str:
+    """Encoded polyline of the coordinates, at 10^-precision degrees."""
+    if not len(lat):
+        return ""
+    scale = 10.0 ** precision
+    coords = np.empty((len(lat), 2), dtype=np.int64)
+    coords[:, 0] = np.round(np.asarray(lat, dtype=np.float64) * scale)
+    coords[:, 1] = np.round(np.asarray(lng, dtype=np.float64) * scale)
+    deltas = np.diff(coords, axis=0, prepend=0).ravel()
+    values = (deltas << 1) ^ (deltas >> 63)
+    groups = (values[:, None] >> _SHIFTS) & 0x1F
+    # Groups past the highest non-zero one are not written; every value writes at least one
+    used = np.maximum(_GROUPS - np.argmax(groups[:, ::-1] != 0, axis=1), 1)
+    used[values == 0] = 1
+    keep = np.arange(_GROUPS) < used[:, None]
+    groups[np.arange(_GROUPS) < (used - 1)[:, None]] |= 0x20
+    return (groups[keep] + 63).astype(np.uint8).tobytes().decode("ascii")
+
+
+def decode_polyline(encoded: str, precision: int = DEFAULT_PRECISION) -> List[List[float]]:
+    """[lat, lng] pairs of an encoded polyline; the inverse of encode_polyline."""
+    values = []
+    value = shift = 0
+    for char in encoded.encode("ascii"):
+        group = char - 63
+        value |= (group & 0x1F) << shift
+        shift += 5
+        if not group & 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    coords = np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0) / 10.0 ** precision
+    return coords.tolist()
+
+
+def format_points(points: List[Dict[str, Any]], fmt: str, precision: int = DEFAULT_PRECISION) -> Dict[str, Any]:
+    """Response body for points ordered by timestamp: {"points": [...]} or one of the compact forms."""
+    if fmt == "polyline":
+        lat = np.fromiter((p["lat"] for p in points), dtype=np.float64, count=len(points))
+        lng = np.fromiter((p["lng"] for p in points), dtype=np.float64, count=len(points))
+        return {
+            "polyline": encode_polyline(lat, lng, precision),
+            "precision": precision,
+            "timestamps": [p.get("timestamp") for p in points],
+        }
+    if fmt == "columnar":
+        return {"count": len(points), **{column: [p.get(column) for p in points] for column in COLUMNS}}
+    return {"points": points}
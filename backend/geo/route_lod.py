@@ -0,0 +1,51 @@
+"""Precomputed levels of detail (LODs) for route polylines.
+
+Every route stores one ROUTE_LOD row per tolerance in LOD_TOLERANCES_M,
+holding the subset of its points Douglas-Peucker keeps at that tolerance.
+Reads pick the coarsest level that is still within the requested tolerance.
+"""
+import math
+from typing import List, Dict, Any, Optional
+import numpy as np
+from .simplify import simplify_levels
+
+LOD_TOLERANCES_M = (2.0, 8.0, 32.0, 128.0)
+
+# Web-mercator metres per pixel at zoom 0 on the equator for 256px tiles
+_METRES_PER_PIXEL_Z0 = 156543.03392
+
+
+def build_route_lods(route_id: int, points: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """ROUTE_LOD rows for a route; `points` must be ordered by timestamp."""
+    if len(points) < 3:
+        return []
+    lat = np.fromiter((p["lat"] for p in points), dtype=np.float64, count=len(points))
+    lng = np.fromiter((p["lng"] for p in points), dtype=np.float64, count=len(points))
+    levels = simplify_levels(lat, lng, LOD_TOLERANCES_M)
+    return [
+        {
+            "route_id": route_id,
+            "level": level,
+            "tolerance_m": tolerance,
+            "point_count": int(indices.size),
+            "points": [points[i] for i in indices.tolist()],
+        }
+        for level, (tolerance, indices) in enumerate(levels.items())
+    ]
+
+
+def tolerance_for_zoom(zoom: float, pixels: float = 1.0) -> float:
+    """Tolerance in metres that keeps the simplified line within `pixels` at a map zoom.
+
+    Uses equator scale, so at higher latitudes the result is slightly coarser
+    (under 2 px below 60 degrees).
+    """
+    return pixels * _METRES_PER_PIXEL_Z0 / math.pow(2.0, zoom)
+
+
+def requested_tolerance(tolerance_m: Optional[float], zoom: Optional[float]) -> Optional[float]:
+    if tolerance_m is not None:
+        return tolerance_m
+    if zoom is not None:
+        return tolerance_for_zoom(zoom)
+    return None
@@ -0,0 +1,173 @@
+"""Vectorized route metrics computed from a route's POINTS.
+
+All metrics come out of one pass over the point arrays: segment lengths
+(haversine), segment durations, and the cumulative distance used for splits.
+"""
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from .simplify import EARTH_RADIUS_M
+
+# Segments slower than this count as stopped for moving time
+MOVING_SPEED_KMH = 3.0
+# Segments shorter than this (in seconds) are too noisy for max speed
+MIN_SPEED_SEGMENT_S = 1.0
+SPLIT_DISTANCE_M = 1000.0
+
+
+def parse_timestamps(values: List[str]) -> np.ndarray:
+    """ISO-8601 timestamps to epoch seconds (float64).
+
+    UTC strings (the PostgREST default) are parsed by NumPy in one call;
+    anything else falls back to datetime.fromisoformat, naive values as UTC.
+    """
+    if not values:
+        return np.empty(0, dtype=np.float64)
+    try:
+        naive = [v[:-6] if v.endswith("+00:00") else v[:-1] if v.endswith("Z") else None for v in values]
+        if None not in naive:
+            return np.array(naive, dtype="datetime64[us]").astype(np.int64) / 1e6
+    except ValueError:
+        pass
+    # Naive values are UTC, as the refresh bookkeeping takes them, not the host's local time
+    parsed = (datetime.fromisoformat(v) for v in values)
+    return np.array([(d if d.tzinfo else d.replace(tzinfo=timezone.utc)).timestamp() for d in parsed], dtype=np.float64)
+
+
+def points_to_arrays(points: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(lat, lng, epoch seconds) arrays from POINTS rows ordered by timestamp."""
+    count = len(points)
+    lat = np.fromiter((p["lat"] for p in points), dtype=np.float64, count=count)
+    lng = np.fromiter((p["lng"] for p in points), dtype=np.float64, count=count)
+    return lat, lng, parse_timestamps([p["timestamp"] for p in points])
+
+
+def haversine_segments(lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+    """Great-circle length in metres of each of the n - 1 segments."""
+    phi = np.radians(lat)
+    dphi = np.diff(phi)
+    dlmb = np.radians(np.diff(lng))
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi[:-1]) * np.cos(phi[1:]) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def compute_route_metrics(
+    lat: np.ndarray,
+    lng: np.ndarray,
+    timestamps: np.ndarray,
+    moving_speed_kmh: float = MOVING_SPEED_KMH,
+    split_distance_m: float = SPLIT_DISTANCE_M,
+) -> Dict[str, Any]:
+    """Distance, durations, speeds and split times for one route.
+
+    Returns ROUTE column names so the result can be written back directly.
+    """
+    if len(lat) < 2:
+        return {
+            "distanceKm": 0.0, "avgSpeedKmh": 0.0, "durationS": 0.0, "movingTimeS": 0.0,
+            "maxSpeedKmh": 0.0, "avgMovingSpeedKmh": 0.0, "splitsS": [],
+        }
+
+    seg_m = haversine_segments(lat, lng)
+    seg_s = np.diff(timestamps)
+    valid = seg_s > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        seg_kmh = np.where(valid, seg_m / seg_s * 3.6, 0.0)
+
+    distance_m = float(seg_m.sum())
+    duration_s = float(timestamps[-1] - timestamps[0])
+    moving = valid & (seg_kmh >= moving_speed_kmh)
+    moving_s = float(seg_s[moving].sum())
+    moving_m = float(seg_m[moving].sum())
+    steady = valid & (seg_s >= MIN_SPEED_SEGMENT_S)
+    max_kmh = float(seg_kmh[steady].max()) if steady.any() else 0.0
+
+    # Time at which the cumulative distance crosses every full split
+    cumulative_m = np.concatenate(([0.0], np.cumsum(seg_m)))
+    marks = np.arange(1, int(distance_m // split_distance_m) + 1) * split_distance_m
+    crossings = np.interp(marks, cumulative_m, timestamps)
+    splits = np.diff(np.concatenate(([timestamps[0]], crossings)))
+
+    return {
+        "distanceKm": distance_m / 1000.0,
+        "avgSpeedKmh": distance_m / duration_s * 3.6 if duration_s > 0 else 0.0,
+        "durationS": duration_s,
+        "movingTimeS": moving_s,
+        "maxSpeedKmh": max_kmh,
+        "avgMovingSpeedKmh": moving_m / moving_s * 3.6 if moving_s > 0 else 0.0,
+        "splitsS": np.round(splits, 1).tolist(),
+    }
+
+
+class route_metrics_accumulator:
+    """compute_route_metrics over points that arrive in chunks, without keeping them.
+
+    Each chunk is joined to the last point of the previous one, so the
+    result matches one compute_route_metrics call over all the points.
+    """
+
+    def __init__(self, moving_speed_kmh: float = MOVING_SPEED_KMH, split_distance_m: float = SPLIT_DISTANCE_M):
+        self.moving_speed_kmh = moving_speed_kmh
+        self.split_distance_m = split_distance_m
+        self.count = 0
+        self.first_ts = 0.0
+        self.last: Optional[Tuple[float, float, float]] = None
+        self.distance_m = 0.0
+        self.moving_s = 0.0
+        self.moving_m = 0.0
+        self.max_kmh = 0.0
+        self.splits: List[float] = []
+        self.split_start_ts = 0.0
+
+    def add(self, lat: np.ndarray, lng: np.ndarray, timestamps: np.ndarray):
+        if not len(lat):
+            return
+        if self.last is None:
+            self.first_ts = self.split_start_ts = float(timestamps[0])
+        else:
+            lat = np.concatenate(([self.last[0]], lat))
+            lng = np.concatenate(([self.last[1]], lng))
+            timestamps = np.concatenate(([self.last[2]], timestamps))
+        self.count += len(lat) - (self.last is not None)
+        self.last = (float(lat[-1]), float(lng[-1]), float(timestamps[-1]))
+        if len(lat) < 2:
+            return
+
+        seg_m = haversine_segments(lat, lng)
+        seg_s = np.diff(timestamps)
+        valid = seg_s > 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            seg_kmh = np.where(valid, seg_m / seg_s * 3.6, 0.0)
+        moving = valid & (seg_kmh >= self.moving_speed_kmh)
+        self.moving_s += float(seg_s[moving].sum())
+        self.moving_m += float(seg_m[moving].sum())
+        steady = valid & (seg_s >= MIN_SPEED_SEGMENT_S)
+        if steady.any():
+            self.max_kmh = max(self.max_kmh, float(seg_kmh[steady].max()))
+
+        cumulative_m = self.distance_m + np.concatenate(([0.0], np.cumsum(seg_m)))
+        self.distance_m = float(cumulative_m[-1])
+        done = len(self.splits)
+        marks = np.arange(done + 1, int(self.distance_m // self.split_distance_m) + 1) * self.split_distance_m
+        if len(marks):
+            crossings = np.interp(marks, cumulative_m, timestamps)
+            self.splits.extend(np.diff(np.concatenate(([self.split_start_ts], crossings))).tolist())
+            self.split_start_ts = float(crossings[-1])
+
+    def result(self) -> Dict[str, Any]:
+        """The same ROUTE columns as compute_route_metrics."""
+        if self.count < 2:
+            return {
+                "distanceKm": 0.0, "avgSpeedKmh": 0.0, "durationS": 0.0, "movingTimeS": 0.0,
+                "maxSpeedKmh": 0.0, "avgMovingSpeedKmh": 0.0, "splitsS": [],
+            }
+        duration_s = self.last[2] - self.first_ts
+        return {
+            "distanceKm": self.distance_m / 1000.0,
+            "avgSpeedKmh": self.distance_m / duration_s * 3.6 if duration_s > 0 else 0.0,
+            "durationS": duration_s,
+            "movingTimeS": self.moving_s,
+            "maxSpeedKmh": self.max_kmh,
+            "avgMovingSpeedKmh": self.moving_m / self.moving_s * 3.6 if self.moving_s > 0 else 0.0,
+            "splitsS": np.round(self.splits, 1).tolist(),
+        }
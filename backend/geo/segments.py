@@ -0,0 +1,115 @@
+"""Segment geometry and matching routes against segments.
+
+A segment is a simplified polyline indexed by the coarse cell of its start
+point (SEGMENT_CELL_LEVEL, roughly 75m x 150m at the equator). A route is
+only compared with segments whose start cell is in or next to a cell the
+route passes through, so matching cost depends on the segments nearby rather
+than on how many segments exist.
+
+A route matches when it passes the segment start and later the segment end
+within MATCH_TOLERANCE_M, stays close to the segment in between, and comes
+close to every segment vertex (so shortcuts do not count). The effort is
+the elapsed time between the two passes; the fastest pass wins.
+"""
+from typing import Any, Dict, List, Optional
+import numpy as np
+from .route_metrics import haversine_segments, points_to_arrays
+from .simplify import project, simplify, _segment_distance
+from .spatial import coarse_cells
+
+SEGMENT_CELL_LEVEL = 18
+SEGMENT_SIMPLIFY_M = 5.0
+MATCH_TOLERANCE_M = 25.0
+# Share of route points between start and end that must lie within tolerance
+MIN_ON_SEGMENT = 0.9
+
+
+def segment_geometry(points: List[Dict[str, float]]) -> Dict[str, Any]:
+    """SEGMENT columns for a polyline of {"lat", "lng"} points."""
+    lat = np.fromiter((p["lat"] for p in points), dtype=np.float64, count=len(points))
+    lng = np.fromiter((p["lng"] for p in points), dtype=np.float64, count=len(points))
+    keep = simplify(lat, lng, SEGMENT_SIMPLIFY_M)
+    lat, lng = lat[keep], lng[keep]
+    return {
+        "points": [{"lat": a, "lng": b} for a, b in zip(lat.tolist(), lng.tolist())],
+        "distance_m": float(haversine_segments(lat, lng).sum()),
+        "start_cell": int(coarse_cells(lat[:1], lng[:1], SEGMENT_CELL_LEVEL)[0]),
+        "start_lat": float(lat[0]),
+        "start_lng": float(lng[0]),
+        "end_lat": float(lat[-1]),
+        "end_lng": float(lng[-1]),
+    }
+
+
+def candidate_cells(lat: np.ndarray, lng: np.ndarray) -> List[int]:
+    """Start cells of segments a route could match."""
+    return coarse_cells(lat, lng, SEGMENT_CELL_LEVEL, neighbours=True).tolist()
+
+
+def _closest_in_runs(mask: np.ndarray, distance: np.ndarray) -> np.ndarray:
+    # One index per contiguous run of `mask`: the point of closest approach
+    idx = np.flatnonzero(mask)
+    if idx.size == 0:
+        return idx
+    breaks = np.flatnonzero(np.diff(idx) > 1) + 1
+    return np.array([run[np.argmin(distance[run])] for run in np.split(idx, breaks)], dtype=np.int64)
+
+
+def _polyline_distance(px, py, lx, ly) -> np.ndarray:
+    """Distance from every point to the polyline (lx, ly)."""
+    if len(lx) == 1:
+        return np.hypot(px - lx[0], py - ly[0])
+    d = _segment_distance(px[:, None], py[:, None], lx[None, :-1], ly[None, :-1], lx[None, 1:], ly[None, 1:])
+    return d.min(axis=1)
+
+
+def match_segment(lat: np.ndarray, lng: np.ndarray, timestamps: np.ndarray, segment: Dict[str, Any],
+                  tolerance_m: float = MATCH_TOLERANCE_M) -> Optional[Dict[str, Any]]:
+    """Fastest pass of the route over the segment: {"elapsed_s", "start_index", "end_index"} or None."""
+    seg_lat = np.array([p["lat"] for p in segment["points"]], dtype=np.float64)
+    seg_lng = np.array([p["lng"] for p in segment["points"]], dtype=np.float64)
+    ref = float(seg_lat[0])
+    x, y = project(lat, lng, ref)
+    sx, sy = project(seg_lat, seg_lng, ref)
+
+    d_start = np.hypot(x - sx[0], y - sy[0])
+    d_end = np.hypot(x - sx[-1], y - sy[-1])
+    starts = _closest_in_runs(d_start <= tolerance_m, d_start)
+    ends = _closest_in_runs(d_end <= tolerance_m, d_end)
+    if starts.size == 0 or ends.size == 0:
+        return None
+
+    best = None
+    for s in starts.tolist():
+        k = np.searchsorted(ends, s, side="right")
+        if k == ends.size:
+            break
+        e = int(ends[k])
+        px, py = x[s:e + 1], y[s:e + 1]
+        if np.mean(_polyline_distance(px, py, sx, sy) <= tolerance_m) < MIN_ON_SEGMENT:
+            continue
+        if _polyline_distance(sx, sy, px, py).max() > tolerance_m:
+            continue
+        elapsed = float(timestamps[e] - timestamps[s])
+        if elapsed > 0 and (best is None or elapsed < best["elapsed_s"]):
+            best = {"elapsed_s": elapsed, "start_index": s, "end_index": e}
+    return best
+
+
+def match_route(route: Dict[str, Any], points: List[Dict[str, Any]], segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """SEGMENT_EFFORT rows for every segment the route matches."""
+    if len(points) < 2 or not segments or not route.get("user_reference"):
+        return []
+    lat, lng, timestamps = points_to_arrays(points)
+    efforts = []
+    for segment in segments:
+        match = match_segment(lat, lng, timestamps, segment)
+        if match:
+            efforts.append({
+                "segment_id": segment["id"],
+                "user_reference": route["user_reference"],
+                "route_id": route["id"],
+                "elapsed_s": round(match["elapsed_s"], 1),
+                "started_at": points[match["start_index"]]["timestamp"],
+            })
+    return efforts
@@ -0,0 +1,84 @@
+"""Vectorized Douglas-Peucker simplification for GPS tracks.
+
+Instead of running Douglas-Peucker once per tolerance, `dp_importance` runs
+it once to completion and records, for every point, the largest tolerance at
+which that point would still be kept. Any level of detail is then a single
+comparison: `importance > tolerance`. Each pass of the loop splits every open
+segment at once, so the Python loop runs O(log n) times for typical tracks.
+"""
+from typing import Dict, Iterable
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def project(lat: np.ndarray, lng: np.ndarray, ref_lat: float = None):
+    """Equirectangular projection to metres around `ref_lat` (default: mean latitude)."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lng = np.asarray(lng, dtype=np.float64)
+    if ref_lat is None:
+        ref_lat = float(lat.mean()) if lat.size else 0.0
+    x = np.radians(lng) * EARTH_RADIUS_M * np.cos(np.radians(ref_lat))
+    y = np.radians(lat) * EARTH_RADIUS_M
+    return x, y
+
+
+def _segment_distance(px, py, ax, ay, bx, by):
+    dx = bx - ax
+    dy = by - ay
+    length_sq = dx * dx + dy * dy
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = ((px - ax) * dx + (py - ay) * dy) / length_sq
+    t = np.clip(np.nan_to_num(t, nan=0.0), 0.0, 1.0)
+    return np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def dp_importance(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Per-point Douglas-Peucker importance in the units of x/y (endpoints are inf)."""
+    n = len(x)
+    importance = np.zeros(n, dtype=np.float64)
+    if n == 0:
+        return importance
+    importance[0] = importance[-1] = np.inf
+
+    start = np.array([0], dtype=np.int64)
+    end = np.array([n - 1], dtype=np.int64)
+    cap = np.array([np.inf])
+    while start.size:
+        open_ = end - start >= 2
+        start, end, cap = start[open_], end[open_], cap[open_]
+        if not start.size:
+            break
+
+        inner = end - start - 1
+        offsets = np.concatenate(([0], np.cumsum(inner)[:-1]))
+        seg = np.repeat(np.arange(start.size), inner)
+        idx = np.repeat(start + 1 - offsets, inner) + np.arange(inner.sum())
+
+        dist = _segment_distance(x[idx], y[idx], x[start][seg], y[start][seg], x[end][seg], y[end][seg])
+        dmax = np.maximum.reduceat(dist, offsets)
+
+        # First index reaching the maximum within each segment
+        hits = np.flatnonzero(dist == dmax[seg])
+        _, first = np.unique(seg[hits], return_index=True)
+        split = idx[hits[first]]
+
+        # A point can never outrank the split that exposed it
+        value = np.minimum(dmax, cap)
+        importance[split] = value
+
+        start, end, cap = np.concatenate((start, split)), np.concatenate((split, end)), np.concatenate((value, value))
+    return importance
+
+
+def simplify(lat, lng, tolerance_m: float) -> np.ndarray:
+    """Indices of the points kept by Douglas-Peucker at `tolerance_m` metres."""
+    x, y = project(lat, lng)
+    return np.flatnonzero(dp_importance(x, y) > tolerance_m)
+
+
+def simplify_levels(lat, lng, tolerances_m: Iterable[float]) -> Dict[float, np.ndarray]:
+    """Indices kept at each tolerance, from a single Douglas-Peucker pass."""
+    x, y = project(lat, lng)
+    importance = dp_importance(x, y)
+    return {tolerance: np.flatnonzero(importance > tolerance) for tolerance in tolerances_m}
@@ -0,0 +1,151 @@
+"""Z-order (Morton) cell ids for points, and cell-range covers for viewport queries.
+
+Every POINTS row stores `cell`: latitude and longitude quantized to
+CELL_BITS bits each (about 1.2m x 2.4m at the equator) with their bits
+interleaved. A cell at a coarser level is a prefix of those bits, so it maps
+to one contiguous range of `cell` values. A bounding box is therefore
+covered by a few `cell >= lo and cell < hi` ranges, which a B-tree index on
+`cell` answers by touching only the rows in those ranges.
+"""
+import math
+from typing import List, Tuple
+import numpy as np
+from .simplify import EARTH_RADIUS_M
+
+CELL_BITS = 24
+# Upper bound on ranges per query; more ranges fit the box tighter but make a longer filter
+MAX_COVER_CELLS = 16
+
+_SCALE = float(1 << CELL_BITS)
+_MASKS = (
+    (16, 0x0000FFFF0000FFFF),
+    (8, 0x00FF00FF00FF00FF),
+    (4, 0x0F0F0F0F0F0F0F0F),
+    (2, 0x3333333333333333),
+    (1, 0x5555555555555555),
+)
+
+
+def _quantize(value, low: float, span: float):
+    q = np.floor((np.asarray(value, dtype=np.float64) - low) / span * _SCALE)
+    return np.clip(q, 0, _SCALE - 1).astype(np.uint64)
+
+
+def _spread(v: np.ndarray) -> np.ndarray:
+    # Insert a zero bit above every bit of a 24-bit integer
+    v = v & np.uint64(0xFFFFFFFF)
+    for shift, mask in _MASKS:
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+
+
+def cell_ids(lat, lng) -> np.ndarray:
+    """Cell id (int64) of each point; longitude takes the even bits, latitude the odd ones."""
+    x = _spread(_quantize(lng, -180.0, 360.0))
+    y = _spread(_quantize(lat, -90.0, 180.0))
+    return (x | (y << np.uint64(1))).astype(np.int64)
+
+
+def cell_id(lat: float, lng: float) -> int:
+    return int(cell_ids([lat], [lng])[0])
+
+
+def coarse_cells(lat, lng, level: int, neighbours: bool = False) -> np.ndarray:
+    """Distinct cell ids at `level` (< CELL_BITS bits per axis) of the points.
+
+    With `neighbours`, the 8 surrounding cells of each are included, so anything
+    closer to a point than one cell width is found in the returned set.
+    """
+    drop = np.uint64(CELL_BITS - level)
+    x = _quantize(lng, -180.0, 360.0) >> drop
+    y = _quantize(lat, -90.0, 180.0) >> drop
+    xy = np.unique(np.stack((x, y), axis=1), axis=0).astype(np.int64)
+    if neighbours and xy.size:
+        offsets = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)], dtype=np.int64)
+        xy = (xy[:, None, :] + offsets[None, :, :]).reshape(-1, 2)
+        xy = np.unique(np.clip(xy, 0, (1 << level) - 1), axis=0)
+    xy = xy.astype(np.uint64)
+    return (_spread(xy[:, 0]) | (_spread(xy[:, 1]) << np.uint64(1))).astype(np.int64)
+
+
+def cover_bbox(min_lat: float, min_lng: float, max_lat: float, max_lng: float,
+               max_cells: int = MAX_COVER_CELLS) -> List[Tuple[int, int]]:
+    """Sorted, merged [lo, hi) cell ranges whose union contains the bounding box.
+
+    Uses the finest level at which the box spans at most `max_cells` cells.
+    """
+    x0, x1 = _quantize([min_lng, max_lng], -180.0, 360.0).tolist()
+    y0, y1 = _quantize([min_lat, max_lat], -90.0, 180.0).tolist()
+    level = CELL_BITS
+    while level > 0 and ((x1 >> (CELL_BITS - level)) - (x0 >> (CELL_BITS - level)) + 1) * \
+            ((y1 >> (CELL_BITS - level)) - (y0 >> (CELL_BITS - level)) + 1) > max_cells:
+        level -= 1
+
+    drop = CELL_BITS - level
+    xs = np.arange(x0 >> drop, (x1 >> drop) + 1, dtype=np.uint64)
+    ys = np.arange(y0 >> drop, (y1 >> drop) + 1, dtype=np.uint64)
+    gx, gy = np.meshgrid(xs, ys)
+    prefixes = np.sort((_spread(gx.ravel()) | (_spread(gy.ravel()) << np.uint64(1))).astype(np.int64))
+    width = 1 << (2 * drop)
+
+    ranges: List[Tuple[int, int]] = []
+    for prefix in prefixes.tolist():
+        lo = prefix << (2 * drop)
+        if ranges and ranges[-1][1] == lo:
+            ranges[-1] = (ranges[-1][0], lo + width)
+        else:
+            ranges.append((lo, lo + width))
+    return ranges
+
+
+def bbox_around(lat: float, lng: float, radius_m: float) -> Tuple[float, float, float, float]:
+    """(min_lat, min_lng, max_lat, max_lng) containing the circle; longitude is clamped, not wrapped."""
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    dlng = min(180.0, math.degrees(radius_m / (EARTH_RADIUS_M * cos_lat)))
+    return max(lat - dlat, -90.0), max(lng - dlng, -180.0), min(lat + dlat, 90.0), min(lng + dlng, 180.0)
+
+
+def near_filter(lat: float, lng: float, radius_m: float) -> Tuple[Tuple[float, float, float, float], List[Tuple[int, int]], float, float]:
+    """(box, cell ranges, kx2, max_d2) for finding points near (lat, lng) in storage.
+
+    Storage ranks points by dlat^2 + kx2 * dlng^2 in degrees (equirectangular,
+    kx2 = cos^2 lat), which needs no trigonometry in SQL. max_d2 bounds it
+    at the radius plus 10%, enough for the error of the projection over a
+    few tens of kilometres; callers apply the exact haversine distance.
+    """
+    box = bbox_around(lat, lng, radius_m)
+    kx = math.cos(math.radians(lat))
+    bound = math.degrees(radius_m * 1.1 / EARTH_RADIUS_M)
+    return box, cover_bbox(*box), kx * kx, bound * bound
+
+
+def distances_m(lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """Haversine distance in metres from (lat, lng) to each point."""
+    phi1 = math.radians(lat)
+    phi2 = np.radians(lats)
+    dphi = phi2 - phi1
+    dlmb = np.radians(lngs - lng)
+    a = np.sin(dphi / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def parse_bbox(value: str) -> Tuple[float, float, float, float]:
+    """`minLng,minLat,maxLng,maxLat` (GeoJSON order) to (min_lat, min_lng, max_lat, max_lng)."""
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(v) for v in value.split(","))
+    except ValueError:
+        raise ValueError("bbox must be minLng,minLat,maxLng,maxLat")
+    if not (-180 <= min_lng <= max_lng <= 180 and -90 <= min_lat <= max_lat <= 90):
+        raise ValueError("bbox out of range or min > max")
+    return min_lat, min_lng, max_lat, max_lng
+
+
+def parse_lat_lng(value: str) -> Tuple[float, float]:
+    try:
+        lat, lng = (float(v) for v in value.split(","))
+    except ValueError:
+        raise ValueError("near must be lat,lng")
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("near out of range")
+    return lat, lng
@@ -0,0 +1,147 @@
+"""Rendered map tiles kept on disk, least recently used evicted first.
+
+Files live under HEATMAP_TILE_DIR as <scope>/<z>/<x>/<y>.<ext>. The LRU order
+and total size are tracked in memory; at start-up they are rebuilt from the
+files' modification times, and every hit bumps the file's mtime so the order
+survives restarts. Workers sharing the directory each keep their own order;
+a file another worker evicted or invalidated is simply a miss.
+
+A tile rendered from data read before an invalidation must not be stored
+after it: put() is given the generation read before rendering and skips the
+write if any invalidation happened since.
+"""
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+HEATMAP_TILE_DIR = os.getenv("HEATMAP_TILE_DIR", "tile_cache")
+HEATMAP_TILE_CACHE_BYTES = int(os.getenv("HEATMAP_TILE_CACHE_BYTES", str(256 << 20)))
+
+
+def user_scope(user_id: str) -> str:
+    # Hashed so user ids never become path components
+    return "u/" + hashlib.sha1(user_id.encode()).hexdigest()[:20]
+
+
+def group_scope(group_id: int) -> str:
+    return f"g/{int(group_id)}"
+
+
+def tile_key(scope: str, z: int, x: int, y: int, ext: str) -> str:
+    return f"{scope}/{z}/{x}/{y}.{ext}"
+
+
+class disk_tile_cache:
+    def __init__(self, root: str = HEATMAP_TILE_DIR, max_bytes: int = HEATMAP_TILE_CACHE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.size = 0
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._scan()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def _scan(self):
+        found = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                if name.endswith(".tmp"):
+                    # Left over from a write cut short
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, os.path.relpath(path, self.root).replace(os.sep, "/"), stat.st_size))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.size += size
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes and self.entries:
+            key, size = self.entries.popitem(last=False)
+            self.size -= size
+            try:
+                os.unlink(self._path(key))
+            except OSError:
+                pass
+
+    def _forget(self, key: str):
+        size = self.entries.pop(key, None)
+        if size is not None:
+            self.size -= size
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            if key in self.entries:
+                self.entries.move_to_end(key)
+            else:
+                self.entries[key] = len(data)
+                self.size += len(data)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key: str, data: bytes, generation: int):
+        with self._lock:
+            if generation != self.generation:
+                return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp, "wb") as f:
+            f.write(data)
+        with self._lock:
+            if generation != self.generation:
+                os.unlink(temp)
+                return
+            os.replace(temp, path)
+            self._forget(key)
+            self.entries[key] = len(data)
+            self.size += len(data)
+            self._evict()
+
+    def invalidate(self, keys: Iterable[str]):
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                self._forget(key)
+                try:
+                    os.unlink(self._path(key))
+                except OSError:
+                    pass
+
+    def invalidate_scope(self, scope: str):
+        """Drop every tile of a user or group, e.g. after a rebuild."""
+        with self._lock:
+            self.generation += 1
+            for key in [k for k in self.entries if k.startswith(scope + "/")]:
+                self._forget(key)
+            shutil.rmtree(self._path(scope), ignore_errors=True)
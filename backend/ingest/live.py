@@ -0,0 +1,81 @@
+"""Server side of live recording: buffer a drive's points and write them in batches.
+
+The client sends numbered messages of points as they are recorded. They are
+buffered per session and written when LIVE_FLUSH_POINTS have accumulated or
+the oldest buffered point has waited LIVE_FLUSH_SECONDS, so a drive costs
+one insert per batch rather than one per fix, and most of it is stored by
+the time the drive ends.
+
+A flush stores the points and the highest sequence number in one atomic
+step (append_route_points), then acknowledges that number. A client that
+reconnects is told the last stored number and resends only what follows;
+resent messages at or below it are dropped.
+"""
+import os
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from pydantic import BaseModel, Field
+
+LIVE_FLUSH_POINTS = int(os.getenv("LIVE_FLUSH_POINTS", "500"))
+LIVE_FLUSH_SECONDS = float(os.getenv("LIVE_FLUSH_SECONDS", "10"))
+MAX_LIVE_MESSAGE_POINTS = 1000
+
+
+class live_point(BaseModel):
+    lat: float = Field(..., ge=-90, le=90)
+    lng: float = Field(..., ge=-180, le=180)
+    timestamp: datetime = Field(..., description="ISO 8601 timestamp")
+
+
+class live_message(BaseModel):
+    seq: int = Field(..., ge=1, description="Client sequence number, increasing by message")
+    points: List[live_point] = Field(default_factory=list, max_length=MAX_LIVE_MESSAGE_POINTS)
+    final: bool = Field(False, description="Last message of the drive: flush and close")
+
+
+class live_session:
+    def __init__(self, flush: Callable[[List[Dict[str, Any]], int], Awaitable[int]], acked_seq: int = 0,
+                 max_points: int = LIVE_FLUSH_POINTS, max_delay_s: float = LIVE_FLUSH_SECONDS):
+        self._flush = flush
+        self.acked_seq = acked_seq
+        self.received_seq = acked_seq
+        self.max_points = max_points
+        self.max_delay_s = max_delay_s
+        self.rows: List[Dict[str, Any]] = []
+        self.oldest: Optional[float] = None
+        self.flushes = 0
+        self.stored = 0
+
+    def add(self, message: live_message) -> bool:
+        """Buffer a message's points; False for a resent message that is already buffered or stored."""
+        if message.seq <= self.received_seq:
+            return False
+        self.received_seq = message.seq
+        if message.points and self.oldest is None:
+            self.oldest = time.monotonic()
+        # Stored as ISO 8601 text, like the points of the batch endpoints
+        self.rows.extend(dict(p.model_dump(), timestamp=p.timestamp.isoformat()) for p in message.points)
+        return True
+
+    def due(self) -> bool:
+        return len(self.rows) >= self.max_points
+
+    def seconds_until_flush(self) -> Optional[float]:
+        """How long the receive loop may wait before a time-based flush; None with nothing buffered."""
+        if self.received_seq == self.acked_seq:
+            return None
+        if self.oldest is None:
+            return 0.0
+        return max(0.0, self.oldest + self.max_delay_s - time.monotonic())
+
+    async def flush(self) -> Optional[int]:
+        """Store everything buffered; returns the newly acknowledged seq, or None if there was nothing to do."""
+        if self.received_seq == self.acked_seq:
+            return None
+        rows, seq = self.rows, self.received_seq
+        self.stored += await self._flush(rows, seq)
+        self.rows, self.oldest = [], None
+        self.acked_seq = seq
+        self.flushes += 1
+        return seq
@@ -0,0 +1,100 @@
+from typing import AsyncIterator, List, Optional, Dict, Any, Awaitable, Callable
+from pydantic import BaseModel, ValidationError
+
+
+class LineTooLong(Exception):
+    pass
+
+
+async def iter_ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int = 65536) -> AsyncIterator[bytes]:
+    """Split a byte stream into non-empty NDJSON lines without buffering the whole body.
+
+    Only the current partial line is held in memory; a line longer than
+    `max_line_bytes` raises LineTooLong instead of growing the buffer.
+    """
+    pending = b""
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        pending += chunk
+        lines = pending.split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            line = line.strip()
+            if line:
+                yield line
+        if len(pending) > max_line_bytes:
+            raise LineTooLong(f"NDJSON line exceeds {max_line_bytes} bytes")
+    pending = pending.strip()
+    if pending:
+        yield pending
+
+
+async def ingest_ndjson(
+    chunks: AsyncIterator[bytes],
+    model: type,
+    to_row: Callable[[BaseModel], Dict[str, Any]],
+    flush: Callable[[List[Dict[str, Any]]], Awaitable[Any]],
+    chunk_size: int = 500,
+    offset: int = 0,
+    max_line_bytes: int = 65536,
+) -> Dict[str, Any]:
+    """Validate NDJSON records one by one and flush them in fixed-size chunks.
+
+    Each chunk is awaited before more of the body is read, so a slow upstream
+    pushes back on the client. Processing stops at the first invalid line or
+    failed chunk; `resume_from` is the absolute line number (counting from
+    `offset`) the client should resend from.
+    """
+    chunk_results: List[Dict[str, Any]] = []
+    rows: List[Dict[str, Any]] = []
+    line_no = offset
+    first_line = offset
+    inserted = 0
+    error: Optional[Dict[str, Any]] = None
+
+    async def flush_rows() -> bool:
+        nonlocal inserted, rows, first_line
+        result = {"index": len(chunk_results), "first_line": first_line, "last_line": first_line + len(rows) - 1}
+        try:
+            await flush(rows)
+            result.update(status="ok", inserted=len(rows))
+            inserted += len(rows)
+        except Exception as e:
+            result.update(status="failed", inserted=0, error=str(e))
+        chunk_results.append(result)
+        ok = result["status"] == "ok"
+        if ok:
+            first_line += len(rows)
+            rows = []
+        return ok
+
+    try:
+        async for line in iter_ndjson_lines(chunks, max_line_bytes):
+            try:
+                record = model.model_validate_json(line)
+            except ValidationError as e:
+                error = {"line": line_no, "error": e.errors(include_url=False, include_context=False, include_input=False)}
+                break
+            rows.append(to_row(record))
+            line_no += 1
+            if len(rows) >= chunk_size and not await flush_rows():
+                break
+        else:
+            if rows:
+                await flush_rows()
+    except LineTooLong as e:
+        error = {"line": line_no, "error": str(e)}
+
+    if error is not None and rows:
+        # Keep everything valid up to the bad line
+        await flush_rows()
+
+    failed = any(c["status"] != "ok" for c in chunk_results)
+    return {
+        "inserted": inserted,
+        "chunks": chunk_results,
+        "error": error,
+        "complete": error is None and not failed,
+        "resume_from": first_line,
+    }
@@ -0,0 +1,239 @@
+"""Import GPX and FIT tracks as routes, in constant memory.
+
+A track file is parsed incrementally (ElementTree.iterparse for GPX, a
+record-by-record reader for FIT) and never held whole: IMPORT_CHUNK_POINTS
+points at a time are parsed in a worker thread, inserted with one
+create_points_batch call and folded into a route_metrics_accumulator. The
+ROUTE row is created from the first chunk and given its final metrics after
+the last, so a file of any size costs one chunk of memory and
+points / IMPORT_CHUNK_POINTS inserts.
+
+Points keep the file's order, which GPS recorders write in time order; only
+points with a position and a time are imported. A file that fails part way
+has its route, points and heatmap counts removed again.
+
+Several files are imported IMPORT_WORKERS at a time (import_tracks): each
+worker alternates between parsing in its thread and waiting on inserts, so
+parsing one file overlaps the upstream writes of the others.
+"""
+import asyncio
+import itertools
+import os
+import struct
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, BinaryIO, Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from geo.route_metrics import parse_timestamps, route_metrics_accumulator
+
+IMPORT_CHUNK_POINTS = int(os.getenv("IMPORT_CHUNK_POINTS", "2000"))
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "4"))
+# Upload limit for POST /routes/import; bodies past IMPORT_SPOOL_BYTES are spooled to disk
+MAX_IMPORT_BYTES = int(os.getenv("MAX_IMPORT_BYTES", str(512 << 20)))
+IMPORT_SPOOL_BYTES = 8 << 20
+TRACK_FORMATS = ("gpx", "fit")
+
+# FIT timestamps count seconds from 1989-12-31T00:00:00Z; positions are in semicircles
+FIT_EPOCH = 631065600
+FIT_SEMICIRCLE_DEG = 180.0 / 2 ** 31
+FIT_RECORD = 20
+FIT_INVALID_SINT32 = 0x7FFFFFFF
+FIT_INVALID_UINT32 = 0xFFFFFFFF
+
+# GPX elements dropped from the tree once parsed, so it never grows
+_GPX_DONE = {"trkpt", "rtept", "wpt", "trkseg", "trk", "rte", "metadata", "extensions"}
+
+TrackPoint = Tuple[float, float, str]
+
+
+class track_format_error(ValueError):
+    pass
+
+
+def track_format(filename: str) -> Optional[str]:
+    """"gpx" or "fit" from a file name, None for anything else."""
+    extension = os.path.splitext(filename)[1].lower().lstrip(".")
+    return extension if extension in TRACK_FORMATS else None
+
+
+def iter_gpx_points(fileobj: BinaryIO) -> Iterator[TrackPoint]:
+    """(lat, lng, time) of every timestamped <trkpt>, in file order."""
+    stack: List[ET.Element] = []
+    try:
+        for event, elem in ET.iterparse(fileobj, events=("start", "end")):
+            if event == "start":
+                stack.append(elem)
+                continue
+            stack.pop()
+            tag = elem.tag.rsplit("}", 1)[-1]
+            if tag == "trkpt":
+                when = next((c.text for c in elem if c.tag.rsplit("}", 1)[-1] == "time"), None)
+                lat, lon = elem.get("lat"), elem.get("lon")
+                if when and lat is not None and lon is not None:
+                    yield float(lat), float(lon), when.strip()
+            if tag in _GPX_DONE and stack:
+                stack[-1].remove(elem)
+    except ET.ParseError as e:
+        raise track_format_error(f"Invalid GPX: {e}")
+    except ValueError as e:
+        raise track_format_error(f"Invalid GPX coordinate: {e}")
+
+
+def _read(fileobj: BinaryIO, size: int) -> bytes:
+    data = fileobj.read(size)
+    if len(data) != size:
+        raise track_format_error("Truncated FIT file")
+    return data
+
+
+def iter_fit_points(fileobj: BinaryIO) -> Iterator[TrackPoint]:
+    """(lat, lng, time) of every positioned `record` message, in file order.
+
+    Reads one message at a time; only the message definitions are kept.
+    """
+    header_size = _read(fileobj, 1)[0]
+    header = _read(fileobj, header_size - 1)
+    if header_size < 12 or header[7:11] != b".FIT":
+        raise track_format_error("Not a FIT file")
+    remaining = struct.unpack("<I", header[3:7])[0]
+    # local message type -> (struct format, global message number, field numbers, developer bytes)
+    definitions: Dict[int, Tuple[struct.Struct, int, List[int], int]] = {}
+    last_timestamp: Optional[int] = None
+
+    while remaining > 0:
+        record_header = _read(fileobj, 1)[0]
+        remaining -= 1
+        timestamp = None
+        if record_header & 0x80:
+            # Compressed timestamp header: 5-bit offset from the last full timestamp
+            local = (record_header >> 5) & 0x3
+            if last_timestamp is not None:
+                offset = record_header & 0x1F
+                timestamp = (last_timestamp & ~0x1F) + offset
+                if offset < (last_timestamp & 0x1F):
+                    timestamp += 0x20
+        elif record_header & 0x40:
+            local = record_header & 0x0F
+            fixed = _read(fileobj, 5)
+            endian = ">" if fixed[1] else "<"
+            global_number = struct.unpack(endian + "H", fixed[2:4])[0]
+            raw_fields = _read(fileobj, 3 * fixed[4])
+            remaining -= 5 + 3 * fixed[4]
+            developer = 0
+            if record_header & 0x20:
+                count = _read(fileobj, 1)[0]
+                developer = sum(_read(fileobj, 3)[1] for _ in range(count))
+                remaining -= 1 + 3 * count
+            numbers = [raw_fields[i] for i in range(0, len(raw_fields), 3)]
+            layout = "".join(f"{raw_fields[i + 1]}s" for i in range(0, len(raw_fields), 3))
+            definitions[local] = (struct.Struct(endian + layout), global_number, numbers, developer)
+            continue
+        else:
+            local = record_header & 0x0F
+
+        if local not in definitions:
+            raise track_format_error(f"FIT data message for undefined local type {local}")
+        layout, global_number, numbers, developer = definitions[local]
+        data = _read(fileobj, layout.size + developer)
+        remaining -= layout.size + developer
+        values = dict(zip(numbers, layout.unpack(data[:layout.size])))
+        endian = layout.format[0]
+        if len(values.get(253, b"")) == 4:
+            timestamp = struct.unpack(endian + "I", values[253])[0]
+        if timestamp is not None and timestamp != FIT_INVALID_UINT32:
+            last_timestamp = timestamp
+        if global_number != FIT_RECORD or timestamp is None or timestamp == FIT_INVALID_UINT32:
+            continue
+        if len(values.get(0, b"")) != 4 or len(values.get(1, b"")) != 4:
+            continue
+        lat, lng = struct.unpack(endian + "ii", values[0] + values[1])
+        if lat == FIT_INVALID_SINT32 or lng == FIT_INVALID_SINT32:
+            continue
+        when = datetime.fromtimestamp(FIT_EPOCH + timestamp, timezone.utc).isoformat()
+        yield lat * FIT_SEMICIRCLE_DEG, lng * FIT_SEMICIRCLE_DEG, when
+
+
+PARSERS: Dict[str, Callable[[BinaryIO], Iterator[TrackPoint]]] = {"gpx": iter_gpx_points, "fit": iter_fit_points}
+
+
+async def _point_chunks(points: Iterator[TrackPoint], chunk_size: int) -> AsyncIterator[List[TrackPoint]]:
+    # Parse in a worker thread, one chunk per hop, so the event loop keeps serving
+    while True:
+        chunk = await asyncio.to_thread(lambda: list(itertools.islice(points, chunk_size)))
+        if not chunk:
+            return
+        yield chunk
+
+
+async def import_track(handler, fileobj: BinaryIO, fmt: str, user_id: Optional[str],
+                       chunk_size: int = IMPORT_CHUNK_POINTS) -> Dict[str, Any]:
+    """Create a route from one GPX or FIT file. Returns {"route_id", "points"}."""
+    metrics = route_metrics_accumulator()
+    route_id = None
+    count = 0
+    last_time = None
+    try:
+        async for chunk in _point_chunks(PARSERS[fmt](fileobj), chunk_size):
+            lat = np.fromiter((p[0] for p in chunk), dtype=np.float64, count=len(chunk))
+            lng = np.fromiter((p[1] for p in chunk), dtype=np.float64, count=len(chunk))
+            metrics.add(lat, lng, parse_timestamps([p[2] for p in chunk]))
+            if route_id is None:
+                route = await handler.create_route(
+                    {"startedAt": chunk[0][2], "endedAt": chunk[-1][2], "distanceKm": 0.0, "avgSpeedKmh": 0.0},
+                    user_id,
+                )
+                route_id = route["id"]
+            await handler.create_points_batch(
+                [{"lat": p[0], "lng": p[1], "timestamp": p[2], "route_id": route_id} for p in chunk]
+            )
+            count += len(chunk)
+            last_time = chunk[-1][2]
+        if route_id is None:
+            raise track_format_error("No timestamped track points found")
+        await handler.update_route(route_id, {"endedAt": last_time, **metrics.result()})
+    except Exception:
+        if route_id is not None:
+            try:
+                # The heatmap bins the inserted chunks added go first, while the points can still be read
+                await handler.remove_route_from_heatmap(route_id)
+                await handler.delete_points_by_route(route_id)
+                await handler.delete_route(route_id)
+            except Exception:
+                pass
+        raise
+    return {"route_id": route_id, "points": count}
+
+
+async def import_tracks(handler, sources: List[Tuple[str, Callable[[], ContextManager[BinaryIO]]]],
+                        user_id: Optional[str], workers: int = IMPORT_WORKERS,
+                        chunk_size: int = IMPORT_CHUNK_POINTS) -> Dict[str, Any]:
+    """Import (name, open) sources `workers` at a time; the format comes from each name.
+
+    One file failing does not stop the others; its entry says why.
+    """
+    semaphore = asyncio.Semaphore(workers)
+
+    async def one(name: str, open_source) -> Dict[str, Any]:
+        fmt = track_format(name)
+        if fmt is None:
+            return {"name": name, "status": "skipped", "route_id": None, "points": 0, "error": "Not a .gpx or .fit file"}
+        async with semaphore:
+            try:
+                with open_source() as fileobj:
+                    result = await import_track(handler, fileobj, fmt, user_id, chunk_size)
+            except Exception as e:
+                return {"name": name, "status": "failed", "route_id": None, "points": 0, "error": str(e)}
+        return {"name": name, "status": "ok", **result, "error": None}
+
+    start = time.perf_counter()
+    files = await asyncio.gather(*(one(name, open_source) for name, open_source in sources))
+    seconds = time.perf_counter() - start
+    points = sum(f["points"] for f in files)
+    return {
+        "files": files,
+        "routes": sum(f["status"] == "ok" for f in files),
+        "points": points,
+        "seconds": seconds,
+        "points_per_second": points / seconds if seconds > 0 else 0.0,
+    }
@@ -0,0 +1,137 @@
+"""Write-behind batching for single-point inserts (POST /points/).
+
+With POINT_WRITE_BEHIND=1 each request queues its row and waits on a future,
+and one background task writes whatever has queued with a single
+create_points_batch call: as soon as POINT_WRITE_BEHIND_MAX_BATCH rows are
+waiting, or once the oldest has waited POINT_WRITE_BEHIND_MAX_DELAY_MS. Many
+concurrent requests then cost one upstream insert instead of one each, and
+no request waits longer than the delay plus one batch write.
+
+At most POINT_WRITE_BEHIND_MAX_QUEUE rows may be queued or in flight. A
+request that finds the queue full waits up to POINT_WRITE_BEHIND_QUEUE_TIMEOUT_S
+for room and then gets write_buffer_full (503), so a slow upstream pushes
+back on clients instead of growing memory. aclose() writes everything still
+queued before returning.
+
+Every request still gets its own stored row: inserted ids are assigned in
+row order within one statement, so the batch result sorted by id lines up
+with the queued rows. If a batch fails, every request in it gets the error.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+POINT_WRITE_BEHIND = os.getenv("POINT_WRITE_BEHIND", "0").lower() in ("1", "true", "yes")
+POINT_WRITE_BEHIND_MAX_BATCH = int(os.getenv("POINT_WRITE_BEHIND_MAX_BATCH", "500"))
+POINT_WRITE_BEHIND_MAX_DELAY_MS = float(os.getenv("POINT_WRITE_BEHIND_MAX_DELAY_MS", "20"))
+POINT_WRITE_BEHIND_MAX_QUEUE = int(os.getenv("POINT_WRITE_BEHIND_MAX_QUEUE", "10000"))
+POINT_WRITE_BEHIND_QUEUE_TIMEOUT_S = float(os.getenv("POINT_WRITE_BEHIND_QUEUE_TIMEOUT_S", "5"))
+
+# Every queued row gets the same columns, so a batch is one statement on SQLite too
+POINT_COLUMNS = ("lat", "lng", "timestamp", "route_id")
+
+
+class write_buffer_full(Exception):
+    pass
+
+
+class point_write_buffer:
+    def __init__(self, write: Callable[[List[Dict[str, Any]]], Awaitable[List[Dict[str, Any]]]],
+                 max_batch: int = POINT_WRITE_BEHIND_MAX_BATCH,
+                 max_delay_s: float = POINT_WRITE_BEHIND_MAX_DELAY_MS / 1000,
+                 max_queue: int = POINT_WRITE_BEHIND_MAX_QUEUE,
+                 queue_timeout_s: float = POINT_WRITE_BEHIND_QUEUE_TIMEOUT_S):
+        self._write = write
+        self.max_batch = max_batch
+        self.max_delay_s = max_delay_s
+        self.max_queue = max(max_queue, max_batch)
+        self.queue_timeout_s = queue_timeout_s
+        self._pending: Deque[Tuple[Dict[str, Any], asyncio.Future, float]] = deque()
+        self._in_flight = 0
+        self._wake = asyncio.Event()
+        self._room = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.batches = 0
+        self.written = 0
+        self.rejected = 0
+
+    @property
+    def queued(self) -> int:
+        """Rows queued or being written."""
+        return len(self._pending) + self._in_flight
+
+    async def submit(self, point_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue one POINTS row and return it as stored, id included."""
+        if self._closing:
+            raise write_buffer_full("Point writer is shutting down")
+        if self.queued >= self.max_queue:
+            await self._wait_for_room()
+        row = {column: point_data.get(column) for column in POINT_COLUMNS}
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((row, future, time.monotonic()))
+        self._wake.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return await future
+
+    async def _wait_for_room(self):
+        deadline = time.monotonic() + self.queue_timeout_s
+        while self.queued >= self.max_queue:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._closing:
+                self.rejected += 1
+                raise write_buffer_full(f"Point write queue is full ({self.max_queue} rows)")
+            self._room.clear()
+            try:
+                await asyncio.wait_for(self._room.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self):
+        while self._pending:
+            # Hold the batch open until it is full or its oldest row is due
+            deadline = self._pending[0][2] + self.max_delay_s
+            while len(self._pending) < self.max_batch and not self._closing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+            self._in_flight += len(batch)
+            try:
+                await self._flush(batch)
+            finally:
+                self._in_flight -= len(batch)
+                self._room.set()
+
+    async def _flush(self, batch: List[Tuple[Dict[str, Any], asyncio.Future, float]]):
+        try:
+            stored = await self._write([row for row, _, _ in batch])
+            if len(stored) != len(batch):
+                raise Exception(f"Batch insert returned {len(stored)} rows for {len(batch)} points")
+            stored = sorted(stored, key=lambda r: r["id"])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), row in zip(batch, stored):
+            if not future.done():
+                future.set_result(row)
+        self.batches += 1
+        self.written += len(batch)
+
+    async def aclose(self):
+        """Stop taking rows and write everything already queued."""
+        self._closing = True
+        self._wake.set()
+        self._room.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
@@ -0,0 +1,55 @@
+"""Structured (JSON lines) logging with sampling of low-severity records.
+
+    LOG_LEVEL=DEBUG LOG_SAMPLE_RATE=0.01 uvicorn main:app
+
+WARNING and above are always emitted; DEBUG/INFO records are kept with
+probability LOG_SAMPLE_RATE, so verbose hot-path logging stays cheap.
+"""
+import json
+import logging
+import os
+import random
+
+
+class json_formatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class sampling_filter(logging.Filter):
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or self.rate >= 1.0 or random.random() < self.rate
+
+
+def configure_logging(level: str = None, sample_rate: float = None):
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    sample_rate = float(os.getenv("LOG_SAMPLE_RATE", "1.0")) if sample_rate is None else sample_rate
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(json_formatter())
+    handler.addFilter(sampling_filter(sample_rate))
+
+    root = logging.getLogger("carva")
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper())
+    root.propagate = False
+    return root
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"carva.{name}")
@@ -0,0 +1,129 @@
+"""Minimal Prometheus-compatible metrics: counters, histograms and callbacks.
+
+Rendered in the text exposition format (version 0.0.4) by `REGISTRY.render()`.
+"""
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, str]) -> LabelSet:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    parts = []
+    for k, v in labels:
+        escaped = v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{escaped}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class counter:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[LabelSet, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        lines.extend(f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in items)
+        return lines
+
+
+class histogram:
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        # label set -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelSet, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _labels(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            state[index] += 1
+            state[-1] += value
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        for key, state in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += count
+                labels = key + (("le", _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(labels)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {repr(state[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {_format_value(cumulative)}")
+        return lines
+
+
+class callback_metric:
+    """Values read at scrape time from existing counters, e.g. cache hit totals."""
+
+    def __init__(self, name: str, documentation: str, kind: str, read: Callable[[], Iterable[Tuple[Dict[str, str], float]]]):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.read = read
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{self.name}{_format_labels(_labels(labels))} {_format_value(value)}" for labels, value in self.read())
+        return lines
+
+
+class registry:
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.register(histogram(
+    "carva_http_request_duration_seconds", "Request latency by route template, method and status"))
+UPSTREAM_CALL_SECONDS = REGISTRY.register(histogram(
+    "carva_upstream_call_duration_seconds", "Latency of data-layer methods and raw upstream requests"))
+JWT_VERIFY_SECONDS = REGISTRY.register(histogram(
+    "carva_jwt_verify_duration_seconds", "JWT verification latency by outcome (cached, verified, rejected)"))
+RESPONSE_RENDER_SECONDS = REGISTRY.register(histogram(
+    "carva_response_render_duration_seconds", "Time spent encoding JSON response bodies"))
+UPSTREAM_ERRORS = REGISTRY.register(counter(
+    "carva_upstream_errors_total", "Data-layer calls that raised"))
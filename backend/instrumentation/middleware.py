@@ -0,0 +1,180 @@
+import os
+import time
+import zlib
+from typing import Optional
+from starlette.datastructures import Headers, MutableHeaders
+from .metrics import HTTP_REQUEST_SECONDS
+
+
+class timing_middleware:
+    """ASGI middleware recording request latency per route template.
+
+    The route is read back from the scope after routing, so `/routes/12` and
+    `/routes/13` share the `/routes/{route_id}` series.
+    """
+
+    def __init__(self, app, metric=HTTP_REQUEST_SECONDS):
+        self.app = app
+        self.metric = metric
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            self.metric.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status_code),
+            )
+
+
+try:
+    import brotli
+except ImportError:  # optional; gzip alone is offered without it
+    brotli = None
+
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "512"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+# Low qualities compress about as well as gzip -6 in less time; 11 is meant for static files
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+# Bodies that are already compressed
+INCOMPRESSIBLE_TYPES = ("image/png", "image/jpeg", "application/zip", "application/gzip", "application/octet-stream")
+
+
+def accepted_encoding(accept_encoding: str) -> Optional[str]:
+    """"br" or "gzip" from an Accept-Encoding header, preferring br; None for identity."""
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name.strip().lower()] = weight
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    candidates = [(weights.get(e, weights.get("*", 0.0)), -i, e) for i, e in enumerate(offered)]
+    weight, _, encoding = max(candidates)
+    return encoding if weight > 0 else None
+
+
+class _gzip:
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def process(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _brotli:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def process(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+COMPRESSORS = {"gzip": _gzip, "br": _brotli}
+
+
+class compression_middleware:
+    """ASGI middleware compressing response bodies with br or gzip, per Accept-Encoding.
+
+    A response sent in one body message is compressed whole, and only if it
+    is at least `minimum_size` bytes. A streamed response (exports, NDJSON)
+    is compressed as it goes, each chunk flushed so clients see data as soon
+    as it is sent. Responses that already carry a Content-Encoding, or whose
+    type is compressed already, pass through untouched. Every response that
+    could have been compressed gets `Vary: Accept-Encoding`.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = Headers(scope=scope)
+        encoding = accepted_encoding(headers.get("accept-encoding", ""))
+        if encoding is None or scope["method"] == "HEAD":
+            return await self.app(scope, receive, send)
+
+        start_message = None
+        compressor = None
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor
+            if message["type"] == "http.response.start":
+                response_headers = Headers(raw=message["headers"])
+                content_type = response_headers.get("content-type", "")
+                if ("content-encoding" in response_headers or message["status"] in (204, 304)
+                        or content_type.startswith(INCOMPRESSIBLE_TYPES)):
+                    await send(message)
+                else:
+                    # Held back until the first body message shows whether compressing pays
+                    start_message = message
+                return
+            if message["type"] != "http.response.body" or (start_message is None and compressor is None):
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                start, start_message = start_message, None
+                response_headers = MutableHeaders(raw=start["headers"])
+                response_headers.add_vary_header("Accept-Encoding")
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = COMPRESSORS[encoding]()
+                response_headers["Content-Encoding"] = encoding
+                if more_body:
+                    del response_headers["Content-Length"]
+                else:
+                    body = compressor.process(body) + compressor.finish()
+                    response_headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start)
+
+            if more_body:
+                chunk = compressor.process(body) + compressor.flush() if body else b""
+            else:
+                chunk = compressor.process(body) + compressor.finish()
+            if chunk or not more_body:
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
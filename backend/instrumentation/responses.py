@@ -0,0 +1,72 @@
+"""JSON response encoding.
+
+Bodies are encoded with orjson when it is installed and RESPONSE_JSON_ENCODER
+is "orjson" (the default), otherwise with the stdlib encoder FastAPI uses.
+
+Rows from the storage backends are already JSON types: PostgREST returns
+them as JSON, and the SQLite backend decodes its JSON columns. Sending them
+through response_model validation and jsonable_encoder rebuilds every row
+only to write the same values back out, which on list endpoints costs more
+than encoding. trusted_response() sends such content straight to the
+encoder, and trusted_rows() drops the columns a response model leaves out.
+Values are sent as stored, so timestamps keep the backend's formatting
+rather than pydantic's. TRUST_STORAGE_ROWS=0 turns the fast path off and
+every response is validated again.
+"""
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from .metrics import RESPONSE_RENDER_SECONDS
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used without it
+    orjson = None
+
+RESPONSE_JSON_ENCODER = os.getenv("RESPONSE_JSON_ENCODER", "orjson")
+TRUST_STORAGE_ROWS = os.getenv("TRUST_STORAGE_ROWS", "1") == "1"
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None and RESPONSE_JSON_ENCODER == "orjson":
+        try:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Integers past 64 bits or types orjson does not know; the stdlib encoder decides
+            pass
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+class timed_json_response(JSONResponse):
+    """JSONResponse that records how long encoding the body takes."""
+
+    def render(self, content: Any) -> bytes:
+        start = time.perf_counter()
+        body = dumps(content)
+        RESPONSE_RENDER_SECONDS.observe(time.perf_counter() - start)
+        return body
+
+
+def trusted_rows(rows: Iterable[Dict[str, Any]], model: type) -> List[Dict[str, Any]]:
+    """Rows cut down to the model's fields, missing ones as None, as its response_model would send them."""
+    fields = list(model.model_fields)
+    return [{field: row.get(field) for field in fields} for row in rows]
+
+
+def trusted_response(content: Any, response: Optional[Response] = None) -> Any:
+    """Encode storage rows (or dicts and lists of them) without validating them again.
+
+    `response` is the endpoint's injected Response, whose headers (ETag and
+    so on) FastAPI would otherwise only merge into responses it builds itself.
+    """
+    if not TRUST_STORAGE_ROWS:
+        return content
+    sent = timed_json_response(content)
+    if response is not None:
+        sent.headers.raw.extend(response.headers.raw)
+        if response.status_code:
+            sent.status_code = response.status_code
+    return sent
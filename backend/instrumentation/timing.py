@@ -0,0 +1,49 @@
+import functools
+import inspect
+import time
+
+
+def timed(fn, metric, errors=None, **labels):
+    """Wrap a sync or async callable so every call is observed on `metric`."""
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    errors.inc(**labels)
+                raise
+            finally:
+                metric.observe(time.perf_counter() - start, **labels)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            if errors is not None:
+                errors.inc(**labels)
+            raise
+        finally:
+            metric.observe(time.perf_counter() - start, **labels)
+    return wrapper
+
+
+def instrument(obj, metric, component: str, errors=None, include_private=("_request", "_fetch")):
+    """Time every public method of `obj` (plus the named private ones) in place.
+
+    Wrappers are set on the instance, so internal `self.method()` calls are
+    timed too. Returns `obj` for chaining.
+    """
+    for name in dir(type(obj)):
+        if name.startswith("_") and name not in include_private:
+            continue
+        attr = getattr(obj, name, None)
+        if not inspect.ismethod(attr):
+            continue
+        setattr(obj, name, timed(attr, metric, errors, component=component, method=name))
+    return obj
@@ -0,0 +1,98 @@
+"""Rebuild HEATMAP_CELL bins from the points of each user's routes.
+
+Point writes, moves and deletes keep the bins current through deltas; this
+recomputes them from scratch, to backfill existing users or to repair bins
+after a delta failed to apply.
+Points are read a page at a time; memory grows with the number of bins, not
+points. Cached tiles of the user and their groups are dropped afterwards.
+
+    python -m jobs.heatmap_rebuild --all --concurrency 4
+    python -m jobs.heatmap_rebuild 123e4567-e89b-12d3-a456-426614174000
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from exports.route_export import route_point_pages
+from geo.heatmap import heatmap_deltas
+from geo.tile_cache import disk_tile_cache, group_scope, user_scope
+
+
+async def rebuild_user_heatmap(handler, user_id: str, tiles: Optional[disk_tile_cache] = None) -> int:
+    """Replace one user's bins. Returns the number of bins written."""
+    counts: Dict[Tuple[int, int, int], int] = {}
+    cursor = None
+    while True:
+        routes, cursor = await handler.list_user_routes(user_id, 100, cursor)
+        for route in routes:
+            async for rows in route_point_pages(handler, route["id"], ["lat", "lng"]):
+                lat = np.fromiter((r["lat"] for r in rows), dtype=np.float64, count=len(rows))
+                lng = np.fromiter((r["lng"] for r in rows), dtype=np.float64, count=len(rows))
+                for d in await asyncio.to_thread(heatmap_deltas, lat, lng):
+                    key = (d["zoom"], d["bin_x"], d["bin_y"])
+                    counts[key] = counts.get(key, 0) + d["count"]
+        if cursor is None:
+            break
+    await handler.replace_user_heatmap(
+        user_id, [{"zoom": z, "bin_x": x, "bin_y": y, "count": c} for (z, x, y), c in counts.items()]
+    )
+    if tiles is not None:
+        for scope in [user_scope(user_id)] + [group_scope(g) for g in await handler.get_user_group_ids(user_id)]:
+            await asyncio.to_thread(tiles.invalidate_scope, scope)
+    return len(counts)
+
+
+async def rebuild_users(handler, user_ids: List[str], concurrency: int = 4,
+                        tiles: Optional[disk_tile_cache] = None) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    failures: Dict[str, str] = {}
+
+    async def one(user_id: str) -> int:
+        async with semaphore:
+            try:
+                return await rebuild_user_heatmap(handler, user_id, tiles)
+            except Exception as e:
+                failures[user_id] = str(e)
+                return 0
+
+    start = time.perf_counter()
+    counts = await asyncio.gather(*(one(u) for u in user_ids))
+    return {
+        "users": len(user_ids),
+        "bins": sum(counts),
+        "seconds": time.perf_counter() - start,
+        "failures": failures,
+    }
+
+
+async def _main(args):
+    from storage.factory import create_storage_backend
+
+    handler = create_storage_backend()
+    try:
+        user_ids = args.user_ids
+        if args.all:
+            user_ids = await handler.get_route_user_ids()
+        report = await rebuild_users(handler, user_ids, args.concurrency, disk_tile_cache())
+    finally:
+        await handler.aclose()
+
+    print(f"Rebuilt heatmaps for {report['users']} users ({report['bins']} bins) in {report['seconds']:.2f}s")
+    for user_id, error in report["failures"].items():
+        print(f"  user {user_id} failed: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild per-user heatmap bins from route points")
+    parser.add_argument("user_ids", nargs="*")
+    parser.add_argument("--all", action="store_true", help="rebuild every user who owns a route")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    if not args.user_ids and not args.all:
+        parser.error("pass user ids or --all")
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Rebuild GROUP_LEADERBOARD rows from the activity history.
+
+Activity writes keep the aggregates current through deltas; this recomputes
+them from scratch. A member's rows are rebuilt when they join a group, and
+the batch job repairs drift (e.g. a delta that failed to apply):
+
+    python -m jobs.leaderboard_rebuild --all --concurrency 8
+    python -m jobs.leaderboard_rebuild 3 7
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List
+from aggregates.activity_totals import aggregate_activities
+
+
+async def rebuild_member(handler, group_id: int, user_id: str) -> int:
+    """Replace one member's rows in a group. Returns the number of rows written."""
+    activities = await handler.get_user_activities(user_id)
+    rows = await asyncio.to_thread(aggregate_activities, activities)
+    await handler.replace_group_leaderboard(group_id, rows, user_id)
+    return len(rows)
+
+
+async def rebuild_groups(handler, group_ids: List[int], concurrency: int = 8) -> Dict[str, Any]:
+    """Replace every listed group's rows; each member's activities are read once."""
+    semaphore = asyncio.Semaphore(concurrency)
+    failures: Dict[int, str] = {}
+    start = time.perf_counter()
+
+    async def members(group_id: int):
+        async with semaphore:
+            return [m["user_reference"] for m in await handler.get_group_members(group_id)]
+
+    group_members = dict(zip(group_ids, await asyncio.gather(*(members(g) for g in group_ids))))
+    users = sorted({u for member_ids in group_members.values() for u in member_ids})
+
+    async def user_rows(user_id: str):
+        async with semaphore:
+            return await asyncio.to_thread(aggregate_activities, await handler.get_user_activities(user_id))
+
+    rows_by_user = dict(zip(users, await asyncio.gather(*(user_rows(u) for u in users))))
+
+    async def one(group_id: int) -> int:
+        async with semaphore:
+            rows = [row for user in group_members[group_id] for row in rows_by_user[user]]
+            try:
+                await handler.replace_group_leaderboard(group_id, rows)
+                return len(rows)
+            except Exception as e:
+                failures[group_id] = str(e)
+                return 0
+
+    counts = await asyncio.gather(*(one(g) for g in group_ids))
+    return {
+        "groups": len(group_ids),
+        "members": len(users),
+        "rows": sum(counts),
+        "seconds": time.perf_counter() - start,
+        "failures": failures,
+    }
+
+
+async def _main(args):
+    from storage.factory import create_storage_backend
+
+    handler = create_storage_backend()
+    try:
+        group_ids = args.group_ids
+        if args.all:
+            group_ids = [g["id"] for g in await handler.get_all_groups()]
+        report = await rebuild_groups(handler, group_ids, args.concurrency)
+    finally:
+        await handler.aclose()
+
+    print(f"Rebuilt {report['groups']} groups ({report['members']} members, {report['rows']} rows) "
+          f"in {report['seconds']:.2f}s")
+    for group_id, error in report["failures"].items():
+        print(f"  group {group_id} failed: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild group leaderboard aggregates from activities")
+    parser.add_argument("group_ids", nargs="*", type=int)
+    parser.add_argument("--all", action="store_true", help="rebuild every group")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    if not args.group_ids and not args.all:
+        parser.error("pass group ids or --all")
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Delete routes together with their points, in bounded chunks.
+
+The route is first subtracted from its owner's heatmap, then its points go,
+POINT_DELETE_CHUNK rows per statement, then the ROUTE row (its levels of
+detail and segment efforts cascade with it). The API runs
+this in the background for long routes and reports progress through
+`route_deletions`; it can also be run directly:
+
+    python -m jobs.route_delete 12 13 --chunk-size 10000
+"""
+import argparse
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+
+class route_deletions:
+    """Progress of route deletions started by this process (most recent `keep`)."""
+
+    def __init__(self, keep: int = 1000):
+        self.keep = keep
+        self.jobs: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+
+    def get(self, route_id: int) -> Optional[Dict[str, Any]]:
+        return self.jobs.get(route_id)
+
+    def running(self, route_id: int) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(route_id)
+        return job if job and job["status"] == "running" else None
+
+    def start(self, route_id: int, deleted_points: int = 0) -> Dict[str, Any]:
+        job = {
+            "route_id": route_id,
+            "status": "running",
+            "deleted_points": deleted_points,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "finished_at": None,
+            "error": None,
+        }
+        self.jobs[route_id] = job
+        self.jobs.move_to_end(route_id)
+        while len(self.jobs) > self.keep:
+            self.jobs.popitem(last=False)
+        return job
+
+
+async def delete_route_cascade(handler, route_id: int, chunk_size: Optional[int] = None,
+                               job: Optional[Dict[str, Any]] = None) -> int:
+    """Delete a route's points chunk by chunk, then the route. Returns the number of points deleted.
+
+    With a `job` from route_deletions, its counters are updated as chunks go.
+    """
+    already = job["deleted_points"] if job else 0
+
+    def on_chunk(total: int):
+        if job is not None:
+            job["deleted_points"] = already + total
+
+    try:
+        await handler.remove_route_from_heatmap(route_id)
+        deleted = await handler.delete_points_by_route(route_id, chunk_size, on_chunk)
+        await handler.delete_route(route_id)
+    except Exception as e:
+        if job is not None:
+            job.update(status="failed", error=str(e), finished_at=datetime.now(timezone.utc).isoformat())
+        raise
+    if job is not None:
+        job.update(status="done", finished_at=datetime.now(timezone.utc).isoformat())
+    return deleted
+
+
+async def _main(args):
+    from storage.factory import create_storage_backend
+
+    handler = create_storage_backend()
+    try:
+        for route_id in args.route_ids:
+            start = time.perf_counter()
+            try:
+                deleted = await delete_route_cascade(handler, route_id, args.chunk_size)
+                print(f"route {route_id}: deleted {deleted} points in {time.perf_counter() - start:.2f}s")
+            except Exception as e:
+                print(f"route {route_id} failed: {e}")
+    finally:
+        await handler.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete routes and their points in bounded chunks")
+    parser.add_argument("route_ids", nargs="+", type=int)
+    parser.add_argument("--chunk-size", type=int, default=None, help="points per delete (default POINT_DELETE_CHUNK)")
+    args = parser.parse_args()
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
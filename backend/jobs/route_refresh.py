@@ -0,0 +1,247 @@
+"""Recompute everything derived from a route's POINTS.
+
+Used after point ingest (through route_refresher, which coalesces the
+refreshes of each route) and as a batch job over many routes:
+
+    python -m jobs.route_refresh --all --concurrency 8
+    python -m jobs.route_refresh 12 13 14 --metrics-only
+"""
+import argparse
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Tuple, Optional, Callable, Set
+from geo.route_lod import build_route_lods
+from geo.route_metrics import points_to_arrays, compute_route_metrics, route_metrics_accumulator
+from storage.base import ROUTE_POINT_KEYSET
+from supabase_handler.pagination import encode_cursor
+from .segment_match import match_route_segments
+
+# Levels of detail and segment matches are rebuilt once a route has had no new
+# points for ROUTE_REFRESH_DELAY_S, and at most ROUTE_REFRESH_MAX_DELAY_S after
+# the first request, so a route being recorded live still gets them
+ROUTE_REFRESH_DELAY_S = float(os.getenv("ROUTE_REFRESH_DELAY_S", "5"))
+ROUTE_REFRESH_MAX_DELAY_S = float(os.getenv("ROUTE_REFRESH_MAX_DELAY_S", "60"))
+# Routes whose metrics accumulator is kept between ingest calls
+ROUTE_METRICS_CACHED = int(os.getenv("ROUTE_METRICS_CACHED", "10000"))
+METRICS_PAGE_POINTS = 5000
+
+
+def derive_route(route_id: int, points: List[Dict[str, Any]], lods: bool = True) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """CPU part of a refresh: (ROUTE_LOD rows, ROUTE metric columns or None)."""
+    lod_rows = build_route_lods(route_id, points) if lods else []
+    metrics = None
+    if len(points) >= 2:
+        metrics = compute_route_metrics(*points_to_arrays(points))
+    return lod_rows, metrics
+
+
+async def refresh_route(handler, route_id: int, lods: bool = True, segments: bool = True,
+                        metrics: bool = True) -> int:
+    """Fetch a route's points once, rebuild its LODs and metrics and match segments. Returns the point count."""
+    points = await handler.get_points_by_route(route_id)
+    lod_rows, route_metrics = await asyncio.to_thread(derive_route, route_id, points, lods)
+    if lods:
+        await handler.replace_route_lods(route_id, lod_rows)
+    if metrics and route_metrics:
+        await handler.update_route(route_id, route_metrics)
+    if segments:
+        await match_route_segments(handler, route_id, points)
+    return len(points)
+
+
+class route_refresher:
+    """Coalesces the refreshes point ingest asks for, per route.
+
+    Each kind of work runs at most once at a time per route; a request that
+    arrives meanwhile marks the route dirty and one more run follows, so
+    overlapping runs never race on the same rows.
+
+    Metrics follow every request, incrementally: the route's
+    route_metrics_accumulator (kept for the ROUTE_METRICS_CACHED most recent
+    routes) remembers the keyset position of the last point it took, and a
+    run reads only the points after it. A request with no `earliest`, or one
+    whose points are older than the last point taken (an out-of-order
+    upload), starts the route over from its first point. Positions are kept
+    per worker; points another worker inserts out of order are only picked
+    up by the next full pass.
+
+    Levels of detail and segment matches need the whole route, so they wait
+    until the route has been quiet for `delay_s` (at most `max_delay_s`
+    after the first request): a route uploaded in k batches is read and
+    simplified once instead of k times.
+    """
+
+    def __init__(self, handler, delay_s: float = ROUTE_REFRESH_DELAY_S,
+                 max_delay_s: float = ROUTE_REFRESH_MAX_DELAY_S, max_routes: int = ROUTE_METRICS_CACHED,
+                 on_error: Optional[Callable[[int, Exception], None]] = None):
+        self.handler = handler
+        self.delay_s = delay_s
+        self.max_delay_s = max_delay_s
+        self.max_routes = max_routes
+        self.on_error = on_error or (lambda route_id, error: None)
+        # route id -> [accumulator, cursor of the last point it took]
+        self._metrics: "OrderedDict[int, list]" = OrderedDict()
+        self._metrics_dirty: Set[int] = set()
+        self._restart: Set[int] = set()
+        self._metrics_tasks: Dict[int, asyncio.Task] = {}
+        # route id -> (first, last) request time of the pending rebuild
+        self._rebuild_due: Dict[int, Tuple[float, float]] = {}
+        self._rebuild_tasks: Dict[int, asyncio.Task] = {}
+        self._flush = asyncio.Event()
+        self.metrics_runs = 0
+        self.rebuilds = 0
+
+    def schedule(self, route_id: int, earliest: Optional[float] = None, metrics: bool = True, rebuild: bool = True):
+        """Ask for a refresh after points were written; `earliest` is their oldest timestamp in epoch seconds."""
+        if metrics:
+            entry = self._metrics.get(route_id)
+            if earliest is None or entry is None or (entry[0].last is not None and earliest < entry[0].last[2]):
+                self._restart.add(route_id)
+            self._metrics_dirty.add(route_id)
+            if route_id not in self._metrics_tasks:
+                self._metrics_tasks[route_id] = asyncio.get_running_loop().create_task(self._run_metrics(route_id))
+        if rebuild:
+            now = asyncio.get_running_loop().time()
+            first, _ = self._rebuild_due.get(route_id, (now, now))
+            self._rebuild_due[route_id] = (first, now)
+            if route_id not in self._rebuild_tasks:
+                self._rebuild_tasks[route_id] = asyncio.get_running_loop().create_task(self._run_rebuild(route_id))
+
+    def forget(self, route_id: int):
+        """Drop a route's metrics position, e.g. after its points were deleted."""
+        self._metrics.pop(route_id, None)
+        self._restart.add(route_id)
+
+    async def _run_metrics(self, route_id: int):
+        try:
+            while route_id in self._metrics_dirty:
+                self._metrics_dirty.discard(route_id)
+                restart = route_id in self._restart
+                self._restart.discard(route_id)
+                try:
+                    await self._update_metrics(route_id, restart)
+                except Exception as e:
+                    # Whether the metrics were written is unknown; the next run starts over
+                    self.forget(route_id)
+                    self.on_error(route_id, e)
+        finally:
+            del self._metrics_tasks[route_id]
+
+    async def _update_metrics(self, route_id: int, restart: bool):
+        entry = self._metrics.get(route_id)
+        if restart or entry is None:
+            entry = self._metrics[route_id] = [route_metrics_accumulator(), None]
+        self._metrics.move_to_end(route_id)
+        while len(self._metrics) > self.max_routes:
+            self._metrics.popitem(last=False)
+        accumulator = entry[0]
+        taken = 0
+        while True:
+            rows, more = await self.handler.list_route_points(
+                route_id, METRICS_PAGE_POINTS, entry[1], ["id", "lat", "lng", "timestamp"]
+            )
+            if rows:
+                # Position and accumulator move together, so the entry is consistent between pages
+                accumulator.add(*points_to_arrays(rows))
+                entry[1] = encode_cursor([rows[-1][col] for col, _ in ROUTE_POINT_KEYSET])
+                taken += len(rows)
+            if more is None:
+                break
+        self.metrics_runs += 1
+        if (taken or restart) and accumulator.count >= 2:
+            await self.handler.update_route(route_id, accumulator.result())
+
+    async def _run_rebuild(self, route_id: int):
+        loop = asyncio.get_running_loop()
+        try:
+            while route_id in self._rebuild_due:
+                first, last = self._rebuild_due[route_id]
+                wait = min(last + self.delay_s, first + self.max_delay_s) - loop.time()
+                if wait > 0 and not self._flush.is_set():
+                    try:
+                        await asyncio.wait_for(self._flush.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                del self._rebuild_due[route_id]
+                try:
+                    await refresh_route(self.handler, route_id, metrics=False)
+                    self.rebuilds += 1
+                except Exception as e:
+                    self.on_error(route_id, e)
+        finally:
+            del self._rebuild_tasks[route_id]
+
+    async def aclose(self):
+        """Run pending rebuilds now, without waiting out their delay, and wait for every run."""
+        self._flush.set()
+        while self._metrics_tasks or self._rebuild_tasks:
+            await asyncio.gather(*self._metrics_tasks.values(), *self._rebuild_tasks.values(),
+                                 return_exceptions=True)
+
+
+async def refresh_routes(handler, route_ids: List[int], concurrency: int = 8, lods: bool = True,
+                         segments: bool = True, metrics: bool = True) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    failures: Dict[int, str] = {}
+
+    async def one(route_id: int) -> int:
+        async with semaphore:
+            try:
+                return await refresh_route(handler, route_id, lods, segments, metrics)
+            except Exception as e:
+                failures[route_id] = str(e)
+                return 0
+
+    start = time.perf_counter()
+    counts = await asyncio.gather(*(one(r) for r in route_ids))
+    elapsed = time.perf_counter() - start
+    return {
+        "routes": len(route_ids),
+        "points": sum(counts),
+        "seconds": elapsed,
+        "failures": failures,
+    }
+
+
+async def _main(args):
+    from storage.factory import create_storage_backend
+
+    handler = create_storage_backend()
+    try:
+        route_ids = args.route_ids
+        if args.all:
+            route_ids, cursor = [], None
+            while True:
+                rows, cursor = await handler.list_routes(500, cursor, fields=["id"], allowed_fields=["id"])
+                route_ids.extend(r["id"] for r in rows)
+                if cursor is None:
+                    break
+        report = await refresh_routes(handler, route_ids, args.concurrency, lods=not args.metrics_only,
+                                      segments=not args.metrics_only)
+    finally:
+        await handler.aclose()
+
+    seconds = max(report["seconds"], 1e-9)
+    print(f"Refreshed {report['routes']} routes / {report['points']} points in {seconds:.2f}s "
+          f"({report['routes'] / seconds:.1f} routes/s, {report['points'] / seconds:.0f} points/s)")
+    for route_id, error in report["failures"].items():
+        print(f"  route {route_id} failed: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute route metrics and levels of detail from POINTS")
+    parser.add_argument("route_ids", nargs="*", type=int)
+    parser.add_argument("--all", action="store_true", help="refresh every route")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--metrics-only", action="store_true", help="skip rebuilding levels of detail and segment matching")
+    args = parser.parse_args()
+    if not args.route_ids and not args.all:
+        parser.error("pass route ids or --all")
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
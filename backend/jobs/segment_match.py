@@ -0,0 +1,45 @@
+"""Incremental segment matching.
+
+Both directions only look at spatial candidates: a route is compared with the
+segments starting near it, and a new segment with the routes that pass its
+start point.
+"""
+import asyncio
+from typing import Any, Dict, List
+from geo.segments import MATCH_TOLERANCE_M, candidate_cells, match_route
+from geo.route_metrics import points_to_arrays
+
+
+async def match_route_segments(handler, route_id: int, points: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Match one route against nearby segments; returns the efforts that became personal bests."""
+    if len(points) < 2:
+        return []
+    route = await handler.get_route_by_id(route_id)
+    if not route or not route.get("user_reference"):
+        return []
+    lat, lng, _ = points_to_arrays(points)
+    segments = await handler.get_segments_by_start_cells(candidate_cells(lat, lng))
+    if not segments:
+        return []
+    efforts = await asyncio.to_thread(match_route, route, points, segments)
+    return await handler.record_segment_efforts(efforts)
+
+
+async def match_segment_routes(handler, segment: Dict[str, Any], concurrency: int = 4) -> int:
+    """Match every route passing a new segment's start. Returns the number of efforts kept."""
+    # One row per route near the start rather than every point there
+    nearby = await handler.nearest_route_points(segment["start_lat"], segment["start_lng"], MATCH_TOLERANCE_M)
+    route_ids = sorted({p["route_id"] for p in nearby})
+    routes = {r["id"]: r for r in await handler.get_routes_by_ids(route_ids)}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(route_id: int) -> List[Dict[str, Any]]:
+        async with semaphore:
+            route = routes.get(route_id)
+            if not route or not route.get("user_reference"):
+                return []
+            points = await handler.get_points_by_route(route_id)
+            return await asyncio.to_thread(match_route, route, points, [segment])
+
+    efforts = [e for batch in await asyncio.gather(*(one(r) for r in route_ids)) for e in batch]
+    return len(await handler.record_segment_efforts(efforts))
@@ -0,0 +1,76 @@
+"""Rebuild USER_STATS buckets from the activity history.
+
+Activity writes keep the buckets current through deltas; this recomputes
+them from scratch, to backfill existing users or repair drift:
+
+    python -m jobs.stats_rebuild --all --concurrency 8
+    python -m jobs.stats_rebuild 123e4567-e89b-12d3-a456-426614174000
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List
+from aggregates.activity_totals import STATS_PERIODS, aggregate_activities
+
+
+async def rebuild_user_stats(handler, user_id: str) -> int:
+    """Replace one user's buckets. Returns the number of buckets written."""
+    # All of them: the PostgREST backend reads past max-rows in pages
+    activities = await handler.get_user_activities(user_id)
+    rows = await asyncio.to_thread(aggregate_activities, activities, STATS_PERIODS)
+    await handler.replace_user_stats(user_id, [{k: v for k, v in r.items() if k != "user_reference"} for r in rows])
+    return len(rows)
+
+
+async def rebuild_users(handler, user_ids: List[str], concurrency: int = 8) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    failures: Dict[str, str] = {}
+
+    async def one(user_id: str) -> int:
+        async with semaphore:
+            try:
+                return await rebuild_user_stats(handler, user_id)
+            except Exception as e:
+                failures[user_id] = str(e)
+                return 0
+
+    start = time.perf_counter()
+    counts = await asyncio.gather(*(one(u) for u in user_ids))
+    return {
+        "users": len(user_ids),
+        "buckets": sum(counts),
+        "seconds": time.perf_counter() - start,
+        "failures": failures,
+    }
+
+
+async def _main(args):
+    from storage.factory import create_storage_backend
+
+    handler = create_storage_backend()
+    try:
+        user_ids = args.user_ids
+        if args.all:
+            user_ids = await handler.get_activity_user_ids()
+        report = await rebuild_users(handler, user_ids, args.concurrency)
+    finally:
+        await handler.aclose()
+
+    print(f"Rebuilt stats for {report['users']} users ({report['buckets']} buckets) in {report['seconds']:.2f}s")
+    for user_id, error in report["failures"].items():
+        print(f"  user {user_id} failed: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild per-user stats buckets from activities")
+    parser.add_argument("user_ids", nargs="*")
+    parser.add_argument("--all", action="store_true", help="rebuild every user with activities")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    if not args.user_ids and not args.all:
+        parser.error("pass user ids or --all")
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
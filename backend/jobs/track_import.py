@@ -0,0 +1,64 @@
+"""Import GPX and FIT files as routes, several files at a time.
+
+Directories are searched for .gpx and .fit files. Each file becomes one
+route owned by --user; see ingest/track_import.py for how a file is read.
+
+    python -m jobs.track_import --user 123e4567-e89b-12d3-a456-426614174000 ~/exports --workers 8
+    python -m jobs.track_import --user 123e4567-e89b-12d3-a456-426614174000 a.gpx b.fit --refresh
+"""
+import argparse
+import asyncio
+import os
+from functools import partial
+from typing import List
+from ingest.track_import import IMPORT_CHUNK_POINTS, IMPORT_WORKERS, import_tracks, track_format
+from .route_refresh import refresh_routes
+
+
+def track_files(paths: List[str]) -> List[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, n) for n in sorted(names) if track_format(n))
+        else:
+            files.append(path)
+    return files
+
+
+async def _main(args):
+    from storage.factory import create_storage_backend
+
+    handler = create_storage_backend()
+    try:
+        files = track_files(args.paths)
+        report = await import_tracks(
+            handler, [(f, partial(open, f, "rb")) for f in files], args.user, args.workers, args.chunk_size
+        )
+        route_ids = [f["route_id"] for f in report["files"] if f["status"] == "ok"]
+        if args.refresh and route_ids:
+            # Imports write their metrics as they go; only levels of detail and segment matches are left
+            await refresh_routes(handler, route_ids, args.workers, metrics=False)
+    finally:
+        await handler.aclose()
+
+    print(f"Imported {report['routes']} of {len(files)} files, {report['points']} points in "
+          f"{report['seconds']:.2f}s ({report['points_per_second']:.0f} points/s)")
+    for f in report["files"]:
+        if f["status"] != "ok":
+            print(f"  {f['name']} {f['status']}: {f['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import GPX/FIT files as routes")
+    parser.add_argument("paths", nargs="+", help="files or directories")
+    parser.add_argument("--user", required=True, help="user id that will own the routes")
+    parser.add_argument("--workers", type=int, default=IMPORT_WORKERS, help="files imported at a time")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_POINTS, help="points per insert")
+    parser.add_argument("--refresh", action="store_true", help="build levels of detail and match segments afterwards")
+    args = parser.parse_args()
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,63 @@
-from fastapi import FastAPI, Response, Depends, HTTPException, status, Request
+import asyncio
+import json
+import tempfile
+import time
+import zipfile
+from contextlib import asynccontextmanager, nullcontext
+from functools import partial
+from fastapi import (
+    FastAPI, Response, Depends, HTTPException, status, Request, Query, Path, BackgroundTasks, WebSocket,
+    WebSocketDisconnect
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel, Field
-from datetime import date as Date, time as Time, datetime
-from typing import Optional, List
+from pydantic import BaseModel, Field, ValidationError
+from datetime import date as Date, time as Time, datetime, timedelta, timezone
+from typing import Optional, List, Union
+import requests
 from supabase_handler.supabase_handler import supabase_handler
+from supabase_handler.async_supabase_handler import async_supabase_handler
+from storage.base import storage_backend, POINT_DELETE_CHUNK
+from storage.factory import create_storage_backend
+from ingest.ndjson import ingest_ndjson
+from ingest import point_codec
+from ingest.live import live_message, live_session
+from exports.route_export import EXPORT_FORMATS, route_chunks, user_routes_zip
+from ingest.track_import import IMPORT_SPOOL_BYTES, MAX_IMPORT_BYTES, import_tracks
+from ingest.write_behind import POINT_WRITE_BEHIND, point_write_buffer, write_buffer_full
+from geo.route_lod import requested_tolerance
+from geo.spatial import parse_bbox, parse_lat_lng
+from supabase_handler.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, select_columns
+from jobs.route_refresh import route_refresher
+from jobs.segment_match import match_segment_routes
+from jobs.leaderboard_rebuild import rebuild_member
+from jobs.route_delete import route_deletions as route_deletion_tracker, delete_route_cascade
+from aggregates.activity_totals import METRICS as STATS_METRICS, period_start, period_starts
+from geo.segments import segment_geometry
+from geo.polyline import DEFAULT_PRECISION, MAX_PRECISION, format_points
+from geo.heatmap import HEATMAP_MAX_ZOOM, HEATMAP_TILE_BINS, grid_cells, render_png, tile_bin_range, tile_grid
+from geo.tile_cache import disk_tile_cache, group_scope, tile_key, user_scope
+from instrumentation.log import configure_logging, get_logger
+from instrumentation.metrics import (
+    REGISTRY, UPSTREAM_CALL_SECONDS, UPSTREAM_ERRORS, JWT_VERIFY_SECONDS, callback_metric
+)
+from instrumentation.middleware import compression_middleware, timing_middleware
+from instrumentation.responses import timed_json_response, trusted_response, trusted_rows
+from instrumentation.timing import instrument, timed
+
+configure_logging()
+logger = get_logger("api")
+
+# A bbox read is one query; PostgREST's max-rows (1000 by default) caps it, so both backends stop there
+MAX_BBOX_POINTS = 1000
+MAX_NEAR_RADIUS_M = 50000
+MAX_STATS_BUCKETS = 400
+DEFAULT_STATS_BUCKETS = {"day": 30, "week": 12, "month": 12}
+MAX_MULTI_GET_IDS = 100
+
+# Tasks started with spawn(), awaited on shutdown
+background_jobs = set()
 
 class ActivityCreate(BaseModel):
     route: str = Field(..., description="Route or path taken for the activity", example="Central Park Loop")
@@ -101,6 +155,11 @@ class RouteResponse(BaseModel):
     endedAt: datetime = Field(..., description="Timestamp when the route ended")
     distanceKm: float = Field(..., description="Total distance covered in kilometers")
     avgSpeedKmh: float = Field(..., description="Average speed in kilometers per hour")
+    durationS: Optional[float] = Field(None, description="Elapsed time between first and last point in seconds")
+    movingTimeS: Optional[float] = Field(None, description="Time spent moving in seconds, derived from points")
+    maxSpeedKmh: Optional[float] = Field(None, description="Maximum speed in kilometers per hour, derived from points")
+    avgMovingSpeedKmh: Optional[float] = Field(None, description="Average speed while moving in kilometers per hour")
+    splitsS: Optional[List[float]] = Field(None, description="Seconds taken for each full kilometer")
 
     class Config:
         json_schema_extra = {
@@ -113,17 +172,39 @@ class RouteResponse(BaseModel):
             }
         }
 
+class RouteDeletionResponse(BaseModel):
+    route_id: int = Field(..., description="Route being deleted")
+    status: str = Field(..., description="running, done or failed")
+    deleted_points: int = Field(..., description="Points deleted so far")
+    started_at: datetime = Field(..., description="When the deletion started")
+    finished_at: Optional[datetime] = Field(None, description="When the deletion finished or failed")
+    error: Optional[str] = Field(None, description="Why the deletion failed")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "route_id": 1,
+                "status": "running",
+                "deleted_points": 25000,
+                "started_at": "2025-11-24T10:00:00Z",
+                "finished_at": None,
+                "error": None
+            }
+        }
+
 class PointCreate(BaseModel):
     lat: float = Field(..., description="Latitude coordinate", example=40.7128)
     lng: float = Field(..., description="Longitude coordinate", example=-74.0060)
     timestamp: datetime = Field(..., description="Timestamp when the point was recorded", example="2025-11-24T10:00:00Z")
+    route_id: Optional[int] = Field(None, description="Route this point belongs to", example=1)
 
     class Config:
         json_schema_extra = {
             "example": {
                 "lat": 40.7128,
                 "lng": -74.0060,
-                "timestamp": "2025-11-24T10:00:00Z"
+                "timestamp": "2025-11-24T10:00:00Z",
+                "route_id": 1
             }
         }
 
@@ -145,6 +226,7 @@ class PointResponse(BaseModel):
     lat: float = Field(..., description="Latitude coordinate")
     lng: float = Field(..., description="Longitude coordinate")
     timestamp: datetime = Field(..., description="Timestamp when the point was recorded")
+    route_id: Optional[int] = Field(None, description="Route this point belongs to")
 
     class Config:
         json_schema_extra = {
@@ -152,7 +234,156 @@ class PointResponse(BaseModel):
                 "id": 1,
                 "lat": 40.7128,
                 "lng": -74.0060,
-                "timestamp": "2025-11-24T10:00:00Z"
+                "timestamp": "2025-11-24T10:00:00Z",
+                "route_id": 1
+            }
+        }
+
+class PointsByIdsResponse(BaseModel):
+    points: List[PointResponse] = Field(..., description="Points found, in the order requested")
+    missing: List[int] = Field(..., description="Requested ids with no point")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "points": [{"id": 3, "lat": 40.7128, "lng": -74.0060, "timestamp": "2025-11-24T10:00:00Z", "route_id": 1}],
+                "missing": [7]
+            }
+        }
+
+class SegmentPoint(BaseModel):
+    lat: float = Field(..., description="Latitude coordinate", ge=-90, le=90)
+    lng: float = Field(..., description="Longitude coordinate", ge=-180, le=180)
+
+class SegmentCreate(BaseModel):
+    name: str = Field(..., description="Name of the segment", example="Park Hill Climb")
+    points: List[SegmentPoint] = Field(..., description="Polyline from start to finish", min_length=2)
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "name": "Park Hill Climb",
+                "points": [
+                    {"lat": 40.7812, "lng": -73.9665},
+                    {"lat": 40.7851, "lng": -73.9632},
+                    {"lat": 40.7880, "lng": -73.9601}
+                ]
+            }
+        }
+
+class SegmentResponse(BaseModel):
+    id: int = Field(..., description="Unique identifier for the segment")
+    name: str = Field(..., description="Name of the segment")
+    points: List[SegmentPoint] = Field(..., description="Simplified polyline from start to finish")
+    distance_m: float = Field(..., description="Length of the segment in meters")
+    created_by: Optional[str] = Field(None, description="User ID who created the segment")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "id": 1,
+                "name": "Park Hill Climb",
+                "points": [{"lat": 40.7812, "lng": -73.9665}, {"lat": 40.7880, "lng": -73.9601}],
+                "distance_m": 905.2,
+                "created_by": "123e4567-e89b-12d3-a456-426614174000"
+            }
+        }
+
+class SegmentEffortResponse(BaseModel):
+    rank: int = Field(..., description="Position on the leaderboard, starting at 1")
+    user_reference: str = Field(..., description="User ID of the athlete")
+    route_id: int = Field(..., description="Route the best effort was recorded on")
+    elapsed_s: float = Field(..., description="Time from segment start to finish in seconds")
+    started_at: datetime = Field(..., description="When the effort started")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "rank": 1,
+                "user_reference": "123e4567-e89b-12d3-a456-426614174000",
+                "route_id": 12,
+                "elapsed_s": 94.0,
+                "started_at": "2025-11-24T10:04:12Z"
+            }
+        }
+
+class GroupCreate(BaseModel):
+    name: str = Field(..., description="Name of the group", example="Sunday Riders", min_length=1, max_length=100)
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "name": "Sunday Riders"
+            }
+        }
+
+class GroupResponse(BaseModel):
+    id: int = Field(..., description="Unique identifier for the group")
+    name: str = Field(..., description="Name of the group")
+    created_by: str = Field(..., description="User ID who created the group")
+    created_at: datetime = Field(..., description="When the group was created")
+    members: Optional[List[str]] = Field(None, description="User IDs of the members, in joining order")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "id": 1,
+                "name": "Sunday Riders",
+                "created_by": "123e4567-e89b-12d3-a456-426614174000",
+                "created_at": "2025-11-24T10:00:00Z",
+                "members": ["123e4567-e89b-12d3-a456-426614174000"]
+            }
+        }
+
+class GroupLeaderboardEntry(BaseModel):
+    rank: int = Field(..., description="Position on the leaderboard, starting at 1")
+    user_reference: str = Field(..., description="User ID of the member")
+    period: str = Field(..., description="Leaderboard period: week or month")
+    period_start: Date = Field(..., description="First day of the period (weeks start on Monday)")
+    distance: int = Field(..., description="Total distance in meters")
+    duration_s: int = Field(..., description="Total activity time in seconds")
+    activities: int = Field(..., description="Number of activities")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "rank": 1,
+                "user_reference": "123e4567-e89b-12d3-a456-426614174000",
+                "period": "week",
+                "period_start": "2025-11-24",
+                "distance": 42195,
+                "duration_s": 12600,
+                "activities": 3
+            }
+        }
+
+class StatsTotals(BaseModel):
+    distance: int = Field(..., description="Total distance in meters")
+    duration_s: int = Field(..., description="Total activity time in seconds")
+    activities: int = Field(..., description="Number of activities")
+
+class StatsBucket(StatsTotals):
+    period_start: Date = Field(..., description="First day of the bucket (weeks start on Monday)")
+
+class UserStatsResponse(BaseModel):
+    granularity: str = Field(..., description="Bucket size: day, week or month")
+    from_: Date = Field(..., alias="from", description="First day covered (start of the first bucket)")
+    to: Date = Field(..., description="Last day requested")
+    totals: StatsTotals = Field(..., description="Sum over all buckets")
+    buckets: List[StatsBucket] = Field(..., description="One entry per bucket, oldest first, including empty ones")
+
+    class Config:
+        populate_by_name = True
+        json_schema_extra = {
+            "example": {
+                "granularity": "week",
+                "from": "2025-11-17",
+                "to": "2025-11-30",
+                "totals": {"distance": 12000, "duration_s": 5400, "activities": 3},
+                "buckets": [
+                    {"period_start": "2025-11-17", "distance": 5000, "duration_s": 1800, "activities": 1},
+                    {"period_start": "2025-11-24", "distance": 7000, "duration_s": 3600, "activities": 2}
+                ]
             }
         }
 
@@ -173,12 +404,43 @@ tags_metadata = [
         "name": "Points",
         "description": "Manage GPS coordinate points for routes. All endpoints require JWT authentication.",
     },
+    {
+        "name": "Segments",
+        "description": "Segments matched against recorded routes, with best-effort leaderboards. All endpoints require JWT authentication.",
+    },
+    {
+        "name": "Users",
+        "description": "Per-user summaries built from activities. All endpoints require JWT authentication.",
+    },
+    {
+        "name": "Groups",
+        "description": "Groups of users with weekly and monthly leaderboards. All endpoints require JWT authentication.",
+    },
+    {
+        "name": "Maps",
+        "description": "Map tiles drawn from recorded points. All endpoints require JWT authentication.",
+    },
     {
         "name": "Health",
         "description": "Health check endpoints.",
     },
 ]
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Write queued single points and let live-recording flushes finish,
+    # then close pooled upstream connections
+    if point_writer is not None:
+        await point_writer.aclose()
+    if background_jobs:
+        await asyncio.gather(*background_jobs, return_exceptions=True)
+    await route_refreshes.aclose()
+    await async_supabase.aclose()
+    if storage is not async_supabase:
+        await storage.aclose()
+    supabase.jwks_manager.stop()
+
 app = FastAPI(
     title="Carva API",
     description="API for managing user activities with Supabase authentication",
@@ -186,29 +448,96 @@ app = FastAPI(
     openapi_tags=tags_metadata,
     docs_url="/docs",
     redoc_url="/redoc",
-    openapi_url="/openapi.json"
+    openapi_url="/openapi.json",
+    lifespan=lifespan,
+    default_response_class=timed_json_response
 )
-
-print("FastAPI server starting up...")
-
-supabase: supabase_handler = supabase_handler()
+# Added first so it runs inside timing_middleware, which then times compression too
+app.add_middleware(compression_middleware)
+app.add_middleware(timing_middleware)
+
+logger.info("FastAPI server starting up")
+
+# JWT verification stays on the sync handler and sign-up/sign-in on the async one;
+# table I/O goes through the storage backend picked by STORAGE_BACKEND
+supabase: supabase_handler = supabase_handler(jwks_http_get=timed(
+    requests.get, UPSTREAM_CALL_SECONDS, UPSTREAM_ERRORS, component="jwks_manager", method="_fetch"
+))
+async_supabase: async_supabase_handler = async_supabase_handler()
+storage: storage_backend = create_storage_backend(supabase_backend=async_supabase)
+route_deletions = route_deletion_tracker()
+# Rendered heatmap tiles; point writes through `storage` drop the tiles they change
+heatmap_tiles = disk_tile_cache()
+storage.heatmap_tiles = heatmap_tiles
+
+# Time every data-layer method and raw PostgREST request (JWKS fetches are timed above)
+instrument(supabase, UPSTREAM_CALL_SECONDS, "supabase_handler", UPSTREAM_ERRORS)
+instrument(async_supabase, UPSTREAM_CALL_SECONDS, "async_supabase_handler", UPSTREAM_ERRORS)
+if storage is not async_supabase:
+    instrument(storage, UPSTREAM_CALL_SECONDS, type(storage).__name__, UPSTREAM_ERRORS)
+
+# Opt-in: coalesce concurrent POST /points/ inserts into batches (ingest/write_behind.py);
+# built after instrument() so its batch writes are timed too
+point_writer = point_write_buffer(storage.create_points_batch) if POINT_WRITE_BEHIND else None
+if point_writer is not None:
+    REGISTRY.register(callback_metric(
+        "carva_point_write_batches_total", "Batched inserts written for single-point requests", "counter",
+        lambda: [({}, point_writer.batches)],
+    ))
+    REGISTRY.register(callback_metric(
+        "carva_point_write_queued", "Single-point rows queued or being written", "gauge",
+        lambda: [({}, point_writer.queued)],
+    ))
+
+def log_refresh_error(route_id: int, error: Exception):
+    logger.warning("Failed to refresh derived data", extra={"fields": {"route_id": route_id, "error": str(error)}})
+
+# Derived route data after point writes, coalesced per route (jobs/route_refresh.py)
+route_refreshes = route_refresher(storage, on_error=log_refresh_error)
+
+REGISTRY.register(callback_metric(
+    "carva_cache_hits_total", "Cache hits by cache", "counter",
+    lambda: [({"cache": "jwt"}, supabase.token_cache.hits), ({"cache": "read"}, storage.cache.hits),
+             ({"cache": "tiles"}, heatmap_tiles.hits)],
+))
+REGISTRY.register(callback_metric(
+    "carva_cache_misses_total", "Cache misses by cache", "counter",
+    lambda: [({"cache": "jwt"}, supabase.token_cache.misses), ({"cache": "read"}, storage.cache.misses),
+             ({"cache": "tiles"}, heatmap_tiles.misses)],
+))
+REGISTRY.register(callback_metric(
+    "carva_jwks_fetches_total", "JWKS documents fetched from the auth server", "counter",
+    lambda: [({}, supabase.jwks_manager.fetch_count)],
+))
+
+async def verify_token(token: str, path: str) -> dict:
+    # Shared by JWTBearer and the WebSocket endpoints; raises on an invalid token
+    start = time.perf_counter()
+    outcome = "cached"
+    try:
+        # Delegate auth to supabase_handler
+        payload = supabase.token_cache.get(token)
+        if payload is None:
+            outcome = "verified"
+            # Cache misses may hit the JWKS endpoint, keep them off the event loop
+            payload = await run_in_threadpool(supabase.decode_jwt, token)
+        return payload
+    except Exception as e:
+        outcome = "rejected"
+        logger.info("JWT rejected", extra={"fields": {"path": path, "error": str(e)}})
+        raise
+    finally:
+        JWT_VERIFY_SECONDS.observe(time.perf_counter() - start, outcome=outcome)
 
 class JWTBearer(HTTPBearer):
     def __init__(self, auto_error: bool = True):
         super().__init__(auto_error=auto_error)
 
     async def __call__(self, request: Request):
-        print("JWTBearer.__call__ method called")
-        print("Request headers:", dict(request.headers))
         credentials: HTTPAuthorizationCredentials = await super().__call__(request)
-        print("Credentials received:", credentials)
         if credentials:
-            print("Verifying JWT token...")
             try:
-                # Delegate auth to supabase_handler
-                print("Token to verify:", credentials.credentials)
-                payload = supabase.verify_jwt(credentials.credentials)
-                return payload
+                return await verify_token(credentials.credentials, request.url.path)
             except Exception as e:
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN,
@@ -220,6 +549,73 @@ class JWTBearer(HTTPBearer):
                 detail="Invalid authorization code.",
             )
 
+def spawn(coro):
+    # Fire-and-forget work not tied to a request (WebSocket handlers have no BackgroundTasks)
+    task = asyncio.get_running_loop().create_task(coro)
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
+    return task
+
+def schedule_route_refresh(earliest_by_route: dict, metrics: bool = True):
+    # Metrics, levels of detail and segment matches after points were written to
+    # these routes; route_refreshes coalesces repeated requests for one route
+    for route_id, earliest in earliest_by_route.items():
+        if route_id is not None:
+            route_refreshes.schedule(route_id, earliest, metrics=metrics)
+
+def note_earliest(earliest_by_route: dict, route_id: Optional[int], when: datetime):
+    # Oldest new point per route, in epoch seconds; naive timestamps are stored as UTC
+    seconds = (when if when.tzinfo else when.replace(tzinfo=timezone.utc)).timestamp()
+    earliest_by_route[route_id] = min(earliest_by_route.get(route_id, seconds), seconds)
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    # Answer If-None-Match with a bodiless 304; otherwise tag the outgoing response
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    return [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+def parse_ids(ids: str) -> List[int]:
+    # `ids=3,1,2` for multi-gets: request order is kept, repeats are dropped
+    try:
+        parsed = list(dict.fromkeys(int(i) for i in ids.split(",") if i.strip()))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ids must be comma-separated integers")
+    if not parsed:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ids must not be empty")
+    if len(parsed) > MAX_MULTI_GET_IDS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {MAX_MULTI_GET_IDS} ids per request")
+    return parsed
+
+def in_requested_order(rows: List[dict], ids: List[int], fields: Optional[str] = None, model: Optional[type] = None):
+    # (rows ordered like `ids`, ids with no row), projected to `fields` like the list endpoints
+    columns = parse_fields(fields)
+    if columns:
+        try:
+            select_columns(columns, list(model.model_fields), [])
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    by_id = {row["id"]: row for row in rows}
+    found = [by_id[i] for i in ids if i in by_id]
+    if columns:
+        found = [{c: row.get(c) for c in columns} for row in found]
+    return found, [i for i in ids if i not in by_id]
+
+async def fetch_page(list_method, *args, limit: int, cursor: Optional[str], fields: Optional[str], model: type):
+    # Shared by the list endpoints: bad cursors and unknown fields are client errors.
+    # Returns ((rows, next_cursor), etag).
+    try:
+        return await list_method(
+            *args, limit=limit, cursor=cursor, fields=parse_fields(fields), allowed_fields=list(model.model_fields)
+        )
+    except (InvalidCursor, ValueError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
 @app.get(
     "/",
     tags=["Health"],
@@ -236,9 +632,29 @@ class JWTBearer(HTTPBearer):
         }
     }
 )
-def read_root():
+async def read_root():
     return {"Hello": "World"}
 
+@app.get(
+    "/metrics",
+    tags=["Health"],
+    summary="Prometheus metrics",
+    description="Request, upstream call, JWT verification and serialization latency histograms plus cache counters, in the Prometheus text format.",
+    response_class=PlainTextResponse,
+    responses={
+        200: {
+            "description": "Metrics in Prometheus exposition format",
+            "content": {
+                "text/plain": {
+                    "example": "carva_cache_hits_total{cache=\"jwt\"} 42"
+                }
+            }
+        }
+    }
+)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=REGISTRY.CONTENT_TYPE)
+
 @app.post(
     "/signup/",
     tags=["Authentication"],
@@ -264,8 +680,8 @@ def read_root():
         }
     }
 )
-def sign_up(email: str, password: str):
-    response = supabase.sign_up_user(email, password)
+async def sign_up(email: str, password: str):
+    response = await async_supabase.sign_up_user(email, password)
     return response
 
 @app.post(
@@ -293,8 +709,8 @@ def sign_up(email: str, password: str):
         }
     }
 )
-def sign_in(email: str, password: str):
-    response = supabase.sign_in_user(email, password)
+async def sign_in(email: str, password: str):
+    response = await async_supabase.sign_in_user(email, password)
     return response
 
 @app.get(
@@ -322,7 +738,7 @@ def sign_in(email: str, password: str):
         }
     }
 )
-def protected_route(user_claims: dict = Depends(JWTBearer())):
+async def protected_route(user_claims: dict = Depends(JWTBearer())):
     # user_claims come from supabase_handler.verify_jwt
     return {"user_claims": user_claims}
 
@@ -347,7 +763,7 @@ def protected_route(user_claims: dict = Depends(JWTBearer())):
         }
     }
 )
-def create_activity(activity: ActivityCreate, user_claims: dict = Depends(JWTBearer())):
+async def create_activity(activity: ActivityCreate, user_claims: dict = Depends(JWTBearer())):
     user_id = user_claims.get("sub")
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
@@ -356,7 +772,7 @@ def create_activity(activity: ActivityCreate, user_claims: dict = Depends(JWTBea
     activity_data["time"] = activity_data["time"].isoformat()
     activity_data["date"] = activity_data["date"].isoformat()
 
-    result = supabase.create_activity(activity_data, user_id)
+    result = await storage.create_activity(activity_data, user_id)
     if not result:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create activity")
     return result
@@ -365,7 +781,13 @@ def create_activity(activity: ActivityCreate, user_claims: dict = Depends(JWTBea
     "/activities/",
     tags=["Activities"],
     summary="Get all activities",
-    description="Retrieve all activities for the authenticated user. Requires JWT authentication.",
+    description=(
+        "Retrieve the authenticated user's activities, newest first, one page at a time. Pass the returned "
+        "`next_cursor` as `cursor` to get the next page; it is null on the last page. `fields` limits the "
+        "returned columns. With `ids=3,1,2` it instead returns those activities in the order given, in one "
+        f"query, listing ids that do not exist or are not yours in `missing` (at most {MAX_MULTI_GET_IDS} ids). "
+        "Requires JWT authentication."
+    ),
     responses={
         200: {
             "description": "Activities retrieved successfully",
@@ -383,11 +805,18 @@ def create_activity(activity: ActivityCreate, user_claims: dict = Depends(JWTBea
                                 "title": "Morning Run",
                                 "user_reference": "123e4567-e89b-12d3-a456-426614174000"
                             }
-                        ]
+                        ],
+                        "next_cursor": "WyIyMDI1LTExLTI0IiwxXQ"
                     }
                 }
             }
         },
+        400: {
+            "description": "Malformed cursor, unknown field, or malformed or too many ids"
+        },
+        304: {
+            "description": "Not modified since the ETag sent in If-None-Match"
+        },
         401: {
             "description": "Invalid or missing authentication"
         },
@@ -396,13 +825,34 @@ def create_activity(activity: ActivityCreate, user_claims: dict = Depends(JWTBea
         }
     }
 )
-def get_activities(user_claims: dict = Depends(JWTBearer())):
+async def get_activities(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Maximum number of activities to return"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,title,date"),
+    ids: Optional[str] = Query(None, description="Comma-separated activity ids to fetch, e.g. 3,1,2"),
+    user_claims: dict = Depends(JWTBearer())
+):
     user_id = user_claims.get("sub")
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
 
-    activities = supabase.get_user_activities(user_id)
-    return {"activities": activities}
+    if ids is not None:
+        if cursor is not None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ids cannot be combined with cursor")
+        activity_ids = parse_ids(ids)
+        rows = await storage.get_activities_by_ids(activity_ids, user_id)
+        activities, missing = in_requested_order(rows, activity_ids, fields, ActivityResponse)
+        return trusted_response({"activities": activities, "missing": missing, "next_cursor": None})
+
+    (activities, next_cursor), etag = await fetch_page(
+        storage.list_user_activities_with_etag, user_id,
+        limit=limit, cursor=cursor, fields=fields, model=ActivityResponse
+    )
+    return not_modified(request, response, etag) or trusted_response(
+        {"activities": activities, "next_cursor": next_cursor}, response
+    )
 
 @app.get(
     "/activities/{activity_id}",
@@ -414,6 +864,9 @@ def get_activities(user_claims: dict = Depends(JWTBearer())):
         200: {
             "description": "Activity retrieved successfully"
         },
+        304: {
+            "description": "Not modified since the ETag sent in If-None-Match"
+        },
         401: {
             "description": "Invalid or missing authentication"
         },
@@ -425,15 +878,15 @@ def get_activities(user_claims: dict = Depends(JWTBearer())):
         }
     }
 )
-def get_activity(activity_id: int, user_claims: dict = Depends(JWTBearer())):
+async def get_activity(activity_id: int, request: Request, response: Response, user_claims: dict = Depends(JWTBearer())):
     user_id = user_claims.get("sub")
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
 
-    activity = supabase.get_activity_by_id(activity_id, user_id)
+    activity, etag = await storage.get_activity_by_id_with_etag(activity_id, user_id)
     if not activity:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Activity not found")
-    return activity
+    return not_modified(request, response, etag) or activity
 
 @app.put(
     "/activities/{activity_id}",
@@ -456,7 +909,7 @@ def get_activity(activity_id: int, user_claims: dict = Depends(JWTBearer())):
         }
     }
 )
-def update_activity(activity_id: int, activity: ActivityUpdate, user_claims: dict = Depends(JWTBearer())):
+async def update_activity(activity_id: int, activity: ActivityUpdate, user_claims: dict = Depends(JWTBearer())):
     user_id = user_claims.get("sub")
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
@@ -467,7 +920,7 @@ def update_activity(activity_id: int, activity: ActivityUpdate, user_claims: dic
     if "date" in activity_data and activity_data["date"]:
         activity_data["date"] = activity_data["date"].isoformat()
 
-    result = supabase.update_activity(activity_id, activity_data, user_id)
+    result = await storage.update_activity(activity_id, activity_data, user_id)
     if not result:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Activity not found")
     return result
@@ -497,12 +950,12 @@ def update_activity(activity_id: int, activity: ActivityUpdate, user_claims: dic
         }
     }
 )
-def delete_activity(activity_id: int, user_claims: dict = Depends(JWTBearer())):
+async def delete_activity(activity_id: int, user_claims: dict = Depends(JWTBearer())):
     user_id = user_claims.get("sub")
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
 
-    result = supabase.delete_activity(activity_id, user_id)
+    result = await storage.delete_activity(activity_id, user_id)
     return {"message": "Activity deleted successfully", "data": result}
 
 # ROUTE endpoints
@@ -527,7 +980,7 @@ def delete_activity(activity_id: int, user_claims: dict = Depends(JWTBearer())):
         }
     }
 )
-def create_route(route: RouteCreate, user_claims: dict = Depends(JWTBearer())):
+async def create_route(route: RouteCreate, user_claims: dict = Depends(JWTBearer())):
     user_id = user_claims.get("sub")
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
@@ -536,7 +989,7 @@ def create_route(route: RouteCreate, user_claims: dict = Depends(JWTBearer())):
     route_data["startedAt"] = route_data["startedAt"].isoformat()
     route_data["endedAt"] = route_data["endedAt"].isoformat()
 
-    result = supabase.create_route(route_data)
+    result = await storage.create_route(route_data, user_id)
     if not result:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create route")
     return result
@@ -545,11 +998,24 @@ def create_route(route: RouteCreate, user_claims: dict = Depends(JWTBearer())):
     "/routes/",
     tags=["Routes"],
     summary="Get all routes",
-    description="Retrieve all GPS routes. Requires JWT authentication.",
+    description=(
+        "Retrieve GPS routes, most recent first, one page at a time. Pass the returned `next_cursor` as "
+        "`cursor` to get the next page; it is null on the last page. `fields` limits the returned columns. "
+        "With `near=lat,lng` it instead returns up to `limit` routes passing within `radius` metres, nearest "
+        "first, each with `distance_m`. With `ids=3,1,2` it returns those routes in the order given, in one "
+        f"query, listing unknown ids in `missing` (at most {MAX_MULTI_GET_IDS} ids). Routes are public: every "
+        "form lists all users' routes, not only the caller's. Requires JWT authentication."
+    ),
     responses={
         200: {
             "description": "Routes retrieved successfully"
         },
+        400: {
+            "description": "Malformed cursor, unknown field, malformed near, or malformed or too many ids"
+        },
+        304: {
+            "description": "Not modified since the ETag sent in If-None-Match"
+        },
         401: {
             "description": "Invalid or missing authentication"
         },
@@ -558,13 +1024,44 @@ def create_route(route: RouteCreate, user_claims: dict = Depends(JWTBearer())):
         }
     }
 )
-def get_routes(user_claims: dict = Depends(JWTBearer())):
+async def get_routes(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Maximum number of routes to return"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,distanceKm"),
+    near: Optional[str] = Query(None, description="lat,lng to search around, e.g. 52.52,13.405"),
+    radius: float = Query(1000, gt=0, le=MAX_NEAR_RADIUS_M, description="Search radius in metres when near is set"),
+    ids: Optional[str] = Query(None, description="Comma-separated route ids to fetch, e.g. 3,1,2"),
+    user_claims: dict = Depends(JWTBearer())
+):
     user_id = user_claims.get("sub")
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
 
-    routes = supabase.get_all_routes()
-    return {"routes": routes}
+    if ids is not None:
+        if cursor is not None or near is not None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ids cannot be combined with cursor or near")
+        route_ids = parse_ids(ids)
+        routes, missing = in_requested_order(await storage.get_routes_by_ids(route_ids), route_ids, fields, RouteResponse)
+        return trusted_response({"routes": routes, "missing": missing, "next_cursor": None})
+
+    if near is not None:
+        if cursor is not None or fields is not None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="near cannot be combined with cursor or fields")
+        try:
+            lat, lng = parse_lat_lng(near)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        return trusted_response({"routes": await storage.get_routes_near(lat, lng, radius, limit), "next_cursor": None})
+
+    (routes, next_cursor), etag = await fetch_page(
+        storage.list_routes_with_etag,
+        limit=limit, cursor=cursor, fields=fields, model=RouteResponse
+    )
+    return not_modified(request, response, etag) or trusted_response(
+        {"routes": routes, "next_cursor": next_cursor}, response
+    )
 
 @app.get(
     "/routes/{route_id}",
@@ -576,6 +1073,9 @@ def get_routes(user_claims: dict = Depends(JWTBearer())):
         200: {
             "description": "Route retrieved successfully"
         },
+        304: {
+            "description": "Not modified since the ETag sent in If-None-Match"
+        },
         401: {
             "description": "Invalid or missing authentication"
         },
@@ -587,15 +1087,15 @@ def get_routes(user_claims: dict = Depends(JWTBearer())):
         }
     }
 )
-def get_route(route_id: int, user_claims: dict = Depends(JWTBearer())):
+async def get_route(route_id: int, request: Request, response: Response, user_claims: dict = Depends(JWTBearer())):
     user_id = user_claims.get("sub")
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
 
-    route = supabase.get_route_by_id(route_id)
+    route, etag = await storage.get_route_by_id_with_etag(route_id)
     if not route:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Route not found")
-    return route
+    return not_modified(request, response, etag) or route
 
 @app.put(
     "/routes/{route_id}",
@@ -618,7 +1118,7 @@ def get_route(route_id: int, user_claims: dict = Depends(JWTBearer())):
         }
     }
 )
-def update_route(route_id: int, route: RouteUpdate, user_claims: dict = Depends(JWTBearer())):
+async def update_route(route_id: int, route: RouteUpdate, user_claims: dict = Depends(JWTBearer())):
     user_id = user_claims.get("sub")
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
@@ -629,7 +1129,7 @@ def update_route(route_id: int, route: RouteUpdate, user_claims: dict = Depends(
     if "endedAt" in route_data and route_data["endedAt"]:
         route_data["endedAt"] = route_data["endedAt"].isoformat()
 
-    result = supabase.update_route(route_id, route_data)
+    result = await storage.update_route(route_id, route_data)
     if not result:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Route not found")
     return result
@@ -638,26 +1138,306 @@ def update_route(route_id: int, route: RouteUpdate, user_claims: dict = Depends(
     "/routes/{route_id}",
     tags=["Routes"],
     summary="Delete route",
-    description="Delete a route by its ID. Requires JWT authentication.",
+    description=(
+        "Delete a route and all its points. Points are removed in bounded chunks; when a route has more than "
+        "one chunk the rest continues in the background and the response is 202 with a `status_url` that "
+        "reports progress. Requires JWT authentication."
+    ),
     responses={
         200: {
             "description": "Route deleted successfully"
         },
+        202: {
+            "description": "Deletion continues in the background",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "message": "Route deletion in progress",
+                        "status_url": "/routes/1/deletion",
+                        "deleted_points": 0
+                    }
+                }
+            }
+        },
+        401: {
+            "description": "Invalid or missing authentication"
+        },
+        403: {
+            "description": "Invalid JWT token"
+        },
+        404: {
+            "description": "Route not found"
+        }
+    }
+)
+async def delete_route(route_id: int, response: Response, background_tasks: BackgroundTasks,
+                       user_claims: dict = Depends(JWTBearer())):
+    user_id = user_claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
+
+    job = route_deletions.running(route_id)
+    if job is None:
+        if not await storage.get_route_by_id(route_id):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Route not found")
+        # Short routes finish within the request
+        _, more = await storage.list_route_points(route_id, POINT_DELETE_CHUNK, None, ["id"])
+        if more is None:
+            await storage.remove_route_from_heatmap(route_id)
+            await storage.delete_route_points_chunk(route_id, POINT_DELETE_CHUNK)
+            result = await storage.delete_route(route_id)
+            route_refreshes.forget(route_id)
+            return {"message": "Route deleted successfully", "data": result}
+        job = route_deletions.start(route_id)
+        background_tasks.add_task(run_route_deletion, route_id, job)
+
+    response.status_code = status.HTTP_202_ACCEPTED
+    return {
+        "message": "Route deletion in progress",
+        "status_url": f"/routes/{route_id}/deletion",
+        "deleted_points": job["deleted_points"],
+    }
+
+async def run_route_deletion(route_id: int, job: dict):
+    try:
+        await delete_route_cascade(storage, route_id, POINT_DELETE_CHUNK, job)
+        route_refreshes.forget(route_id)
+    except Exception as e:
+        logger.warning("Failed to delete route", extra={"fields": {"route_id": route_id, "error": str(e)}})
+
+# Live recording: WebSocket /routes/{route_id}/live (not listed in the OpenAPI docs).
+#   Auth: `?token=<jwt>` or an Authorization: Bearer header; the route must be yours.
+#   Server -> client: {"type": "ready", "route_id", "last_seq"} on connect, then
+#                     {"type": "ack", "seq"} once everything up to seq is stored,
+#                     {"type": "error", "seq", "detail"} for a rejected message.
+#   Client -> server: {"seq": n, "points": [{"lat", "lng", "timestamp"}, ...], "final": false}
+#                     with n increasing by message; send points after last_seq again
+#                     after a reconnect. "final": true flushes, acks and closes.
+@app.websocket("/routes/{route_id}/live")
+async def record_route_live(websocket: WebSocket, route_id: int, token: Optional[str] = Query(None)):
+    authorization = websocket.headers.get("authorization", "")
+    token = token or (authorization[7:] if authorization.lower().startswith("bearer ") else None)
+    try:
+        user_id = (await verify_token(token, websocket.url.path)).get("sub") if token else None
+    except Exception:
+        user_id = None
+    if not user_id:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Invalid JWT")
+        return
+    route = await storage.get_route_by_id(route_id)
+    if not route or route.get("user_reference") not in (None, user_id):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Route not found")
+        return
+
+    await websocket.accept()
+    session = live_session(
+        lambda rows, seq: storage.append_route_points(route_id, rows, seq), route.get("live_seq") or 0
+    )
+
+    async def flush_and_ack():
+        seq = await session.flush()
+        if seq is not None:
+            await websocket.send_json({"type": "ack", "seq": seq})
+
+    await websocket.send_json({"type": "ready", "route_id": route_id, "last_seq": session.acked_seq})
+    try:
+        while True:
+            try:
+                raw = await asyncio.wait_for(websocket.receive_text(), session.seconds_until_flush())
+            except asyncio.TimeoutError:
+                await flush_and_ack()
+                continue
+            try:
+                message = live_message.model_validate_json(raw)
+            except ValidationError as e:
+                await websocket.send_json({
+                    "type": "error", "seq": None,
+                    "detail": e.errors(include_url=False, include_context=False, include_input=False),
+                })
+                continue
+            session.add(message)
+            if message.final or session.due():
+                await flush_and_ack()
+            if message.final:
+                await websocket.close()
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Store what is buffered even if the client went away (the handler may be
+        # cancelled on disconnect, so this outlives it); the client resumes after it
+        spawn(finish_live_session(route_id, session))
+
+async def finish_live_session(route_id: int, session: live_session):
+    try:
+        await session.flush()
+    except Exception as e:
+        logger.warning("Failed to flush live points", extra={"fields": {"route_id": route_id, "error": str(e)}})
+    logger.info("Live recording ended", extra={"fields": {
+        "route_id": route_id, "points": session.stored, "flushes": session.flushes, "last_seq": session.acked_seq,
+    }})
+    if session.stored:
+        schedule_route_refresh({route_id: None})
+
+@app.get(
+    "/routes/{route_id}/deletion",
+    response_model=RouteDeletionResponse,
+    tags=["Routes"],
+    summary="Get route deletion progress",
+    description=(
+        "Progress of a background route deletion started by DELETE /routes/{route_id}. Progress is kept by "
+        "the API process running the deletion. Requires JWT authentication."
+    ),
+    responses={
+        200: {
+            "description": "Deletion progress retrieved successfully"
+        },
+        401: {
+            "description": "Invalid or missing authentication"
+        },
+        403: {
+            "description": "Invalid JWT token"
+        },
+        404: {
+            "description": "No deletion known for this route"
+        }
+    }
+)
+async def get_route_deletion(route_id: int, user_claims: dict = Depends(JWTBearer())):
+    user_id = user_claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
+
+    job = route_deletions.get(route_id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No deletion known for this route")
+    return job
+
+@app.post(
+    "/routes/import",
+    tags=["Routes"],
+    summary="Import GPX/FIT files",
+    description=(
+        "Create routes from track files recorded elsewhere. Send one `.gpx` or `.fit` file as the request body "
+        "(`format=gpx` or `format=fit`), or a zip of many (`format=zip`, one route per .gpx/.fit entry). "
+        "Files are parsed incrementally and their points inserted in chunks, several files at a time; route "
+        "metrics are computed while the points go in. Requires JWT authentication."
+    ),
+    responses={
+        200: {
+            "description": "Per-file import report",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "files": [
+                            {"name": "morning.gpx", "status": "ok", "route_id": 12, "points": 5400, "error": None},
+                            {"name": "broken.fit", "status": "failed", "route_id": None, "points": 0,
+                             "error": "Truncated FIT file"}
+                        ],
+                        "routes": 1,
+                        "points": 5400,
+                        "seconds": 0.84,
+                        "points_per_second": 6428.6
+                    }
+                }
+            }
+        },
+        400: {
+            "description": "The body is not a valid zip archive"
+        },
+        401: {
+            "description": "Invalid or missing authentication"
+        },
+        403: {
+            "description": "Invalid JWT token"
+        },
+        413: {
+            "description": "The body exceeds MAX_IMPORT_BYTES"
+        }
+    }
+)
+async def import_routes(
+    request: Request,
+    import_format: str = Query(..., alias="format", pattern="^(gpx|fit|zip)$", description="gpx, fit or zip"),
+    user_claims: dict = Depends(JWTBearer())
+):
+    user_id = user_claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
+
+    with tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES) as body:
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > MAX_IMPORT_BYTES:
+                raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                    detail=f"Upload exceeds {MAX_IMPORT_BYTES} bytes")
+            body.write(chunk)
+        body.seek(0)
+
+        if import_format != "zip":
+            report = await import_tracks(storage, [(f"upload.{import_format}", partial(nullcontext, body))], user_id)
+        else:
+            try:
+                archive = zipfile.ZipFile(body)
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body is not a zip archive")
+            with archive:
+                sources = [
+                    (info.filename, partial(archive.open, info)) for info in archive.infolist()
+                    if not info.is_dir() and not info.filename.startswith("__MACOSX/")
+                ]
+                report = await import_tracks(storage, sources, user_id)
+
+    # Levels of detail and segment matches follow in the background; the import
+    # already wrote the metrics it accumulated, so they are not recomputed
+    schedule_route_refresh({f["route_id"]: None for f in report["files"] if f["status"] == "ok"}, metrics=False)
+    return report
+
+@app.get(
+    "/routes/{route_id}/export",
+    response_class=StreamingResponse,
+    tags=["Routes"],
+    summary="Export route",
+    description=(
+        "Download a route with all its points as GPX or GeoJSON (a LineString Feature with per-point times "
+        "in `properties.coordTimes`). The file is streamed while points are read page by page, so long "
+        "routes start downloading at once. Requires JWT authentication."
+    ),
+    responses={
+        200: {
+            "description": "Route file streamed",
+            "content": {"application/gpx+xml": {}, "application/geo+json": {}}
+        },
         401: {
             "description": "Invalid or missing authentication"
         },
         403: {
             "description": "Invalid JWT token"
+        },
+        404: {
+            "description": "Route not found"
         }
     }
 )
-def delete_route(route_id: int, user_claims: dict = Depends(JWTBearer())):
+async def export_route(
+    route_id: int,
+    export_format: str = Query("gpx", alias="format", pattern="^(gpx|geojson)$", description="gpx or geojson"),
+    user_claims: dict = Depends(JWTBearer())
+):
     user_id = user_claims.get("sub")
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
 
-    result = supabase.delete_route(route_id)
-    return {"message": "Route deleted successfully", "data": result}
+    route = await storage.get_route_by_id(route_id)
+    if not route or route.get("user_reference") not in (None, user_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Route not found")
+    media_type, extension = EXPORT_FORMATS[export_format]
+    return StreamingResponse(
+        route_chunks(storage, route, export_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="route-{route_id}.{extension}"'},
+    )
 
 # POINTS endpoints
 @app.post(
@@ -678,18 +1458,27 @@ def delete_route(route_id: int, user_claims: dict = Depends(JWTBearer())):
         },
         500: {
             "description": "Failed to create point"
+        },
+        503: {
+            "description": "Point write queue is full (write-behind mode); retry later"
         }
     }
 )
-def create_point(point: PointCreate, user_claims: dict = Depends(JWTBearer())):
+async def create_point(point: PointCreate, user_claims: dict = Depends(JWTBearer())):
     user_id = user_claims.get("sub")
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
 
-    point_data = point.model_dump()
+    point_data = point.model_dump(exclude_none=True)
     point_data["timestamp"] = point_data["timestamp"].isoformat()
 
-    result = supabase.create_point(point_data)
+    if point_writer is not None:
+        try:
+            result = await point_writer.submit(point_data)
+        except write_buffer_full as e:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": "1"})
+    else:
+        result = await storage.create_point(point_data)
     if not result:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create point")
     return result
@@ -714,31 +1503,48 @@ def create_point(point: PointCreate, user_claims: dict = Depends(JWTBearer())):
         }
     }
 )
-def create_points_batch(points: List[PointCreate], user_claims: dict = Depends(JWTBearer())):
+async def create_points_batch(points: List[PointCreate], user_claims: dict = Depends(JWTBearer())):
     user_id = user_claims.get("sub")
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
 
     points_data = []
     for point in points:
-        point_dict = point.model_dump()
+        point_dict = point.model_dump(exclude_none=True)
         point_dict["timestamp"] = point_dict["timestamp"].isoformat()
         points_data.append(point_dict)
 
-    result = supabase.create_points_batch(points_data)
+    result = await storage.create_points_batch(points_data)
     if not result:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create points")
+    earliest = {}
+    for point in points:
+        note_earliest(earliest, point.route_id, point.timestamp)
+    schedule_route_refresh(earliest)
     return {"message": "Points created successfully", "data": result}
 
-@app.get(
-    "/points/{point_id}",
-    response_model=PointResponse,
+@app.post(
+    "/points/batch/packed",
     tags=["Points"],
-    summary="Get point by ID",
-    description="Retrieve a specific GPS point by its ID. Requires JWT authentication.",
+    summary="Create multiple points from a packed batch",
+    description=(
+        f"Create GPS points from a `{point_codec.CONTENT_TYPE}` body: little-endian lat/lng/timestamp "
+        "columns, either raw float64/int64 or delta-encoded fixed point (see `ingest/point_codec.py`). "
+        "The batch is decoded and range-checked with vectorized NumPy operations instead of per-point "
+        "models. Requires JWT authentication."
+    ),
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {point_codec.CONTENT_TYPE: {"schema": {"type": "string", "format": "binary"}}}
+        }
+    },
     responses={
         200: {
-            "description": "Point retrieved successfully"
+            "description": "Points created successfully"
+        },
+        400: {
+            "description": "Malformed or out-of-range packed batch"
         },
         401: {
             "description": "Invalid or missing authentication"
@@ -746,29 +1552,59 @@ def create_points_batch(points: List[PointCreate], user_claims: dict = Depends(J
         403: {
             "description": "Invalid JWT token"
         },
-        404: {
-            "description": "Point not found"
+        500: {
+            "description": "Failed to create points"
         }
     }
 )
-def get_point(point_id: int, user_claims: dict = Depends(JWTBearer())):
+async def create_points_packed(
+    request: Request,
+    route_id: Optional[int] = Query(None, description="Route to attach the points to"),
+    user_claims: dict = Depends(JWTBearer())
+):
     user_id = user_claims.get("sub")
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
 
-    point = supabase.get_point_by_id(point_id)
-    if not point:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Point not found")
-    return point
+    try:
+        lat, lng, timestamp_ms = point_codec.decode_points(await request.body())
+    except point_codec.PointCodecError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
-@app.get(
-    "/routes/{route_id}/points",
+    result = await storage.create_points_batch(point_codec.to_rows(lat, lng, timestamp_ms, route_id))
+    if not result:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create points")
+    schedule_route_refresh({route_id: float(timestamp_ms.min()) / 1000.0})
+    return {"message": "Points created successfully", "data": result}
+
+@app.post(
+    "/points/stream",
     tags=["Points"],
-    summary="Get points for a route",
-    description="Retrieve all GPS points associated with a specific route. Requires JWT authentication.",
+    summary="Stream points as NDJSON",
+    description=(
+        "Ingest GPS points from an `application/x-ndjson` body, one point object per line. "
+        "Points are validated as they arrive and inserted in chunks of `chunk_size`; each chunk "
+        "is committed before more of the body is read. Processing stops at the first invalid line "
+        "or failed chunk, and `resume_from` tells the client which line to resend from "
+        "(pass it back as `offset`). Requires JWT authentication."
+    ),
     responses={
         200: {
-            "description": "Points retrieved successfully"
+            "description": "Per-chunk ingest report",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "inserted": 1000,
+                        "chunks": [
+                            {"index": 0, "first_line": 0, "last_line": 499, "status": "ok", "inserted": 500},
+                            {"index": 1, "first_line": 500, "last_line": 999, "status": "ok", "inserted": 500}
+                        ],
+                        "error": None,
+                        "complete": True,
+                        "resume_from": 1000
+                    }
+                }
+            }
         },
         401: {
             "description": "Invalid or missing authentication"
@@ -778,70 +1614,854 @@ def get_point(point_id: int, user_claims: dict = Depends(JWTBearer())):
         }
     }
 )
-def get_points_by_route(route_id: int, user_claims: dict = Depends(JWTBearer())):
+async def create_points_stream(
+    request: Request,
+    route_id: Optional[int] = Query(None, description="Route to attach points to when a line has no route_id"),
+    chunk_size: int = Query(500, ge=1, le=5000, description="Points per insert"),
+    offset: int = Query(0, ge=0, description="Line number of the first line in this body, for resumed uploads"),
+    user_claims: dict = Depends(JWTBearer())
+):
     user_id = user_claims.get("sub")
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
 
-    points = supabase.get_points_by_route(route_id)
-    return {"points": points}
+    earliest = {}
+
+    def to_row(point: PointCreate) -> dict:
+        row = point.model_dump(mode="json", exclude_none=True)
+        if route_id is not None:
+            row.setdefault("route_id", route_id)
+        note_earliest(earliest, row.get("route_id"), point.timestamp)
+        return row
+
+    report = await ingest_ndjson(
+        request.stream(),
+        PointCreate,
+        to_row,
+        storage.create_points_batch,
+        chunk_size=chunk_size,
+        offset=offset,
+    )
+    if report["inserted"]:
+        schedule_route_refresh(earliest)
+    return report
 
-@app.put(
-    "/points/{point_id}",
-    response_model=PointResponse,
+@app.get(
+    "/points/",
+    response_model=Union[List[PointResponse], PointsByIdsResponse],
     tags=["Points"],
-    summary="Update point",
-    description="Update an existing GPS point. Only provided fields will be updated. Requires JWT authentication.",
+    summary="Get points in a bounding box or by IDs",
+    description=(
+        "Retrieve the points inside a viewport, `bbox=minLng,minLat,maxLng,maxLat` (GeoJSON order). "
+        "Served from the spatial cell index, so the cost follows the number of points in the box. Points come "
+        f"in index order; when more than `limit` (at most {MAX_BBOX_POINTS}) are inside, an arbitrary subset is "
+        "returned, so zoom in or split the box to see them all. "
+        "With `ids=3,1,2` instead of `bbox` it returns `{points, missing}`: those points in the order given, "
+        f"fetched in one query, and the ids that do not exist (at most {MAX_MULTI_GET_IDS} ids). "
+        "Points are public like their routes: both forms return every user's points. Requires JWT authentication."
+    ),
     responses={
         200: {
-            "description": "Point updated successfully"
+            "description": "Points retrieved successfully"
+        },
+        400: {
+            "description": "Malformed or out-of-range bbox, malformed or too many ids, or neither or both given"
         },
         401: {
             "description": "Invalid or missing authentication"
         },
         403: {
             "description": "Invalid JWT token"
-        },
-        404: {
-            "description": "Point not found"
         }
     }
 )
-def update_point(point_id: int, point: PointUpdate, user_claims: dict = Depends(JWTBearer())):
+async def get_points_in_bbox(
+    bbox: Optional[str] = Query(None, description="minLng,minLat,maxLng,maxLat, e.g. 13.38,52.50,13.42,52.53"),
+    limit: int = Query(MAX_BBOX_POINTS, ge=1, le=MAX_BBOX_POINTS, description="Maximum number of points to return"),
+    ids: Optional[str] = Query(None, description="Comma-separated point ids to fetch, e.g. 3,1,2"),
+    user_claims: dict = Depends(JWTBearer())
+):
     user_id = user_claims.get("sub")
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
 
-    point_data = point.model_dump(exclude_unset=True)
-    if "timestamp" in point_data and point_data["timestamp"]:
-        point_data["timestamp"] = point_data["timestamp"].isoformat()
+    if (bbox is None) == (ids is None):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Pass exactly one of bbox or ids")
+    if ids is not None:
+        point_ids = parse_ids(ids)
+        points, missing = in_requested_order(await storage.get_points_by_ids(point_ids), point_ids)
+        return trusted_response({"points": trusted_rows(points, PointResponse), "missing": missing})
 
-    result = supabase.update_point(point_id, point_data)
-    if not result:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Point not found")
-    return result
+    try:
+        box = parse_bbox(bbox)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return trusted_response(trusted_rows(await storage.get_points_in_bbox(*box, limit=limit), PointResponse))
 
-@app.delete(
+@app.get(
     "/points/{point_id}",
+    response_model=PointResponse,
     tags=["Points"],
-    summary="Delete point",
-    description="Delete a GPS point by its ID. Requires JWT authentication.",
+    summary="Get point by ID",
+    description="Retrieve a specific GPS point by its ID. Requires JWT authentication.",
     responses={
         200: {
-            "description": "Point deleted successfully"
+            "description": "Point retrieved successfully"
         },
         401: {
             "description": "Invalid or missing authentication"
         },
         403: {
             "description": "Invalid JWT token"
+        },
+        404: {
+            "description": "Point not found"
+        }
+    }
+)
+async def get_point(point_id: int, user_claims: dict = Depends(JWTBearer())):
+    user_id = user_claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
+
+    point = await storage.get_point_by_id(point_id)
+    if not point:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Point not found")
+    return point
+
+@app.get(
+    "/routes/{route_id}/points",
+    tags=["Points"],
+    summary="Get points for a route",
+    description=(
+        "Retrieve the GPS points of a route, ordered by timestamp. Without `tolerance` or `zoom` all points "
+        "are returned. With either, the coarsest precomputed Douglas-Peucker level of detail whose error "
+        "stays within the tolerance (in metres, or one pixel at the given map zoom) is returned instead. "
+        "`format=polyline` returns the coordinates as a Google encoded polyline at `precision` decimal "
+        "digits plus the timestamps; `format=columnar` returns `id`, `lat`, `lng` and `timestamp` as "
+        "parallel arrays. Requires JWT authentication."
+    ),
+    responses={
+        200: {
+            "description": "Points retrieved successfully"
+        },
+        304: {
+            "description": "Not modified since the ETag sent in If-None-Match"
+        },
+        401: {
+            "description": "Invalid or missing authentication"
+        },
+        403: {
+            "description": "Invalid JWT token"
+        }
+    }
+)
+async def get_points_by_route(
+    route_id: int,
+    request: Request,
+    response: Response,
+    tolerance: Optional[float] = Query(None, gt=0, description="Maximum simplification error in metres"),
+    zoom: Optional[float] = Query(None, ge=0, le=24, description="Map zoom level the points will be drawn at"),
+    points_format: str = Query("points", alias="format", pattern="^(points|polyline|columnar)$",
+                               description="points, polyline or columnar"),
+    precision: int = Query(DEFAULT_PRECISION, ge=1, le=MAX_PRECISION,
+                           description="Decimal digits kept by format=polyline"),
+    user_claims: dict = Depends(JWTBearer())
+):
+    user_id = user_claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
+
+    max_tolerance = requested_tolerance(tolerance, zoom)
+    if max_tolerance is not None:
+        lod, etag = await storage.get_route_lod_with_etag(route_id, max_tolerance)
+        if lod:
+            if points_format != "points":
+                # Each encoding of the level is its own representation
+                etag = f'{etag[:-1]}.{points_format}{precision if points_format == "polyline" else ""}"'
+            return not_modified(request, response, etag) or trusted_response({
+                **format_points(lod["points"], points_format, precision),
+                "level": lod["level"], "tolerance_m": lod["tolerance_m"]
+            }, response)
+
+    points = await storage.get_points_by_route(route_id)
+    return trusted_response(format_points(points, points_format, precision))
+
+@app.put(
+    "/points/{point_id}",
+    response_model=PointResponse,
+    tags=["Points"],
+    summary="Update point",
+    description="Update an existing GPS point. Only provided fields will be updated. Requires JWT authentication.",
+    responses={
+        200: {
+            "description": "Point updated successfully"
+        },
+        401: {
+            "description": "Invalid or missing authentication"
+        },
+        403: {
+            "description": "Invalid JWT token"
+        },
+        404: {
+            "description": "Point not found"
+        }
+    }
+)
+async def update_point(point_id: int, point: PointUpdate, user_claims: dict = Depends(JWTBearer())):
+    user_id = user_claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
+
+    point_data = point.model_dump(exclude_unset=True)
+    if "timestamp" in point_data and point_data["timestamp"]:
+        point_data["timestamp"] = point_data["timestamp"].isoformat()
+
+    result = await storage.update_point(point_id, point_data)
+    if not result:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Point not found")
+    # The route's incremental metrics no longer match its points: start them over
+    # and refresh the route as after a write (its old timestamp is covered by the restart)
+    if result.get("route_id") is not None:
+        route_refreshes.forget(result["route_id"])
+        earliest = {}
+        note_earliest(earliest, result["route_id"], datetime.fromisoformat(result["timestamp"]))
+        schedule_route_refresh(earliest)
+    return result
+
+@app.delete(
+    "/points/{point_id}",
+    tags=["Points"],
+    summary="Delete point",
+    description="Delete a GPS point by its ID. Requires JWT authentication.",
+    responses={
+        200: {
+            "description": "Point deleted successfully"
+        },
+        401: {
+            "description": "Invalid or missing authentication"
+        },
+        403: {
+            "description": "Invalid JWT token"
+        }
+    }
+)
+async def delete_point(point_id: int, user_claims: dict = Depends(JWTBearer())):
+    user_id = user_claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
+
+    result = await storage.delete_point(point_id)
+    earliest = {}
+    for row in result or []:
+        if row.get("route_id") is not None:
+            route_refreshes.forget(row["route_id"])
+            note_earliest(earliest, row["route_id"], datetime.fromisoformat(row["timestamp"]))
+    schedule_route_refresh(earliest)
+    return {"message": "Point deleted successfully", "data": result}
+
+# SEGMENT endpoints
+async def match_new_segment(segment: dict):
+    # Give a new segment its leaderboard from the routes already recorded over it
+    try:
+        await match_segment_routes(storage, segment)
+    except Exception as e:
+        logger.warning("Failed to match new segment", extra={"fields": {"segment_id": segment.get("id"), "error": str(e)}})
+
+@app.post(
+    "/segments/",
+    response_model=SegmentResponse,
+    tags=["Segments"],
+    summary="Create a new segment",
+    description=(
+        "Create a segment from a polyline. It is simplified and indexed by its start point; routes already "
+        "recorded over it are matched in the background and new routes are matched as their points arrive. "
+        "Requires JWT authentication."
+    ),
+    responses={
+        200: {
+            "description": "Segment created successfully"
+        },
+        401: {
+            "description": "Invalid or missing authentication"
+        },
+        403: {
+            "description": "Invalid JWT token"
+        },
+        500: {
+            "description": "Failed to create segment"
+        }
+    }
+)
+async def create_segment(segment: SegmentCreate, background_tasks: BackgroundTasks, user_claims: dict = Depends(JWTBearer())):
+    user_id = user_claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
+
+    segment_data = segment_geometry([p.model_dump() for p in segment.points])
+    segment_data["name"] = segment.name
+    segment_data["created_by"] = user_id
+
+    result = await storage.create_segment(segment_data)
+    if not result:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create segment")
+    background_tasks.add_task(match_new_segment, result)
+    return result
+
+@app.get(
+    "/segments/{segment_id}",
+    response_model=SegmentResponse,
+    tags=["Segments"],
+    summary="Get segment by ID",
+    description="Retrieve a specific segment by its ID. Requires JWT authentication.",
+    responses={
+        200: {
+            "description": "Segment retrieved successfully"
+        },
+        401: {
+            "description": "Invalid or missing authentication"
+        },
+        403: {
+            "description": "Invalid JWT token"
+        },
+        404: {
+            "description": "Segment not found"
+        }
+    }
+)
+async def get_segment(segment_id: int, user_claims: dict = Depends(JWTBearer())):
+    user_id = user_claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
+
+    segment = await storage.get_segment_by_id(segment_id)
+    if not segment:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Segment not found")
+    return segment
+
+@app.get(
+    "/segments/{segment_id}/leaderboard",
+    response_model=List[SegmentEffortResponse],
+    tags=["Segments"],
+    summary="Get segment leaderboard",
+    description=(
+        "Fastest efforts on a segment, one per athlete. Efforts are kept sorted as routes are matched, so "
+        "this reads the top `limit` entries directly. Requires JWT authentication."
+    ),
+    responses={
+        200: {
+            "description": "Leaderboard retrieved successfully"
+        },
+        304: {
+            "description": "Not modified since the ETag sent in If-None-Match"
+        },
+        401: {
+            "description": "Invalid or missing authentication"
+        },
+        403: {
+            "description": "Invalid JWT token"
+        }
+    }
+)
+async def get_segment_leaderboard(
+    segment_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE, description="Number of entries to return"),
+    user_claims: dict = Depends(JWTBearer())
+):
+    user_id = user_claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
+
+    efforts, etag = await storage.get_segment_leaderboard_with_etag(segment_id, limit)
+    return not_modified(request, response, etag) or [
+        {**effort, "rank": rank} for rank, effort in enumerate(efforts, start=1)
+    ]
+
+@app.delete(
+    "/segments/{segment_id}",
+    tags=["Segments"],
+    summary="Delete segment",
+    description="Delete a segment you created, together with its leaderboard. Requires JWT authentication.",
+    responses={
+        200: {
+            "description": "Segment deleted successfully",
+            "content": {
+                "application/json": {
+                    "example": {"message": "Segment deleted successfully"}
+                }
+            }
+        },
+        401: {
+            "description": "Invalid or missing authentication"
+        },
+        403: {
+            "description": "Invalid JWT token or not the segment's creator"
+        },
+        404: {
+            "description": "Segment not found"
+        }
+    }
+)
+async def delete_segment(segment_id: int, user_claims: dict = Depends(JWTBearer())):
+    user_id = user_claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
+
+    segment = await storage.get_segment_by_id(segment_id)
+    if not segment:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Segment not found")
+    if segment.get("created_by") != user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only the creator can delete a segment")
+    await storage.delete_segment(segment_id)
+    return {"message": "Segment deleted successfully"}
+
+# USER endpoints
+@app.get(
+    "/users/me/stats",
+    response_model=UserStatsResponse,
+    tags=["Users"],
+    summary="Get activity stats",
+    description=(
+        "Your distance, time and activity count per day, week or month between `from` and `to` "
+        "(by default the last 30 days, 12 weeks or 12 months up to today). Served from per-user buckets "
+        "maintained as activities are written, not from the activity history. Requires JWT authentication."
+    ),
+    responses={
+        200: {
+            "description": "Stats retrieved successfully"
+        },
+        304: {
+            "description": "Not modified since the ETag sent in If-None-Match"
+        },
+        400: {
+            "description": "from is after to, or the range spans too many buckets"
+        },
+        401: {
+            "description": "Invalid or missing authentication"
+        },
+        403: {
+            "description": "Invalid JWT token"
+        }
+    }
+)
+async def get_user_stats(
+    request: Request,
+    response: Response,
+    granularity: str = Query("week", pattern="^(day|week|month)$", description="Bucket size: day, week or month"),
+    from_: Optional[Date] = Query(None, alias="from", description="First day to include"),
+    to: Optional[Date] = Query(None, description="Last day to include; defaults to today (UTC)"),
+    user_claims: dict = Depends(JWTBearer())
+):
+    user_id = user_claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
+
+    to = to or datetime.now(timezone.utc).date()
+    if from_ is None:
+        starts = period_starts(to, to, granularity)
+        while len(starts) < DEFAULT_STATS_BUCKETS[granularity]:
+            starts.insert(0, period_start(starts[0] - timedelta(days=1), granularity))
+    elif from_ > to:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="from must not be after to")
+    else:
+        # No bucket is longer than 31 days, so this bounds the list before building it
+        starts = period_starts(from_, to, granularity) if (to - from_).days < MAX_STATS_BUCKETS * 31 else []
+        if not starts or len(starts) > MAX_STATS_BUCKETS:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Range spans more than {MAX_STATS_BUCKETS} buckets")
+
+    rows, etag = await storage.get_user_stats_with_etag(
+        user_id, granularity, starts[0].isoformat(), starts[-1].isoformat()
+    )
+    cached = not_modified(request, response, etag)
+    if cached:
+        return cached
+    by_start = {str(row["period_start"])[:10]: row for row in rows}
+    buckets = [
+        {"period_start": start, **{m: by_start.get(start.isoformat(), {}).get(m, 0) for m in STATS_METRICS}}
+        for start in starts
+    ]
+    return {
+        "granularity": granularity,
+        "from": starts[0],
+        "to": to,
+        "totals": {m: sum(b[m] for b in buckets) for m in STATS_METRICS},
+        "buckets": buckets,
+    }
+
+@app.get(
+    "/users/me/routes/export",
+    response_class=StreamingResponse,
+    tags=["Users"],
+    summary="Export all your routes",
+    description=(
+        "Download every route you created as a zip with one GPX or GeoJSON file per route "
+        "(`route-<id>.gpx`). The archive is compressed and streamed as it is built. Requires JWT authentication."
+    ),
+    responses={
+        200: {
+            "description": "Zip archive streamed",
+            "content": {"application/zip": {}}
+        },
+        401: {
+            "description": "Invalid or missing authentication"
+        },
+        403: {
+            "description": "Invalid JWT token"
+        }
+    }
+)
+async def export_user_routes(
+    export_format: str = Query("gpx", alias="format", pattern="^(gpx|geojson)$", description="gpx or geojson"),
+    user_claims: dict = Depends(JWTBearer())
+):
+    user_id = user_claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
+
+    return StreamingResponse(
+        user_routes_zip(storage, user_id, export_format),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="routes.zip"'},
+    )
+
+# HEATMAP endpoints
+async def heatmap_tile(z: int, x: int, y: int, ext: str, group_id: Optional[int], user_id: str) -> bytes:
+    if x >= 1 << z or y >= 1 << z:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Tile out of range")
+    if group_id is None:
+        scope, user_ids = user_scope(user_id), [user_id]
+    else:
+        if group_id not in await storage.get_user_group_ids(user_id):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not a member of this group")
+        scope = group_scope(group_id)
+        user_ids = [m["user_reference"] for m in await storage.get_group_members(group_id)]
+
+    key = tile_key(scope, z, x, y, ext)
+    data = await asyncio.to_thread(heatmap_tiles.get, key)
+    if data is None:
+        generation = heatmap_tiles.generation
+        grid = tile_grid(await storage.get_heatmap_bins(user_ids, z, *tile_bin_range(z, x, y)), x, y)
+        if ext == "png":
+            data = await asyncio.to_thread(render_png, grid, z)
+        else:
+            data = json.dumps({"z": z, "x": x, "y": y, "bins": HEATMAP_TILE_BINS, "cells": grid_cells(grid)},
+                              separators=(",", ":")).encode()
+        await asyncio.to_thread(heatmap_tiles.put, key, data, generation)
+    return data
+
+@app.get(
+    "/tiles/heatmap/{z}/{x}/{y}.png",
+    response_class=Response,
+    tags=["Maps"],
+    summary="Heatmap tile",
+    description=(
+        "A 256x256 PNG map tile (Web Mercator, XYZ scheme) showing where your points are, or with `group_id` "
+        "those of every member of a group you belong to. Drawn from per-zoom density grids kept up to date as "
+        "points are written, and cached until new points change the tile. Requires JWT authentication."
+    ),
+    responses={
+        200: {
+            "description": "Tile image",
+            "content": {"image/png": {}}
+        },
+        401: {
+            "description": "Invalid or missing authentication"
+        },
+        403: {
+            "description": "Invalid JWT token, or not a member of the group"
+        },
+        404: {
+            "description": "Tile out of range"
+        }
+    }
+)
+async def get_heatmap_tile_png(
+    z: int = Path(..., ge=0, le=HEATMAP_MAX_ZOOM, description="Zoom level"),
+    x: int = Path(..., ge=0, description="Tile column"),
+    y: int = Path(..., ge=0, description="Tile row"),
+    group_id: Optional[int] = Query(None, description="Draw this group's heatmap instead of your own"),
+    user_claims: dict = Depends(JWTBearer())
+):
+    user_id = user_claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
+
+    data = await heatmap_tile(z, x, y, "png", group_id, user_id)
+    return Response(content=data, media_type="image/png", headers={"Cache-Control": "private, max-age=60"})
+
+@app.get(
+    "/tiles/heatmap/{z}/{x}/{y}.json",
+    response_class=Response,
+    tags=["Maps"],
+    summary="Heatmap tile as a grid",
+    description=(
+        "The counts behind a heatmap tile, for drawing on the client: the tile is split into `bins` x `bins` "
+        "cells and `cells` lists the non-empty ones as [column, row, points]. Same scope and caching as the "
+        "PNG tile. Requires JWT authentication."
+    ),
+    responses={
+        200: {
+            "description": "Tile grid",
+            "content": {
+                "application/json": {
+                    "example": {"z": 12, "x": 1205, "y": 1539, "bins": 64, "cells": [[10, 41, 37], [11, 41, 52]]}
+                }
+            }
+        },
+        401: {
+            "description": "Invalid or missing authentication"
+        },
+        403: {
+            "description": "Invalid JWT token, or not a member of the group"
+        },
+        404: {
+            "description": "Tile out of range"
+        }
+    }
+)
+async def get_heatmap_tile_grid(
+    z: int = Path(..., ge=0, le=HEATMAP_MAX_ZOOM, description="Zoom level"),
+    x: int = Path(..., ge=0, description="Tile column"),
+    y: int = Path(..., ge=0, description="Tile row"),
+    group_id: Optional[int] = Query(None, description="Use this group's heatmap instead of your own"),
+    user_claims: dict = Depends(JWTBearer())
+):
+    user_id = user_claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
+
+    data = await heatmap_tile(z, x, y, "json", group_id, user_id)
+    return Response(content=data, media_type="application/json", headers={"Cache-Control": "private, max-age=60"})
+
+# GROUP endpoints
+async def rebuild_joined_member(group_id: int, user_id: str):
+    # A new member's totals come from their activity history; later writes arrive as deltas
+    try:
+        await rebuild_member(storage, group_id, user_id)
+    except Exception as e:
+        logger.warning("Failed to build member leaderboard rows", extra={"fields": {"group_id": group_id, "error": str(e)}})
+
+
+@app.post(
+    "/groups/",
+    response_model=GroupResponse,
+    tags=["Groups"],
+    summary="Create a new group",
+    description="Create a group; you become its first member. Requires JWT authentication.",
+    responses={
+        200: {
+            "description": "Group created successfully"
+        },
+        401: {
+            "description": "Invalid or missing authentication"
+        },
+        403: {
+            "description": "Invalid JWT token"
+        },
+        500: {
+            "description": "Failed to create group"
+        }
+    }
+)
+async def create_group(group: GroupCreate, background_tasks: BackgroundTasks, user_claims: dict = Depends(JWTBearer())):
+    user_id = user_claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
+
+    result = await storage.create_group(group.model_dump(), user_id)
+    if not result:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create group")
+    background_tasks.add_task(rebuild_joined_member, result["id"], user_id)
+    return {**result, "members": [user_id]}
+
+@app.get(
+    "/groups/{group_id}",
+    response_model=GroupResponse,
+    tags=["Groups"],
+    summary="Get group by ID",
+    description="Retrieve a group and its members. Requires JWT authentication.",
+    responses={
+        200: {
+            "description": "Group retrieved successfully"
+        },
+        401: {
+            "description": "Invalid or missing authentication"
+        },
+        403: {
+            "description": "Invalid JWT token"
+        },
+        404: {
+            "description": "Group not found"
+        }
+    }
+)
+async def get_group(group_id: int, user_claims: dict = Depends(JWTBearer())):
+    user_id = user_claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
+
+    group = await storage.get_group_by_id(group_id)
+    if not group:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Group not found")
+    members = await storage.get_group_members(group_id)
+    return {**group, "members": [m["user_reference"] for m in members]}
+
+@app.post(
+    "/groups/{group_id}/members",
+    tags=["Groups"],
+    summary="Join group",
+    description=(
+        "Join a group. Your totals for the group leaderboard are built from your activities in the "
+        "background and kept current as you record new ones. Requires JWT authentication."
+    ),
+    responses={
+        200: {
+            "description": "Joined group successfully",
+            "content": {
+                "application/json": {
+                    "example": {"message": "Joined group successfully"}
+                }
+            }
+        },
+        401: {
+            "description": "Invalid or missing authentication"
+        },
+        403: {
+            "description": "Invalid JWT token"
+        },
+        404: {
+            "description": "Group not found"
+        }
+    }
+)
+async def join_group(group_id: int, background_tasks: BackgroundTasks, user_claims: dict = Depends(JWTBearer())):
+    user_id = user_claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
+
+    if not await storage.get_group_by_id(group_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Group not found")
+    if await storage.add_group_member(group_id, user_id):
+        background_tasks.add_task(rebuild_joined_member, group_id, user_id)
+    return {"message": "Joined group successfully"}
+
+@app.delete(
+    "/groups/{group_id}/members/me",
+    tags=["Groups"],
+    summary="Leave group",
+    description="Leave a group and remove your entries from its leaderboard. Requires JWT authentication.",
+    responses={
+        200: {
+            "description": "Left group successfully",
+            "content": {
+                "application/json": {
+                    "example": {"message": "Left group successfully"}
+                }
+            }
+        },
+        401: {
+            "description": "Invalid or missing authentication"
+        },
+        403: {
+            "description": "Invalid JWT token"
+        },
+        404: {
+            "description": "Not a member of this group"
+        }
+    }
+)
+async def leave_group(group_id: int, user_claims: dict = Depends(JWTBearer())):
+    user_id = user_claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
+
+    if not await storage.remove_group_member(group_id, user_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not a member of this group")
+    return {"message": "Left group successfully"}
+
+@app.get(
+    "/groups/{group_id}/leaderboard",
+    response_model=List[GroupLeaderboardEntry],
+    tags=["Groups"],
+    summary="Get group leaderboard",
+    description=(
+        "Members ranked by total distance, time or activity count for the week or month containing `date` "
+        "(today by default). Totals are maintained as activities are written, so this reads the top `limit` "
+        "entries directly. Only members can view it. Requires JWT authentication."
+    ),
+    responses={
+        200: {
+            "description": "Leaderboard retrieved successfully"
+        },
+        304: {
+            "description": "Not modified since the ETag sent in If-None-Match"
+        },
+        401: {
+            "description": "Invalid or missing authentication"
+        },
+        403: {
+            "description": "Invalid JWT token or not a member of the group"
+        }
+    }
+)
+async def get_group_leaderboard(
+    group_id: int,
+    request: Request,
+    response: Response,
+    period: str = Query("week", pattern="^(week|month)$", description="week (Monday to Sunday) or month"),
+    date: Optional[Date] = Query(None, description="Any day in the period; defaults to today (UTC)"),
+    metric: str = Query("distance", pattern="^(distance|duration_s|activities)$", description="Ranking metric"),
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE, description="Number of entries to return"),
+    user_claims: dict = Depends(JWTBearer())
+):
+    user_id = user_claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
+
+    if group_id not in await storage.get_user_group_ids(user_id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not a member of this group")
+    start = period_start(date or datetime.now(timezone.utc).date(), period).isoformat()
+    entries, etag = await storage.get_group_leaderboard_with_etag(group_id, period, start, metric, limit)
+    return not_modified(request, response, etag) or [
+        {**entry, "rank": rank} for rank, entry in enumerate(entries, start=1)
+    ]
+
+@app.delete(
+    "/groups/{group_id}",
+    tags=["Groups"],
+    summary="Delete group",
+    description="Delete a group you created, together with its memberships and leaderboard. Requires JWT authentication.",
+    responses={
+        200: {
+            "description": "Group deleted successfully",
+            "content": {
+                "application/json": {
+                    "example": {"message": "Group deleted successfully"}
+                }
+            }
+        },
+        401: {
+            "description": "Invalid or missing authentication"
+        },
+        403: {
+            "description": "Invalid JWT token or not the group's creator"
+        },
+        404: {
+            "description": "Group not found"
         }
     }
 )
-def delete_point(point_id: int, user_claims: dict = Depends(JWTBearer())):
+async def delete_group(group_id: int, user_claims: dict = Depends(JWTBearer())):
     user_id = user_claims.get("sub")
     if not user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user")
 
-    result = supabase.delete_point(point_id)
-    return {"message": "Point deleted successfully", "data": result}
\ No newline at end of file
+    group = await storage.get_group_by_id(group_id)
+    if not group:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Group not found")
+    if group.get("created_by") != user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only the creator can delete a group")
+    await storage.delete_group(group_id)
+    return {"message": "Group deleted successfully"}
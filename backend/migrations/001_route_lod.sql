@@ -0,0 +1,14 @@
+-- Precomputed route levels of detail, maintained by geo/route_lod.py.
+-- Assumes POINTS.route_id references ROUTE.id.
+
+create table if not exists "ROUTE_LOD" (
+    route_id bigint not null references "ROUTE" (id) on delete cascade,
+    level smallint not null,
+    tolerance_m double precision not null,
+    point_count integer not null,
+    points jsonb not null,
+    primary key (route_id, level)
+);
+
+create index if not exists route_lod_route_tolerance_idx on "ROUTE_LOD" (route_id, tolerance_m);
+create index if not exists points_route_timestamp_idx on "POINTS" (route_id, timestamp);
@@ -0,0 +1,8 @@
+-- Server-derived route metrics, maintained by jobs/route_refresh.py.
+-- distanceKm and avgSpeedKmh are overwritten once a route has points.
+
+alter table "ROUTE" add column if not exists "durationS" double precision;
+alter table "ROUTE" add column if not exists "movingTimeS" double precision;
+alter table "ROUTE" add column if not exists "maxSpeedKmh" double precision;
+alter table "ROUTE" add column if not exists "avgMovingSpeedKmh" double precision;
+alter table "ROUTE" add column if not exists "splitsS" jsonb;
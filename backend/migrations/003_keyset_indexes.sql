@@ -0,0 +1,5 @@
+-- Indexes backing keyset pagination of the list endpoints
+-- (see supabase_handler/pagination.py).
+
+create index if not exists activities_user_date_id_idx on activities (user_reference, date desc, id desc);
+create index if not exists route_started_at_id_idx on "ROUTE" ("startedAt" desc, id desc);
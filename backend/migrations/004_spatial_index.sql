@@ -0,0 +1,23 @@
+-- Spatial index on POINTS (see geo/spatial.py). New rows get their cell from
+-- the storage backend on insert; carva_cell() backfills existing rows with the
+-- same Z-order encoding.
+
+alter table "POINTS" add column if not exists cell bigint;
+
+create or replace function carva_cell(lat double precision, lng double precision) returns bigint
+language plpgsql immutable as $$
+declare
+    x bigint := least(greatest(floor((lng + 180) / 360 * 16777216), 0), 16777215);
+    y bigint := least(greatest(floor((lat + 90) / 180 * 16777216), 0), 16777215);
+    cell bigint := 0;
+begin
+    for i in 0..23 loop
+        cell := cell | (((x >> i) & 1) << (2 * i)) | (((y >> i) & 1) << (2 * i + 1));
+    end loop;
+    return cell;
+end;
+$$;
+
+update "POINTS" set cell = carva_cell(lat, lng) where cell is null;
+
+create index if not exists points_cell_idx on "POINTS" (cell);
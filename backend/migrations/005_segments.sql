@@ -0,0 +1,32 @@
+-- Segments and per-user best efforts (see geo/segments.py, jobs/segment_match.py).
+-- Routes remember who created them so efforts can be attributed.
+
+alter table "ROUTE" add column if not exists user_reference text;
+
+create table if not exists "SEGMENT" (
+    id bigint generated by default as identity primary key,
+    name text not null,
+    points jsonb not null,
+    distance_m double precision not null,
+    start_cell bigint not null,
+    start_lat double precision not null,
+    start_lng double precision not null,
+    end_lat double precision not null,
+    end_lng double precision not null,
+    created_by text
+);
+
+create index if not exists segment_start_cell_idx on "SEGMENT" (start_cell);
+
+-- One row per (segment, user): the user's best effort. The rank index makes a
+-- top-k leaderboard read an index range scan of k entries.
+create table if not exists "SEGMENT_EFFORT" (
+    segment_id bigint not null references "SEGMENT" (id) on delete cascade,
+    user_reference text not null,
+    route_id bigint not null references "ROUTE" (id) on delete cascade,
+    elapsed_s double precision not null,
+    started_at timestamptz not null,
+    primary key (segment_id, user_reference)
+);
+
+create index if not exists segment_effort_rank_idx on "SEGMENT_EFFORT" (segment_id, elapsed_s, started_at);
@@ -0,0 +1,70 @@
+-- Groups, their members, and per-member weekly/monthly totals kept up to date
+-- from activity writes (see aggregates/activity_totals.py,
+-- jobs/leaderboard_rebuild.py).
+
+create table if not exists "GROUPS" (
+    id bigint generated by default as identity primary key,
+    name text not null,
+    created_by text not null,
+    created_at timestamptz not null default now()
+);
+
+create table if not exists "GROUP_MEMBER" (
+    group_id bigint not null references "GROUPS" (id) on delete cascade,
+    user_reference text not null,
+    joined_at timestamptz not null default now(),
+    primary key (group_id, user_reference)
+);
+
+-- Activity writes look up every group of the writing user
+create index if not exists group_member_user_idx on "GROUP_MEMBER" (user_reference);
+
+-- One row per (group, period bucket, member). Each metric has a rank index, so
+-- a top-k leaderboard read is an index range scan of k entries regardless of
+-- group size or activity history.
+create table if not exists "GROUP_LEADERBOARD" (
+    group_id bigint not null references "GROUPS" (id) on delete cascade,
+    period text not null,
+    period_start date not null,
+    user_reference text not null,
+    distance bigint not null default 0,
+    duration_s bigint not null default 0,
+    activities integer not null default 0,
+    primary key (group_id, period, period_start, user_reference)
+);
+
+create index if not exists group_leaderboard_distance_idx
+    on "GROUP_LEADERBOARD" (group_id, period, period_start, distance desc, user_reference);
+create index if not exists group_leaderboard_duration_idx
+    on "GROUP_LEADERBOARD" (group_id, period, period_start, duration_s desc, user_reference);
+create index if not exists group_leaderboard_activities_idx
+    on "GROUP_LEADERBOARD" (group_id, period, period_start, activities desc, user_reference);
+
+-- Adds deltas in one call, so concurrent activity writes cannot lose
+-- updates the way a read-modify-write through PostgREST would. Buckets a
+-- member no longer has activities in are removed.
+-- Called as POST /rest/v1/rpc/apply_leaderboard_deltas {"deltas": [...]}.
+create or replace function apply_leaderboard_deltas(deltas jsonb) returns void
+language plpgsql as $$
+begin
+    insert into "GROUP_LEADERBOARD" as g
+        (group_id, period, period_start, user_reference, distance, duration_s, activities)
+    select group_id, period, period_start, user_reference,
+           sum(distance), sum(duration_s), sum(activities)
+    from jsonb_to_recordset(deltas) as d(
+        group_id bigint, period text, period_start date, user_reference text,
+        distance bigint, duration_s bigint, activities integer
+    )
+    group by group_id, period, period_start, user_reference
+    on conflict (group_id, period, period_start, user_reference) do update set
+        distance = g.distance + excluded.distance,
+        duration_s = g.duration_s + excluded.duration_s,
+        activities = g.activities + excluded.activities;
+
+    delete from "GROUP_LEADERBOARD" g
+    using jsonb_to_recordset(deltas) as d(group_id bigint, period text, period_start date, user_reference text)
+    where g.activities <= 0
+      and g.group_id = d.group_id and g.period = d.period
+      and g.period_start = d.period_start and g.user_reference = d.user_reference;
+end;
+$$;
@@ -0,0 +1,46 @@
+-- Per-user daily/weekly/monthly activity totals for the profile summary and
+-- trend chart (see aggregates/activity_totals.py). Kept current from activity
+-- writes; backfill existing users with `python -m jobs.stats_rebuild --all`.
+
+create table if not exists "USER_STATS" (
+    user_reference text not null,
+    period text not null,
+    period_start date not null,
+    distance bigint not null default 0,
+    duration_s bigint not null default 0,
+    activities integer not null default 0,
+    -- Also serves the (user, period, date range) reads
+    primary key (user_reference, period, period_start)
+);
+
+-- Same contract as apply_leaderboard_deltas (migrations/006).
+-- Called as POST /rest/v1/rpc/apply_user_stats_deltas {"deltas": [...]}.
+create or replace function apply_user_stats_deltas(deltas jsonb) returns void
+language plpgsql as $$
+begin
+    insert into "USER_STATS" as s
+        (user_reference, period, period_start, distance, duration_s, activities)
+    select user_reference, period, period_start, sum(distance), sum(duration_s), sum(activities)
+    from jsonb_to_recordset(deltas) as d(
+        user_reference text, period text, period_start date,
+        distance bigint, duration_s bigint, activities integer
+    )
+    group by user_reference, period, period_start
+    on conflict (user_reference, period, period_start) do update set
+        distance = s.distance + excluded.distance,
+        duration_s = s.duration_s + excluded.duration_s,
+        activities = s.activities + excluded.activities;
+
+    delete from "USER_STATS" s
+    using jsonb_to_recordset(deltas) as d(user_reference text, period text, period_start date)
+    where s.activities <= 0
+      and s.user_reference = d.user_reference and s.period = d.period and s.period_start = d.period_start;
+end;
+$$;
+
+-- Distinct users for batch rebuilds; PostgREST has no select distinct.
+-- Called as POST /rest/v1/rpc/activity_user_ids.
+create or replace function activity_user_ids() returns table (user_reference text)
+language sql stable as $$
+    select distinct a.user_reference from activities a order by 1;
+$$;
@@ -0,0 +1,31 @@
+-- POINTS belong to a ROUTE. The key deliberately has no "on delete cascade":
+-- a route with hundreds of thousands of points would then be removed in one
+-- statement holding its locks for the whole delete. Points are removed in
+-- bounded chunks first (delete_route_points below, jobs/route_delete.py), and
+-- deleting a route that still has points fails instead of orphaning them.
+--
+-- NOT VALID: enforced for new writes without scanning existing rows. Once any
+-- orphaned points are gone, run
+--     alter table "POINTS" validate constraint points_route_id_fkey;
+
+do $$
+begin
+    if not exists (select 1 from pg_constraint where conname = 'points_route_id_fkey') then
+        alter table "POINTS" add constraint points_route_id_fkey
+            foreign key (route_id) references "ROUTE" (id) not valid;
+    end if;
+end;
+$$;
+
+-- Deletes at most p_limit points of a route; returns how many went.
+-- Called as POST /rest/v1/rpc/delete_route_points {"p_route_id": 1, "p_limit": 5000}.
+-- Uses points_route_timestamp_idx (migrations/001) to find the chunk.
+create or replace function delete_route_points(p_route_id bigint, p_limit integer) returns integer
+language sql as $$
+    with deleted as (
+        delete from "POINTS"
+        where id in (select id from "POINTS" where route_id = p_route_id limit p_limit)
+        returning 1
+    )
+    select count(*)::integer from deleted;
+$$;
@@ -0,0 +1,29 @@
+-- Live recording over WebSocket (see ingest/live.py). live_seq is the last
+-- client sequence number whose points are stored; reconnecting clients resume
+-- after it.
+
+alter table "ROUTE" add column if not exists live_seq bigint;
+
+-- Stores one batch and advances live_seq in the same transaction, so a batch
+-- is either stored and acknowledged or neither. The row lock on ROUTE orders
+-- concurrent batches for one route; a batch at or below live_seq is a resend
+-- and is skipped. Returns the number of points inserted.
+-- Called as POST /rest/v1/rpc/append_live_points {"p_route_id": 1, "p_seq": 7, "p_points": [...]}.
+create or replace function append_live_points(p_route_id bigint, p_seq bigint, p_points jsonb) returns integer
+language plpgsql as $$
+declare
+    inserted integer;
+begin
+    update "ROUTE" set live_seq = p_seq
+    where id = p_route_id and coalesce(live_seq, 0) < p_seq;
+    if not found then
+        return 0;
+    end if;
+
+    insert into "POINTS" (lat, lng, timestamp, route_id, cell)
+    select lat, lng, timestamp, p_route_id, cell
+    from jsonb_to_recordset(p_points) as p(lat double precision, lng double precision, timestamp timestamptz, cell bigint);
+    get diagnostics inserted = row_count;
+    return inserted;
+end;
+$$;
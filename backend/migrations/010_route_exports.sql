@@ -0,0 +1,7 @@
+-- Indexes backing route exports (see exports/route_export.py).
+-- A user's routes are walked newest first; a route's points are walked in
+-- (timestamp, id) order, with id breaking ties between points recorded in the
+-- same second so a keyset page never skips or repeats one.
+
+create index if not exists route_user_started_at_id_idx on "ROUTE" (user_reference, "startedAt" desc, id desc);
+create index if not exists points_route_timestamp_id_idx on "POINTS" (route_id, timestamp, id);
@@ -0,0 +1,31 @@
+-- Per-user point density per Web Mercator bin and zoom for the heatmap tiles
+-- (see geo/heatmap.py). Kept current from point writes; backfill existing
+-- users with `python -m jobs.heatmap_rebuild --all`.
+
+create table if not exists "HEATMAP_CELL" (
+    user_reference text not null,
+    zoom smallint not null,
+    bin_x integer not null,
+    bin_y integer not null,
+    count bigint not null,
+    -- A tile read is a range scan of this key: (user, zoom, bin_x range) filtered on bin_y
+    primary key (user_reference, zoom, bin_x, bin_y)
+);
+
+-- Adds count deltas, creating missing bins and removing bins that reach zero.
+-- Called as POST /rest/v1/rpc/apply_heatmap_deltas {"deltas": [...]}.
+create or replace function apply_heatmap_deltas(deltas jsonb) returns void
+language plpgsql as $$
+begin
+    insert into "HEATMAP_CELL" as h (user_reference, zoom, bin_x, bin_y, count)
+    select user_reference, zoom, bin_x, bin_y, sum(count)
+    from jsonb_to_recordset(deltas) as d(user_reference text, zoom smallint, bin_x integer, bin_y integer, count bigint)
+    group by user_reference, zoom, bin_x, bin_y
+    on conflict (user_reference, zoom, bin_x, bin_y) do update set count = h.count + excluded.count;
+
+    delete from "HEATMAP_CELL" h
+    using jsonb_to_recordset(deltas) as d(user_reference text, zoom smallint, bin_x integer, bin_y integer, count bigint)
+    where d.count < 0 and h.count <= 0
+      and h.user_reference = d.user_reference and h.zoom = d.zoom and h.bin_x = d.bin_x and h.bin_y = d.bin_y;
+end;
+$$;
@@ -0,0 +1,32 @@
+-- Routes near a point (GET /routes/?near=, storage/base.py get_routes_near).
+-- Returns each route's nearest point instead of every point in the box, so
+-- only one row per route leaves the database.
+
+-- Each route's point nearest to (p_lat, p_lng), nearest first, at most
+-- p_limit rows (all of them when null). Candidates are the points in the
+-- cell ranges [p_lo[i], p_hi[i]) within the box, read through points_cell_idx
+-- (migrations/004); distance is equirectangular in degrees, dlat^2 + p_kx2 *
+-- dlng^2, bounded by p_max_d2 (see geo/spatial.py near_filter).
+-- Called as POST /rest/v1/rpc/nearest_route_points {"p_lo": [...], "p_hi": [...], ...}.
+create or replace function nearest_route_points(
+    p_lo bigint[], p_hi bigint[],
+    p_min_lat double precision, p_max_lat double precision,
+    p_min_lng double precision, p_max_lng double precision,
+    p_lat double precision, p_lng double precision,
+    p_kx2 double precision, p_max_d2 double precision, p_limit integer default null
+) returns table (route_id bigint, lat double precision, lng double precision)
+language sql stable as $$
+    select n.route_id, n.lat, n.lng
+    from (
+        select distinct on (p.route_id) p.route_id, p.lat, p.lng,
+               (p.lat - p_lat) ^ 2 + p_kx2 * (p.lng - p_lng) ^ 2 as d2
+        from unnest(p_lo, p_hi) as r(lo, hi)
+        join "POINTS" p on p.cell >= r.lo and p.cell < r.hi
+        where p.route_id is not null
+          and p.lat between p_min_lat and p_max_lat and p.lng between p_min_lng and p_max_lng
+        order by p.route_id, d2
+    ) n
+    where n.d2 <= p_max_d2
+    order by n.d2
+    limit p_limit;
+$$;
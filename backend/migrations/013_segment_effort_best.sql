@@ -0,0 +1,19 @@
+-- Records segment efforts, keeping each user's best per segment, in one
+-- statement: an effort is inserted, or replaces the stored one only when it is
+-- faster. Returns the rows that were written, i.e. the new personal bests.
+-- The batch is first cut to its fastest effort per (segment, user), since one
+-- upsert cannot touch a row twice.
+-- Called as POST /rest/v1/rpc/record_segment_efforts {"p_efforts": [...]}.
+create or replace function record_segment_efforts(p_efforts jsonb) returns setof "SEGMENT_EFFORT"
+language sql as $$
+    insert into "SEGMENT_EFFORT" as s (segment_id, user_reference, route_id, elapsed_s, started_at)
+    select distinct on (segment_id, user_reference) segment_id, user_reference, route_id, elapsed_s, started_at
+    from jsonb_to_recordset(p_efforts) as e(
+        segment_id bigint, user_reference text, route_id bigint, elapsed_s double precision, started_at timestamptz
+    )
+    order by segment_id, user_reference, elapsed_s
+    on conflict (segment_id, user_reference) do update set
+        route_id = excluded.route_id, elapsed_s = excluded.elapsed_s, started_at = excluded.started_at
+    where excluded.elapsed_s < s.elapsed_s
+    returning s.*;
+$$;
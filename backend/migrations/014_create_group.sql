@@ -0,0 +1,17 @@
+-- Creates a group and its owner's membership in one transaction, so a group
+-- never exists without its creator as a member. Returns the group row.
+-- Called as POST /rest/v1/rpc/create_group {"p_name": "...", "p_user_reference": "..."}.
+create or replace function create_group(p_name text, p_user_reference text) returns setof "GROUPS"
+language plpgsql as $$
+declare
+    g "GROUPS";
+begin
+    insert into "GROUPS" (name, created_by, created_at)
+    values (p_name, p_user_reference, now())
+    returning * into g;
+
+    insert into "GROUP_MEMBER" (group_id, user_reference, joined_at)
+    values (g.id, p_user_reference, g.created_at);
+    return next g;
+end;
+$$;
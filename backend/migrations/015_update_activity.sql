@@ -0,0 +1,31 @@
+-- Updates one of a user's activities and returns the row before and after,
+-- read under the same row lock, for the user stats and leaderboard deltas
+-- (storage/base.py _track_activity_write). p_changes holds the columns to set;
+-- no row comes back when the activity does not exist or is someone else's.
+-- Called as POST /rest/v1/rpc/update_activity {"p_id": 1, "p_user_reference": "...", "p_changes": {...}}.
+create or replace function update_activity(p_id bigint, p_user_reference text, p_changes jsonb)
+returns table (before jsonb, after jsonb)
+language plpgsql as $$
+declare
+    assignments text;
+begin
+    select string_agg(format('%I = r.%I', key, key), ', ') into assignments
+    from jsonb_object_keys(p_changes) as key;
+
+    if assignments is null then
+        return query select to_jsonb(a.*), to_jsonb(a.*) from activities a
+            where a.id = p_id and a.user_reference = p_user_reference;
+        return;
+    end if;
+
+    -- The locked subquery row is the old version; RETURNING a.* the new one
+    return query execute format(
+        'update activities a set %s
+         from (select * from activities where id = $1 and user_reference = $2 for update) old,
+              jsonb_populate_record(null::activities, $3) r
+         where a.id = old.id
+         returning to_jsonb(old.*), to_jsonb(a.*)',
+        assignments
+    ) using p_id, p_user_reference, p_changes;
+end;
+$$;
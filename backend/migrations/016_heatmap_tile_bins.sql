@@ -0,0 +1,19 @@
+-- Bins of one heatmap tile, summed over the given users (one user for a
+-- personal tile, the members for a group tile). Returned as a single JSON
+-- array rather than a set of rows: a dense tile holds up to 64 x 64 bins per
+-- user, past PostgREST's max-rows, which would cut a row set off silently.
+-- Reads the (user_reference, zoom, bin_x, bin_y) key of HEATMAP_CELL (migrations/011).
+-- Called as POST /rest/v1/rpc/heatmap_tile_bins {"p_users": [...], "p_zoom": 12, ...}.
+create or replace function heatmap_tile_bins(
+    p_users text[], p_zoom smallint, p_min_x integer, p_max_x integer, p_min_y integer, p_max_y integer
+) returns jsonb
+language sql stable as $$
+    select coalesce(jsonb_agg(jsonb_build_object('bin_x', bin_x, 'bin_y', bin_y, 'count', count)), '[]'::jsonb)
+    from (
+        select bin_x, bin_y, sum(count) as count
+        from "HEATMAP_CELL"
+        where user_reference = any(p_users) and zoom = p_zoom
+          and bin_x between p_min_x and p_max_x and bin_y between p_min_y and p_max_y
+        group by bin_x, bin_y
+    ) bins;
+$$;
@@ -0,0 +1,7 @@
+-- Distinct route owners for heatmap rebuilds (jobs/heatmap_rebuild.py --all);
+-- PostgREST has no select distinct. Read in pages like a table:
+-- POST /rest/v1/rpc/route_user_ids?order=user_reference.asc&limit=1000&user_reference=gt.<last>.
+create or replace function route_user_ids() returns table (user_reference text)
+language sql stable as $$
+    select distinct r.user_reference from "ROUTE" r where r.user_reference is not null order by 1;
+$$;
@@ -0,0 +1,492 @@
+"""Storage backend interface the API depends on.
+
+Backends own table I/O for activities, routes, points and route levels of
+detail; authentication stays with Supabase (GoTrue + JWKS) whichever backend
+stores the data. Reads that feed conditional GETs come in `_with_etag`
+variants returning (value, etag); the plain variants are derived here.
+"""
+import asyncio
+import os
+from abc import ABC, abstractmethod
+from typing import Optional, List, Dict, Any, Callable
+import numpy as np
+from aggregates.activity_totals import PERIODS, STATS_PERIODS, activity_deltas
+from geo.heatmap import affected_tiles, heatmap_deltas
+from geo.spatial import cell_ids, distances_m
+from geo.tile_cache import disk_tile_cache, group_scope, tile_key, user_scope
+from instrumentation.log import get_logger
+from supabase_handler.read_cache import read_cache, memory_cache_backend, redis_cache_backend
+
+logger = get_logger("storage")
+
+# Points removed per statement when a route's points are deleted
+POINT_DELETE_CHUNK = int(os.getenv("POINT_DELETE_CHUNK", "5000"))
+
+# First circle get_routes_near searches; it doubles until enough routes are found
+NEAR_START_RADIUS_M = float(os.getenv("NEAR_START_RADIUS_M", "250"))
+
+ACTIVITY_KEYSET = (("date", "desc"), ("id", "desc"))
+ROUTE_KEYSET = (("startedAt", "desc"), ("id", "desc"))
+ROUTE_POINT_KEYSET = (("timestamp", "asc"), ("id", "asc"))
+
+
+def make_read_cache() -> read_cache:
+    # Read-through cache; a shared Redis backend keeps workers consistent
+    redis_url = os.getenv("READ_CACHE_REDIS_URL")
+    backend = redis_cache_backend(redis_url) if redis_url else memory_cache_backend(
+        int(os.getenv("READ_CACHE_SIZE", "10000")), int(os.getenv("READ_CACHE_SCOPES", "10000"))
+    )
+    return read_cache(backend, ttl=float(os.getenv("READ_CACHE_TTL", "30")))
+
+
+def index_points(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Set the spatial `cell` of POINTS rows in place (one vectorized pass)."""
+    if rows:
+        lat = np.fromiter((r["lat"] for r in rows), dtype=np.float64, count=len(rows))
+        lng = np.fromiter((r["lng"] for r in rows), dtype=np.float64, count=len(rows))
+        for row, cell in zip(rows, cell_ids(lat, lng).tolist()):
+            row["cell"] = cell
+    return rows
+
+
+class storage_backend(ABC):
+    cache: read_cache
+    # Set by the API so point writes drop the heatmap tiles they change
+    heatmap_tiles: Optional[disk_tile_cache] = None
+
+    @abstractmethod
+    async def aclose(self):
+        ...
+
+    # activities
+    @abstractmethod
+    async def create_activity(self, activity_data: dict, user_id: str):
+        ...
+
+    @abstractmethod
+    async def get_user_activities(self, user_id: str):
+        ...
+
+    @abstractmethod
+    async def get_activities_by_ids(self, activity_ids: List[int], user_id: str):
+        """The user's activities among `activity_ids`, in no particular order, in one query."""
+
+    @abstractmethod
+    async def list_user_activities_with_etag(self, user_id: str, limit: int, cursor: Optional[str] = None,
+                                             fields: Optional[List[str]] = None, allowed_fields: Optional[List[str]] = None):
+        ...
+
+    @abstractmethod
+    async def get_activity_by_id_with_etag(self, activity_id: int, user_id: str):
+        ...
+
+    @abstractmethod
+    async def update_activity(self, activity_id: int, activity_data: dict, user_id: str):
+        ...
+
+    @abstractmethod
+    async def delete_activity(self, activity_id: int, user_id: str):
+        ...
+
+    # ROUTE
+    @abstractmethod
+    async def create_route(self, route_data: dict, user_id: Optional[str] = None):
+        ...
+
+    @abstractmethod
+    async def get_route_by_id_with_etag(self, route_id: int):
+        ...
+
+    @abstractmethod
+    async def get_all_routes(self):
+        ...
+
+    @abstractmethod
+    async def list_routes_with_etag(self, limit: int, cursor: Optional[str] = None,
+                                    fields: Optional[List[str]] = None, allowed_fields: Optional[List[str]] = None):
+        ...
+
+    @abstractmethod
+    async def get_routes_by_ids(self, route_ids: List[int]):
+        ...
+
+    @abstractmethod
+    async def list_user_routes(self, user_id: str, limit: int, cursor: Optional[str] = None):
+        """One uncached keyset page of the routes a user created, most recent first: (rows, next_cursor)."""
+
+    @abstractmethod
+    async def update_route(self, route_id: int, route_data: dict):
+        ...
+
+    @abstractmethod
+    async def delete_route(self, route_id: int):
+        """Delete the ROUTE row (its levels of detail and segment efforts go with it).
+
+        Fails while the route still has points; see delete_points_by_route.
+        """
+
+    # POINTS
+    @abstractmethod
+    async def create_point(self, point_data: dict):
+        ...
+
+    @abstractmethod
+    async def create_points_batch(self, points_data: list):
+        ...
+
+    @abstractmethod
+    async def get_point_by_id(self, point_id: int):
+        ...
+
+    @abstractmethod
+    async def get_points_by_ids(self, point_ids: List[int]):
+        """Points among `point_ids`, in no particular order, in one query."""
+
+    @abstractmethod
+    async def get_points_by_route(self, route_id: int):
+        ...
+
+    @abstractmethod
+    async def list_route_points(self, route_id: int, limit: int, cursor: Optional[str] = None,
+                                fields: Optional[List[str]] = None):
+        """One uncached keyset page of a route's points in time order: (rows, next_cursor).
+
+        For exports, which walk a whole route without holding it in memory. A
+        backend may return fewer than `limit` rows with a next_cursor; callers
+        page on until the cursor is None.
+        """
+
+    @abstractmethod
+    async def get_points_in_bbox(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float,
+                                 limit: Optional[int] = None, columns: Optional[List[str]] = None):
+        """Points inside the box, found through the `cell` index."""
+
+    @abstractmethod
+    async def nearest_route_points(self, lat: float, lng: float, radius_m: float,
+                                   limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Each route's point nearest to (lat, lng), about `radius_m` around it: [{route_id, lat, lng}].
+
+        One row per route, nearest first by the near_filter ranking, at most
+        `limit`; computed in storage so only those rows come back. Callers
+        check the exact distance.
+        """
+
+    @abstractmethod
+    async def update_point(self, point_id: int, point_data: dict):
+        ...
+
+    @abstractmethod
+    async def delete_point(self, point_id: int):
+        ...
+
+    @abstractmethod
+    async def append_route_points(self, route_id: int, points_data: list, seq: int) -> int:
+        """Insert a live-recording batch and advance ROUTE.live_seq to `seq`, atomically.
+
+        Does nothing and returns 0 unless `seq` is above the stored live_seq, so
+        a batch resent after a reconnect is not stored twice. Returns the number
+        of points inserted.
+        """
+
+    @abstractmethod
+    async def delete_route_points_chunk(self, route_id: int, limit: int) -> int:
+        """Delete at most `limit` points of a route in one short statement; returns the number deleted."""
+
+    async def delete_points_by_route(self, route_id: int, chunk_size: Optional[int] = None,
+                                     on_chunk: Optional[Callable[[int], Any]] = None) -> int:
+        """Delete every point of a route, one bounded chunk at a time. Returns the number deleted.
+
+        Other writes get in between chunks, so a long route never holds the
+        table for the whole delete. `on_chunk(deleted_so_far)` reports progress.
+        """
+        chunk_size = chunk_size or POINT_DELETE_CHUNK
+        total = 0
+        while True:
+            deleted = await self.delete_route_points_chunk(route_id, chunk_size)
+            total += deleted
+            if on_chunk is not None and deleted:
+                on_chunk(total)
+            if deleted < chunk_size:
+                return total
+
+    # ROUTE_LOD
+    @abstractmethod
+    async def get_route_lod_with_etag(self, route_id: int, max_tolerance_m: float):
+        ...
+
+    @abstractmethod
+    async def replace_route_lods(self, route_id: int, lod_rows: list):
+        ...
+
+    # SEGMENT and SEGMENT_EFFORT
+    @abstractmethod
+    async def create_segment(self, segment_data: dict):
+        ...
+
+    @abstractmethod
+    async def get_segment_by_id(self, segment_id: int):
+        ...
+
+    @abstractmethod
+    async def get_segments_by_start_cells(self, cells: List[int]):
+        """Segments whose start_cell is one of `cells` (see geo.segments)."""
+
+    @abstractmethod
+    async def delete_segment(self, segment_id: int):
+        ...
+
+    @abstractmethod
+    async def record_segment_efforts(self, efforts: list):
+        """Keep each effort only if it beats the user's best on that segment; returns the kept rows."""
+
+    @abstractmethod
+    async def get_segment_leaderboard_with_etag(self, segment_id: int, limit: int):
+        """Fastest `limit` efforts, one per user, fastest first: (rows, etag)."""
+
+    async def get_segment_leaderboard(self, segment_id: int, limit: int):
+        rows, _ = await self.get_segment_leaderboard_with_etag(segment_id, limit)
+        return rows
+
+    # GROUPS, GROUP_MEMBER and GROUP_LEADERBOARD
+    @abstractmethod
+    async def create_group(self, group_data: dict, user_id: str):
+        """Create a group with its creator as the first member."""
+
+    @abstractmethod
+    async def get_group_by_id(self, group_id: int):
+        ...
+
+    @abstractmethod
+    async def get_all_groups(self):
+        ...
+
+    @abstractmethod
+    async def delete_group(self, group_id: int):
+        ...
+
+    @abstractmethod
+    async def add_group_member(self, group_id: int, user_id: str):
+        ...
+
+    @abstractmethod
+    async def remove_group_member(self, group_id: int, user_id: str):
+        ...
+
+    @abstractmethod
+    async def get_group_members(self, group_id: int):
+        ...
+
+    @abstractmethod
+    async def get_user_group_ids(self, user_id: str) -> List[int]:
+        ...
+
+    @abstractmethod
+    async def apply_leaderboard_deltas(self, deltas: list):
+        """Add GROUP_LEADERBOARD deltas atomically, creating missing rows."""
+
+    @abstractmethod
+    async def replace_group_leaderboard(self, group_id: int, rows: list, user_id: Optional[str] = None):
+        """Bulk replace a group's aggregate rows (only `user_id`'s, if given)."""
+
+    @abstractmethod
+    async def get_group_leaderboard_with_etag(self, group_id: int, period: str, period_start: str,
+                                              metric: str, limit: int):
+        """Top `limit` members of a group for one period bucket by `metric`: (rows, etag)."""
+
+    async def get_group_leaderboard(self, group_id: int, period: str, period_start: str, metric: str, limit: int):
+        rows, _ = await self.get_group_leaderboard_with_etag(group_id, period, period_start, metric, limit)
+        return rows
+
+    # USER_STATS
+    @abstractmethod
+    async def apply_user_stats_deltas(self, deltas: list):
+        """Add USER_STATS deltas atomically, creating missing buckets."""
+
+    @abstractmethod
+    async def replace_user_stats(self, user_id: str, rows: list):
+        """Bulk replace every stats bucket of one user."""
+
+    @abstractmethod
+    async def get_user_stats_with_etag(self, user_id: str, period: str, first: str, last: str):
+        """A user's non-empty `period` buckets starting in [first, last], oldest first: (rows, etag)."""
+
+    @abstractmethod
+    async def get_route_user_ids(self) -> List[str]:
+        """Every user who owns at least one route (for heatmap rebuilds)."""
+
+    @abstractmethod
+    async def get_activity_user_ids(self) -> List[str]:
+        """Every user with at least one activity (for batch rebuilds)."""
+
+    async def get_user_stats(self, user_id: str, period: str, first: str, last: str):
+        rows, _ = await self.get_user_stats_with_etag(user_id, period, first, last)
+        return rows
+
+    # HEATMAP_CELL
+    @abstractmethod
+    async def apply_heatmap_deltas(self, deltas: list):
+        """Add HEATMAP_CELL count deltas atomically, creating missing bins and removing emptied ones."""
+
+    @abstractmethod
+    async def replace_user_heatmap(self, user_id: str, rows: list):
+        """Bulk replace every heatmap bin of one user."""
+
+    @abstractmethod
+    async def get_heatmap_bins(self, user_ids: List[str], zoom: int, min_x: int, max_x: int,
+                               min_y: int, max_y: int) -> List[Dict[str, Any]]:
+        """Uncached bins of `user_ids` at `zoom` inside the inclusive bin range, one row per bin summed over the users."""
+
+    async def _track_activity_write(self, user_id: str, before: Optional[dict], after: Optional[dict]):
+        # Push the write's contribution change into the user's stats buckets and
+        # every group leaderboard the user is in. The activity itself is already
+        # stored, so a failure here only leaves the aggregates stale until the
+        # next rebuild (jobs.stats_rebuild, jobs.leaderboard_rebuild).
+        if before is None and after is None:
+            return
+        deltas = activity_deltas(before, after, STATS_PERIODS)
+        if not deltas:
+            return
+        try:
+            await self.apply_user_stats_deltas([{**delta, "user_reference": user_id} for delta in deltas])
+        except Exception as e:
+            logger.warning("Failed to update user stats", extra={"fields": {"user": user_id, "error": str(e)}})
+        try:
+            group_ids = await self.get_user_group_ids(user_id)
+            if group_ids:
+                await self.apply_leaderboard_deltas([
+                    {**delta, "group_id": group_id, "user_reference": user_id}
+                    for group_id in group_ids for delta in deltas if delta["period"] in PERIODS
+                ])
+        except Exception as e:
+            logger.warning("Failed to update leaderboard aggregates", extra={"fields": {"user": user_id, "error": str(e)}})
+
+    async def _track_point_write(self, points: List[Dict[str, Any]], sign: int = 1):
+        # Count stored points into their route owners' heatmap bins (sign -1 takes
+        # them out again). The points are already stored, so a failure here only
+        # leaves the heatmap stale until the next rebuild (jobs.heatmap_rebuild).
+        route_ids = sorted({p["route_id"] for p in points if p.get("route_id") is not None})
+        if not route_ids:
+            return
+        try:
+            owners = {r["id"]: r.get("user_reference") for r in await self.get_routes_by_ids(route_ids)}
+            by_user: Dict[str, List[Dict[str, Any]]] = {}
+            for p in points:
+                user_id = owners.get(p.get("route_id"))
+                if user_id:
+                    by_user.setdefault(user_id, []).append(p)
+            for user_id, rows in by_user.items():
+                lat = np.fromiter((r["lat"] for r in rows), dtype=np.float64, count=len(rows))
+                lng = np.fromiter((r["lng"] for r in rows), dtype=np.float64, count=len(rows))
+                await self._apply_heatmap_points(user_id, lat, lng, sign)
+        except Exception as e:
+            logger.warning("Failed to update heatmap", extra={"fields": {"routes": route_ids, "error": str(e)}})
+
+    async def _apply_heatmap_points(self, user_id: str, lat: np.ndarray, lng: np.ndarray, sign: int):
+        deltas = heatmap_deltas(lat, lng, sign)
+        await self.apply_heatmap_deltas([{**d, "user_reference": user_id} for d in deltas])
+        if self.heatmap_tiles is not None:
+            tiles = affected_tiles(deltas)
+            scopes = [user_scope(user_id)] + [group_scope(g) for g in await self.get_user_group_ids(user_id)]
+            await asyncio.to_thread(self.heatmap_tiles.invalidate, [
+                tile_key(scope, z, x, y, ext) for scope in scopes for z, x, y in tiles for ext in ("png", "json")
+            ])
+
+    async def remove_route_from_heatmap(self, route_id: int, page_size: int = POINT_DELETE_CHUNK):
+        """Subtract a route's points from its owner's heatmap, a page at a time; call before deleting them."""
+        try:
+            route = await self.get_route_by_id(route_id)
+            user_id = route.get("user_reference") if route else None
+            if not user_id:
+                return
+            cursor = None
+            while True:
+                rows, cursor = await self.list_route_points(route_id, page_size, cursor, ["lat", "lng"])
+                if rows:
+                    lat = np.fromiter((r["lat"] for r in rows), dtype=np.float64, count=len(rows))
+                    lng = np.fromiter((r["lng"] for r in rows), dtype=np.float64, count=len(rows))
+                    await self._apply_heatmap_points(user_id, lat, lng, -1)
+                if cursor is None:
+                    return
+        except Exception as e:
+            logger.warning("Failed to remove route from heatmap", extra={"fields": {"route_id": route_id, "error": str(e)}})
+
+    async def list_user_activities(self, user_id: str, limit: int, cursor: Optional[str] = None,
+                                   fields: Optional[List[str]] = None, allowed_fields: Optional[List[str]] = None):
+        """One keyset page of a user's activities, newest first: (rows, next_cursor)."""
+        result, _ = await self.list_user_activities_with_etag(user_id, limit, cursor, fields, allowed_fields)
+        return result
+
+    async def get_activity_by_id(self, activity_id: int, user_id: str):
+        activity, _ = await self.get_activity_by_id_with_etag(activity_id, user_id)
+        return activity
+
+    async def get_route_by_id(self, route_id: int):
+        route, _ = await self.get_route_by_id_with_etag(route_id)
+        return route
+
+    async def list_routes(self, limit: int, cursor: Optional[str] = None,
+                          fields: Optional[List[str]] = None, allowed_fields: Optional[List[str]] = None):
+        """One keyset page of routes, most recent first: (rows, next_cursor)."""
+        result, _ = await self.list_routes_with_etag(limit, cursor, fields, allowed_fields)
+        return result
+
+    async def get_route_lod(self, route_id: int, max_tolerance_m: float):
+        lod, _ = await self.get_route_lod_with_etag(route_id, max_tolerance_m)
+        return lod
+
+    async def _point_before_update(self, point_id: int, point_data: dict) -> Optional[Dict[str, Any]]:
+        # The stored row when the update moves the point or changes its route, for
+        # the heatmap (and the cell of a partial move); None when neither changes
+        if any(key in point_data for key in ("lat", "lng", "route_id")):
+            return await self.get_point_by_id(point_id)
+        return None
+
+    async def _track_point_update(self, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]):
+        # Move the point's heatmap count from where it was to where it is now
+        if before is None or after is None:
+            return
+        if (before.get("lat"), before.get("lng"), before.get("route_id")) == (after.get("lat"), after.get("lng"), after.get("route_id")):
+            return
+        await self._track_point_write([before], -1)
+        await self._track_point_write([after], 1)
+
+    async def _reindex_point_update(self, point_id: int, point_data: dict, current: Optional[dict] = None) -> dict:
+        # Moving a point moves its cell; a partial move needs the other coordinate
+        if "lat" in point_data or "lng" in point_data:
+            if current is None:
+                current = {} if "lat" in point_data and "lng" in point_data else (await self.get_point_by_id(point_id) or {})
+            merged = {"lat": point_data.get("lat", current.get("lat")), "lng": point_data.get("lng", current.get("lng"))}
+            if merged["lat"] is not None and merged["lng"] is not None:
+                point_data["cell"] = index_points([merged])[0]["cell"]
+        return point_data
+
+    async def get_routes_near(self, lat: float, lng: float, radius_m: float, limit: int) -> List[Dict[str, Any]]:
+        """Routes with a point within `radius_m` of (lat, lng), nearest first, with `distance_m`.
+
+        Searched in circles growing from NEAR_START_RADIUS_M, doubling up to
+        `radius_m`: once a circle holds `limit` routes, no route outside it can
+        be nearer, so the search stops there. Each step asks storage for one
+        row per route (its nearest point), so the cost follows the points in
+        the circle actually needed, not the whole radius.
+        """
+        search_m = min(radius_m, NEAR_START_RADIUS_M)
+        while True:
+            rows = await self.nearest_route_points(lat, lng, search_m, limit)
+            nearest = []
+            if rows:
+                lats = np.fromiter((r["lat"] for r in rows), dtype=np.float64, count=len(rows))
+                lngs = np.fromiter((r["lng"] for r in rows), dtype=np.float64, count=len(rows))
+                nearest = sorted(
+                    (d, r["route_id"]) for d, r in zip(distances_m(lat, lng, lats, lngs).tolist(), rows) if d <= search_m
+                )
+            if len(nearest) >= limit or search_m >= radius_m:
+                break
+            search_m = min(radius_m, search_m * 2)
+        nearest = nearest[:limit]
+        if not nearest:
+            return []
+        routes = {r["id"]: r for r in await self.get_routes_by_ids([route_id for _, route_id in nearest])}
+        return [
+            {**routes[route_id], "distance_m": round(d, 1)}
+            for d, route_id in nearest if route_id in routes
+        ]
@@ -0,0 +1,23 @@
+import os
+from typing import Optional
+from .base import storage_backend
+
+BACKENDS = ("supabase", "sqlite")
+
+
+def create_storage_backend(name: Optional[str] = None, supabase_backend: Optional[storage_backend] = None) -> storage_backend:
+    """Backend selected by STORAGE_BACKEND (supabase by default).
+
+    `supabase_backend` lets the caller share the async handler it already
+    uses for authentication instead of opening a second connection pool.
+    """
+    name = (name or os.getenv("STORAGE_BACKEND", "supabase")).lower()
+    if name == "supabase":
+        if supabase_backend is not None:
+            return supabase_backend
+        from supabase_handler.async_supabase_handler import async_supabase_handler
+        return async_supabase_handler()
+    if name == "sqlite":
+        from .sqlite_backend import sqlite_backend
+        return sqlite_backend()
+    raise ValueError(f"Unknown STORAGE_BACKEND {name!r}, expected one of {', '.join(BACKENDS)}")
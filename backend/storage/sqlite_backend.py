@@ -0,0 +1,997 @@
+"""Storage backend on a local SQLite database.
+
+Skips the PostgREST hop entirely: queries run on the database file through
+the stdlib sqlite3 module. The database is opened in WAL mode, so reads run
+concurrently on a small reader pool while all writes go through one writer
+thread. Every statement is built from fixed SQL text with `?` parameters,
+which lets sqlite3's per-connection statement cache reuse the prepared
+statements.
+
+    STORAGE_BACKEND=sqlite SQLITE_PATH=/var/lib/carva/carva.db uvicorn main:app
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timezone
+from typing import Any, Dict, List, Optional, Sequence
+from supabase_handler.pagination import keyset_sql, select_columns, page
+from aggregates.activity_totals import METRICS
+from geo.spatial import cover_bbox, near_filter
+from .base import storage_backend, make_read_cache, index_points, ACTIVITY_KEYSET, ROUTE_KEYSET, ROUTE_POINT_KEYSET
+
+SCHEMA = """
+create table if not exists activities (
+    id integer primary key,
+    route text not null,
+    time text not null,
+    distance integer not null,
+    date text not null,
+    "avgSpeed" integer not null,
+    title text not null,
+    user_reference text not null
+);
+create index if not exists activities_user_date_id_idx on activities (user_reference, date desc, id desc);
+
+create table if not exists "ROUTE" (
+    id integer primary key,
+    "startedAt" text not null,
+    "endedAt" text not null,
+    "distanceKm" real not null,
+    "avgSpeedKmh" real not null,
+    "durationS" real,
+    "movingTimeS" real,
+    "maxSpeedKmh" real,
+    "avgMovingSpeedKmh" real,
+    "splitsS" text
+);
+create index if not exists route_started_at_id_idx on "ROUTE" ("startedAt" desc, id desc);
+
+create table if not exists "POINTS" (
+    id integer primary key,
+    lat real not null,
+    lng real not null,
+    timestamp text not null,
+    route_id integer references "ROUTE" (id),
+    cell integer
+);
+create index if not exists points_route_timestamp_idx on "POINTS" (route_id, timestamp);
+
+create table if not exists "ROUTE_LOD" (
+    route_id integer not null references "ROUTE" (id) on delete cascade,
+    level integer not null,
+    tolerance_m real not null,
+    point_count integer not null,
+    points text not null,
+    primary key (route_id, level)
+);
+create index if not exists route_lod_route_tolerance_idx on "ROUTE_LOD" (route_id, tolerance_m);
+
+create table if not exists "SEGMENT" (
+    id integer primary key,
+    name text not null,
+    points text not null,
+    distance_m real not null,
+    start_cell integer not null,
+    start_lat real not null,
+    start_lng real not null,
+    end_lat real not null,
+    end_lng real not null,
+    created_by text
+);
+create index if not exists segment_start_cell_idx on "SEGMENT" (start_cell);
+
+create table if not exists "SEGMENT_EFFORT" (
+    segment_id integer not null references "SEGMENT" (id) on delete cascade,
+    user_reference text not null,
+    route_id integer not null references "ROUTE" (id) on delete cascade,
+    elapsed_s real not null,
+    started_at text not null,
+    primary key (segment_id, user_reference)
+);
+create index if not exists segment_effort_rank_idx on "SEGMENT_EFFORT" (segment_id, elapsed_s, started_at);
+
+create table if not exists "GROUPS" (
+    id integer primary key,
+    name text not null,
+    created_by text not null,
+    created_at text not null
+);
+
+create table if not exists "GROUP_MEMBER" (
+    group_id integer not null references "GROUPS" (id) on delete cascade,
+    user_reference text not null,
+    joined_at text not null,
+    primary key (group_id, user_reference)
+);
+create index if not exists group_member_user_idx on "GROUP_MEMBER" (user_reference);
+
+create table if not exists "GROUP_LEADERBOARD" (
+    group_id integer not null references "GROUPS" (id) on delete cascade,
+    period text not null,
+    period_start text not null,
+    user_reference text not null,
+    distance integer not null default 0,
+    duration_s integer not null default 0,
+    activities integer not null default 0,
+    primary key (group_id, period, period_start, user_reference)
+);
+create index if not exists group_leaderboard_distance_idx
+    on "GROUP_LEADERBOARD" (group_id, period, period_start, distance desc, user_reference);
+create index if not exists group_leaderboard_duration_idx
+    on "GROUP_LEADERBOARD" (group_id, period, period_start, duration_s desc, user_reference);
+create index if not exists group_leaderboard_activities_idx
+    on "GROUP_LEADERBOARD" (group_id, period, period_start, activities desc, user_reference);
+
+create table if not exists "USER_STATS" (
+    user_reference text not null,
+    period text not null,
+    period_start text not null,
+    distance integer not null default 0,
+    duration_s integer not null default 0,
+    activities integer not null default 0,
+    primary key (user_reference, period, period_start)
+);
+
+create table if not exists "HEATMAP_CELL" (
+    user_reference text not null,
+    zoom integer not null,
+    bin_x integer not null,
+    bin_y integer not null,
+    count integer not null,
+    primary key (user_reference, zoom, bin_x, bin_y)
+) without rowid;
+"""
+
+# Applied in order to databases created by an older SCHEMA
+UPGRADES = (
+    ("POINTS", "cell", 'alter table "POINTS" add column cell integer'),
+    ("ROUTE", "user_reference", 'alter table "ROUTE" add column user_reference text'),
+    ("ROUTE", "live_seq", 'alter table "ROUTE" add column live_seq integer'),
+)
+INDEXES = """
+create index if not exists points_cell_idx on "POINTS" (cell);
+create index if not exists route_user_started_at_id_idx on "ROUTE" (user_reference, "startedAt" desc, id desc);
+"""
+
+COLUMNS = {
+    "activities": ("id", "route", "time", "distance", "date", "avgSpeed", "title", "user_reference"),
+    "ROUTE": ("id", "startedAt", "endedAt", "distanceKm", "avgSpeedKmh", "durationS", "movingTimeS",
+              "maxSpeedKmh", "avgMovingSpeedKmh", "splitsS", "user_reference", "live_seq"),
+    "POINTS": ("id", "lat", "lng", "timestamp", "route_id", "cell"),
+    "ROUTE_LOD": ("route_id", "level", "tolerance_m", "point_count", "points"),
+    "SEGMENT": ("id", "name", "points", "distance_m", "start_cell", "start_lat", "start_lng", "end_lat", "end_lng",
+                "created_by"),
+    "SEGMENT_EFFORT": ("segment_id", "user_reference", "route_id", "elapsed_s", "started_at"),
+    "GROUPS": ("id", "name", "created_by", "created_at"),
+    "GROUP_MEMBER": ("group_id", "user_reference", "joined_at"),
+    "GROUP_LEADERBOARD": ("group_id", "period", "period_start", "user_reference", "distance", "duration_s",
+                          "activities"),
+    "USER_STATS": ("user_reference", "period", "period_start", "distance", "duration_s", "activities"),
+    "HEATMAP_CELL": ("user_reference", "zoom", "bin_x", "bin_y", "count"),
+}
+JSON_COLUMNS = {"ROUTE": ("splitsS",), "ROUTE_LOD": ("points",), "SEGMENT": ("points",)}
+
+# Rows per multi-row INSERT; a fixed size keeps the statement text, and so the
+# prepared statement, identical between batches
+INSERT_CHUNK = 256
+
+
+def _quote(column: str) -> str:
+    return f'"{column}"'
+
+
+def _encode(table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+    allowed = COLUMNS[table]
+    unknown = [k for k in row if k not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown columns for {table}: {', '.join(unknown)}")
+    encoded = {}
+    json_columns = JSON_COLUMNS.get(table, ())
+    for key, value in row.items():
+        if key in json_columns and value is not None:
+            value = json.dumps(value, separators=(",", ":"))
+        elif isinstance(value, (datetime, date, time)):
+            value = value.isoformat()
+        encoded[key] = value
+    return encoded
+
+
+class sqlite_backend(storage_backend):
+    def __init__(self, path: Optional[str] = None, readers: Optional[int] = None):
+        self.path = path or os.getenv("SQLITE_PATH", "carva.db")
+        self.memory = self.path == ":memory:"
+        readers = readers or int(os.getenv("SQLITE_READERS", "4"))
+        self._local = threading.local()
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix="sqlite-writer")
+        # A private in-memory database lives on one connection, so it cannot have readers
+        self._readers = self._writer if self.memory else ThreadPoolExecutor(readers, thread_name_prefix="sqlite-reader")
+        self._writer.submit(lambda: self._create_schema(self._connection())).result()
+        self.cache = make_read_cache()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, cached_statements=512)
+            conn.execute("pragma journal_mode = wal")
+            conn.execute("pragma synchronous = normal")
+            conn.execute("pragma foreign_keys = on")
+            conn.execute("pragma busy_timeout = 5000")
+            conn.execute("pragma temp_store = memory")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection):
+        conn.executescript(SCHEMA)
+        for table, column, statement in UPGRADES:
+            if column not in [row[1] for row in conn.execute(f"pragma table_info({_quote(table)})")]:
+                conn.execute(statement)
+        conn.executescript(INDEXES)
+
+    async def _run(self, executor, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, lambda: fn(self._connection(), *args))
+
+    async def _read(self, fn, *args):
+        return await self._run(self._readers, fn, *args)
+
+    async def _write(self, fn, *args):
+        return await self._run(self._writer, fn, *args)
+
+    async def aclose(self):
+        def close(conn):
+            conn.close()
+            self._local.conn = None
+        await self._write(close)
+        self._writer.shutdown()
+        if self._readers is not self._writer:
+            # Reader connections are closed with their threads
+            self._readers.shutdown()
+
+    @staticmethod
+    def _rows(table: str, cursor: sqlite3.Cursor) -> List[Dict[str, Any]]:
+        names = [d[0] for d in cursor.description]
+        rows = [dict(zip(names, values)) for values in cursor.fetchall()]
+        for column in JSON_COLUMNS.get(table, ()):
+            if column in names:
+                for row in rows:
+                    if row[column] is not None:
+                        row[column] = json.loads(row[column])
+        return rows
+
+    @staticmethod
+    def _first(rows):
+        return rows[0] if rows else None
+
+    # Statement helpers, executed on an executor thread with its connection
+
+    def _select(self, conn, table: str, columns: str, where: str = "", params: Sequence[Any] = (),
+                order: str = "", limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        sql = f"select {columns} from {_quote(table)}"
+        if where:
+            sql += f" where {where}"
+        if order:
+            sql += f" order by {order}"
+        if limit is not None:
+            sql += " limit ?"
+            params = [*params, limit]
+        return self._rows(table, conn.execute(sql, params))
+
+    @staticmethod
+    def _transaction(conn, fn, *args):
+        conn.execute("begin immediate")
+        try:
+            result = fn(conn, *args)
+            conn.execute("commit")
+            return result
+        except BaseException:
+            conn.execute("rollback")
+            raise
+
+    def _insert_rows(self, conn, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Rows with the same column set share one statement
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for row in rows:
+            row = _encode(table, row)
+            groups.setdefault(tuple(row), []).append(row)
+        inserted = []
+        for columns, group in groups.items():
+            placeholders = "(" + ",".join("?" * len(columns)) + ")"
+            head = f"insert into {_quote(table)} ({','.join(map(_quote, columns))}) values "
+            for start in range(0, len(group), INSERT_CHUNK):
+                chunk = group[start:start + INSERT_CHUNK]
+                sql = head + ",".join([placeholders] * len(chunk)) + " returning *"
+                params = [row[c] for row in chunk for c in columns]
+                inserted.extend(self._rows(table, conn.execute(sql, params)))
+        return inserted
+
+    def _insert_many(self, conn, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return self._transaction(conn, self._insert_rows, table, rows)
+
+    def _update(self, conn, table: str, values: Dict[str, Any], where: str, params: Sequence[Any]) -> List[Dict[str, Any]]:
+        values = _encode(table, values)
+        if not values:
+            return self._select(conn, table, "*", where, params)
+        assignments = ", ".join(f"{_quote(c)} = ?" for c in values)
+        sql = f"update {_quote(table)} set {assignments} where {where} returning *"
+        return self._rows(table, conn.execute(sql, [*values.values(), *params]))
+
+    def _update_with_before(self, conn, table: str, values: Dict[str, Any], where: str, params: Sequence[Any]):
+        # Call inside _transaction so nothing changes the rows between the two statements
+        return self._select(conn, table, "*", where, params), self._update(conn, table, values, where, params)
+
+    def _delete(self, conn, table: str, where: str, params: Sequence[Any]) -> List[Dict[str, Any]]:
+        return self._rows(table, conn.execute(f"delete from {_quote(table)} where {where} returning *", params))
+
+    def _replace_lods(self, conn, route_id: int, lod_rows: list) -> List[Dict[str, Any]]:
+        def replace(conn):
+            conn.execute('delete from "ROUTE_LOD" where route_id = ?', (route_id,))
+            return self._insert_rows(conn, "ROUTE_LOD", lod_rows) if lod_rows else []
+        return self._transaction(conn, replace)
+
+    def _list(self, conn, table: str, keyset, where: str, params: List[Any], limit: int,
+              cursor: Optional[str], fields, allowed_fields):
+        keys = [col for col, _ in keyset]
+        columns = select_columns(fields, allowed_fields or [], keys)
+        columns = columns if columns == "*" else ",".join(map(_quote, columns.split(",")))
+        order, after, after_params = keyset_sql(keyset, cursor)
+        conditions = [c for c in (where, after) if c]
+        rows = self._select(conn, table, columns, " and ".join(conditions), [*params, *after_params], order, limit + 1)
+        return list(page(rows, limit, keys, fields))
+
+    # activities
+
+    async def create_activity(self, activity_data: dict, user_id: str):
+        try:
+            activity_data["user_reference"] = user_id
+            data = await self._write(self._insert_many, "activities", [activity_data])
+            await self.cache.invalidate(f"activities:{user_id}")
+            await self._track_activity_write(user_id, None, self._first(data))
+            return self._first(data)
+        except Exception as e:
+            raise Exception(f"Failed to create activity: {e}")
+
+    async def get_user_activities(self, user_id: str):
+        try:
+            return await self._read(self._select, "activities", "*", "user_reference = ?", (user_id,))
+        except Exception as e:
+            raise Exception(f"Failed to fetch activities: {e}")
+
+    async def get_activities_by_ids(self, activity_ids: List[int], user_id: str):
+        if not activity_ids:
+            return []
+        try:
+            ids = [int(a) for a in activity_ids]
+            return await self._read(
+                self._select, "activities", "*", f"id in ({','.join('?' * len(ids))}) and user_reference = ?",
+                [*ids, user_id],
+            )
+        except Exception as e:
+            raise Exception(f"Failed to fetch activities: {e}")
+
+    async def list_user_activities_with_etag(self, user_id: str, limit: int, cursor: Optional[str] = None,
+                                             fields: Optional[List[str]] = None, allowed_fields: Optional[List[str]] = None):
+        # Validate cursor and fields before touching the cache
+        keyset_sql(ACTIVITY_KEYSET, cursor)
+        select = select_columns(fields, allowed_fields or [], [col for col, _ in ACTIVITY_KEYSET])
+
+        async def load():
+            try:
+                return await self._read(
+                    self._list, "activities", ACTIVITY_KEYSET, "user_reference = ?", [user_id],
+                    limit, cursor, fields, allowed_fields,
+                )
+            except Exception as e:
+                raise Exception(f"Failed to fetch activities: {e}")
+
+        (rows, next_cursor), etag = await self.cache.get_or_load(
+            f"activities:{user_id}", f"list:{limit}:{cursor}:{select}", load
+        )
+        return (rows, next_cursor), etag
+
+    async def get_activity_by_id_with_etag(self, activity_id: int, user_id: str):
+        async def load():
+            try:
+                data = await self._read(
+                    self._select, "activities", "*", "id = ? and user_reference = ?", (activity_id, user_id)
+                )
+                return self._first(data)
+            except Exception as e:
+                raise Exception(f"Failed to fetch activity: {e}")
+
+        return await self.cache.get_or_load(f"activities:{user_id}", f"id:{activity_id}", load)
+
+    async def update_activity(self, activity_id: int, activity_data: dict, user_id: str):
+        try:
+            before, data = await self._write(
+                self._transaction, self._update_with_before, "activities", activity_data,
+                "id = ? and user_reference = ?", (activity_id, user_id),
+            )
+            await self.cache.invalidate(f"activities:{user_id}")
+            if data:
+                await self._track_activity_write(user_id, self._first(before), self._first(data))
+            return self._first(data)
+        except Exception as e:
+            raise Exception(f"Failed to update activity: {e}")
+
+    async def delete_activity(self, activity_id: int, user_id: str):
+        try:
+            data = await self._write(
+                self._delete, "activities", "id = ? and user_reference = ?", (activity_id, user_id)
+            )
+            await self.cache.invalidate(f"activities:{user_id}")
+            for row in data:
+                await self._track_activity_write(user_id, row, None)
+            return data
+        except Exception as e:
+            raise Exception(f"Failed to delete activity: {e}")
+
+    # ROUTE
+
+    async def create_route(self, route_data: dict, user_id: Optional[str] = None):
+        try:
+            if user_id is not None:
+                route_data["user_reference"] = user_id
+            data = await self._write(self._insert_many, "ROUTE", [route_data])
+            await self.cache.invalidate("routes")
+            return self._first(data)
+        except Exception as e:
+            raise Exception(f"Failed to create route: {e}")
+
+    async def get_route_by_id_with_etag(self, route_id: int):
+        async def load():
+            try:
+                return self._first(await self._read(self._select, "ROUTE", "*", "id = ?", (route_id,)))
+            except Exception as e:
+                raise Exception(f"Failed to fetch route: {e}")
+
+        return await self.cache.get_or_load(f"route:{route_id}", "row", load)
+
+    async def get_all_routes(self):
+        try:
+            return await self._read(self._select, "ROUTE", "*")
+        except Exception as e:
+            raise Exception(f"Failed to fetch routes: {e}")
+
+    async def list_routes_with_etag(self, limit: int, cursor: Optional[str] = None,
+                                    fields: Optional[List[str]] = None, allowed_fields: Optional[List[str]] = None):
+        keyset_sql(ROUTE_KEYSET, cursor)
+        select = select_columns(fields, allowed_fields or [], [col for col, _ in ROUTE_KEYSET])
+
+        async def load():
+            try:
+                return await self._read(self._list, "ROUTE", ROUTE_KEYSET, "", [], limit, cursor, fields, allowed_fields)
+            except Exception as e:
+                raise Exception(f"Failed to fetch routes: {e}")
+
+        (rows, next_cursor), etag = await self.cache.get_or_load("routes", f"list:{limit}:{cursor}:{select}", load)
+        return (rows, next_cursor), etag
+
+    async def get_routes_by_ids(self, route_ids: List[int]):
+        if not route_ids:
+            return []
+        try:
+            ids = [int(r) for r in route_ids]
+            return await self._read(self._select, "ROUTE", "*", f"id in ({','.join('?' * len(ids))})", ids)
+        except Exception as e:
+            raise Exception(f"Failed to fetch routes: {e}")
+
+    async def list_user_routes(self, user_id: str, limit: int, cursor: Optional[str] = None):
+        try:
+            return await self._read(self._list, "ROUTE", ROUTE_KEYSET, "user_reference = ?", [user_id], limit, cursor, None, None)
+        except Exception as e:
+            raise Exception(f"Failed to fetch routes: {e}")
+
+    async def update_route(self, route_id: int, route_data: dict):
+        try:
+            data = await self._write(self._update, "ROUTE", route_data, "id = ?", (route_id,))
+            await self.cache.invalidate(f"route:{route_id}", "routes")
+            return self._first(data)
+        except Exception as e:
+            raise Exception(f"Failed to update route: {e}")
+
+    async def delete_route(self, route_id: int):
+        try:
+            data = await self._write(self._delete, "ROUTE", "id = ?", (route_id,))
+            await self.cache.invalidate(f"route:{route_id}", "routes")
+            return data
+        except Exception as e:
+            raise Exception(f"Failed to delete route: {e}")
+
+    # POINTS
+
+    async def _invalidate_routes(self, rows):
+        route_ids = {r.get("route_id") for r in rows or [] if r.get("route_id") is not None}
+        await self.cache.invalidate(*(f"route:{route_id}" for route_id in route_ids))
+
+    async def create_point(self, point_data: dict):
+        try:
+            data = await self._write(self._insert_many, "POINTS", index_points([point_data]))
+            await self._invalidate_routes(data)
+            await self._track_point_write(data)
+            return self._first(data)
+        except Exception as e:
+            raise Exception(f"Failed to create point: {e}")
+
+    async def create_points_batch(self, points_data: list):
+        try:
+            data = await self._write(self._insert_many, "POINTS", index_points(points_data))
+            await self._invalidate_routes(points_data)
+            await self._track_point_write(data)
+            return data
+        except Exception as e:
+            raise Exception(f"Failed to create points batch: {e}")
+
+    async def get_point_by_id(self, point_id: int):
+        try:
+            return self._first(await self._read(self._select, "POINTS", "*", "id = ?", (point_id,)))
+        except Exception as e:
+            raise Exception(f"Failed to fetch point: {e}")
+
+    async def get_points_by_ids(self, point_ids: List[int]):
+        if not point_ids:
+            return []
+        try:
+            ids = [int(p) for p in point_ids]
+            return await self._read(self._select, "POINTS", "*", f"id in ({','.join('?' * len(ids))})", ids)
+        except Exception as e:
+            raise Exception(f"Failed to fetch points: {e}")
+
+    async def get_points_by_route(self, route_id: int):
+        try:
+            return await self._read(self._select, "POINTS", "*", "route_id = ?", (route_id,), "timestamp asc")
+        except Exception as e:
+            raise Exception(f"Failed to fetch points for route: {e}")
+
+    async def list_route_points(self, route_id: int, limit: int, cursor: Optional[str] = None,
+                                fields: Optional[List[str]] = None):
+        try:
+            return await self._read(self._list, "POINTS", ROUTE_POINT_KEYSET, "route_id = ?", [route_id],
+                                    limit, cursor, fields, COLUMNS["POINTS"])
+        except Exception as e:
+            raise Exception(f"Failed to fetch points for route: {e}")
+
+    def _points_in_bbox(self, conn, min_lat, min_lng, max_lat, max_lng, limit, columns):
+        ranges = cover_bbox(min_lat, min_lng, max_lat, max_lng)
+        # Cells overhang the box, so the exact bounds are checked as well
+        where = "(" + " or ".join(["(cell >= ? and cell < ?)"] * len(ranges)) + ") and lat between ? and ? and lng between ? and ?"
+        params = [v for r in ranges for v in r] + [min_lat, max_lat, min_lng, max_lng]
+        select = ",".join(_quote(c) for c in columns) if columns else "*"
+        # No ORDER BY: sorting would make the planner prefer a rowid scan over the cell ranges
+        return self._select(conn, "POINTS", select, where, params, "", limit)
+
+    async def get_points_in_bbox(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float,
+                                 limit: Optional[int] = None, columns: Optional[List[str]] = None):
+        try:
+            return await self._read(self._points_in_bbox, min_lat, min_lng, max_lat, max_lng, limit, columns)
+        except Exception as e:
+            raise Exception(f"Failed to fetch points in bounding box: {e}")
+
+    def _nearest_route_points(self, conn, lat, lng, radius_m, limit):
+        (min_lat, min_lng, max_lat, max_lng), ranges, kx2, max_d2 = near_filter(lat, lng, radius_m)
+        where = "(" + " or ".join(["(cell >= ? and cell < ?)"] * len(ranges)) + ") and lat between ? and ? and lng between ? and ?"
+        # With min() in the select list SQLite takes the bare lat and lng from the row holding the minimum
+        sql = (
+            'select route_id, lat, lng, min((lat - ?) * (lat - ?) + ? * (lng - ?) * (lng - ?)) as d2 from "POINTS" '
+            f"where {where} and route_id is not null group by route_id having d2 <= ? order by d2"
+        )
+        params = [lat, lat, kx2, lng, lng] + [v for r in ranges for v in r] + [min_lat, max_lat, min_lng, max_lng, max_d2]
+        if limit is not None:
+            sql += " limit ?"
+            params.append(limit)
+        return [{"route_id": r[0], "lat": r[1], "lng": r[2]} for r in conn.execute(sql, params)]
+
+    async def nearest_route_points(self, lat: float, lng: float, radius_m: float,
+                                   limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        try:
+            return await self._read(self._nearest_route_points, lat, lng, radius_m, limit)
+        except Exception as e:
+            raise Exception(f"Failed to fetch routes near point: {e}")
+
+    async def update_point(self, point_id: int, point_data: dict):
+        try:
+            before = await self._point_before_update(point_id, point_data)
+            point_data = await self._reindex_point_update(point_id, point_data, before)
+            data = await self._write(self._update, "POINTS", point_data, "id = ?", (point_id,))
+            await self._invalidate_routes(data)
+            await self._track_point_update(before, self._first(data))
+            return self._first(data)
+        except Exception as e:
+            raise Exception(f"Failed to update point: {e}")
+
+    async def delete_point(self, point_id: int):
+        try:
+            data = await self._write(self._delete, "POINTS", "id = ?", (point_id,))
+            await self._invalidate_routes(data)
+            await self._track_point_write(data or [], -1)
+            return data
+        except Exception as e:
+            raise Exception(f"Failed to delete point: {e}")
+
+    def _append_points(self, conn, route_id: int, rows: list, seq: int) -> int:
+        advanced = conn.execute(
+            'update "ROUTE" set live_seq = ? where id = ? and coalesce(live_seq, 0) < ?', (seq, route_id, seq)
+        ).rowcount
+        if not advanced:
+            return 0
+        return len(self._insert_rows(conn, "POINTS", rows)) if rows else 0
+
+    async def append_route_points(self, route_id: int, points_data: list, seq: int) -> int:
+        try:
+            rows = index_points([dict(p, route_id=route_id) for p in points_data])
+            inserted = await self._write(self._transaction, self._append_points, route_id, rows, seq)
+            # Only this route's entries; the route list does not need a refresh per batch
+            await self.cache.invalidate(f"route:{route_id}")
+            if inserted:
+                await self._track_point_write(rows)
+            return inserted
+        except Exception as e:
+            raise Exception(f"Failed to append live points: {e}")
+
+    @staticmethod
+    def _delete_points_chunk(conn, route_id: int, limit: int) -> int:
+        # One autocommit statement per chunk: the writer is free for other writes in between
+        return conn.execute(
+            'delete from "POINTS" where id in (select id from "POINTS" where route_id = ? limit ?)', (route_id, limit)
+        ).rowcount
+
+    async def delete_route_points_chunk(self, route_id: int, limit: int) -> int:
+        try:
+            deleted = await self._write(self._delete_points_chunk, route_id, limit)
+            if deleted:
+                await self.cache.invalidate(f"route:{route_id}")
+            return deleted
+        except Exception as e:
+            raise Exception(f"Failed to delete points for route: {e}")
+
+    # ROUTE_LOD
+
+    async def get_route_lod_with_etag(self, route_id: int, max_tolerance_m: float):
+        async def load():
+            try:
+                data = await self._read(
+                    self._select, "ROUTE_LOD", "*", "route_id = ? and tolerance_m <= ?",
+                    (route_id, max_tolerance_m), "tolerance_m desc", 1,
+                )
+                return self._first(data)
+            except Exception as e:
+                raise Exception(f"Failed to fetch route level of detail: {e}")
+
+        return await self.cache.get_or_load(f"route:{route_id}", f"lod:{max_tolerance_m}", load)
+
+    async def replace_route_lods(self, route_id: int, lod_rows: list):
+        try:
+            data = await self._write(self._replace_lods, route_id, lod_rows)
+            await self.cache.invalidate(f"route:{route_id}")
+            return data
+        except Exception as e:
+            raise Exception(f"Failed to store route levels of detail: {e}")
+
+    # SEGMENT
+
+    async def create_segment(self, segment_data: dict):
+        try:
+            return self._first(await self._write(self._insert_many, "SEGMENT", [segment_data]))
+        except Exception as e:
+            raise Exception(f"Failed to create segment: {e}")
+
+    async def get_segment_by_id(self, segment_id: int):
+        try:
+            return self._first(await self._read(self._select, "SEGMENT", "*", "id = ?", (segment_id,)))
+        except Exception as e:
+            raise Exception(f"Failed to fetch segment: {e}")
+
+    async def get_segments_by_start_cells(self, cells: List[int]):
+        try:
+            segments = []
+            for start in range(0, len(cells), INSERT_CHUNK):
+                chunk = [int(c) for c in cells[start:start + INSERT_CHUNK]]
+                segments.extend(await self._read(
+                    self._select, "SEGMENT", "*", f"start_cell in ({','.join('?' * len(chunk))})", chunk
+                ))
+            return segments
+        except Exception as e:
+            raise Exception(f"Failed to fetch segments: {e}")
+
+    async def delete_segment(self, segment_id: int):
+        try:
+            # SEGMENT_EFFORT rows go with it (on delete cascade)
+            data = await self._write(self._delete, "SEGMENT", "id = ?", (segment_id,))
+            await self.cache.invalidate(f"segment:{segment_id}")
+            return data
+        except Exception as e:
+            raise Exception(f"Failed to delete segment: {e}")
+
+    def _record_efforts(self, conn, efforts: list) -> List[Dict[str, Any]]:
+        sql = (
+            'insert into "SEGMENT_EFFORT" (segment_id, user_reference, route_id, elapsed_s, started_at) '
+            "values (?, ?, ?, ?, ?) "
+            "on conflict (segment_id, user_reference) do update set "
+            "route_id = excluded.route_id, elapsed_s = excluded.elapsed_s, started_at = excluded.started_at "
+            'where excluded.elapsed_s < "SEGMENT_EFFORT".elapsed_s '
+            "returning *"
+        )
+        kept = []
+        for effort in efforts:
+            e = _encode("SEGMENT_EFFORT", effort)
+            kept.extend(self._rows("SEGMENT_EFFORT", conn.execute(
+                sql, (e["segment_id"], e["user_reference"], e["route_id"], e["elapsed_s"], e["started_at"])
+            )))
+        return kept
+
+    async def record_segment_efforts(self, efforts: list):
+        if not efforts:
+            return []
+        try:
+            kept = await self._write(self._transaction, self._record_efforts, efforts)
+            await self.cache.invalidate(*{f"segment:{e['segment_id']}" for e in kept})
+            return kept
+        except Exception as e:
+            raise Exception(f"Failed to record segment efforts: {e}")
+
+    async def get_segment_leaderboard_with_etag(self, segment_id: int, limit: int):
+        async def load():
+            try:
+                return await self._read(
+                    self._select, "SEGMENT_EFFORT", "*", "segment_id = ?", (segment_id,),
+                    "elapsed_s asc, started_at asc", limit,
+                )
+            except Exception as e:
+                raise Exception(f"Failed to fetch segment leaderboard: {e}")
+
+        return await self.cache.get_or_load(f"segment:{segment_id}", f"leaderboard:{limit}", load)
+
+    # GROUPS, GROUP_MEMBER and GROUP_LEADERBOARD
+
+    def _create_group(self, conn, group_data: dict, user_id: str):
+        now = datetime.now(timezone.utc).isoformat()
+        group = self._insert_rows(conn, "GROUPS", [{**group_data, "created_by": user_id, "created_at": now}])[0]
+        self._insert_rows(conn, "GROUP_MEMBER", [{"group_id": group["id"], "user_reference": user_id, "joined_at": now}])
+        return group
+
+    async def create_group(self, group_data: dict, user_id: str):
+        try:
+            group = await self._write(self._transaction, self._create_group, group_data, user_id)
+            await self.cache.invalidate(f"groups:{user_id}")
+            return group
+        except Exception as e:
+            raise Exception(f"Failed to create group: {e}")
+
+    async def get_group_by_id(self, group_id: int):
+        try:
+            return self._first(await self._read(self._select, "GROUPS", "*", "id = ?", (group_id,)))
+        except Exception as e:
+            raise Exception(f"Failed to fetch group: {e}")
+
+    async def get_all_groups(self):
+        try:
+            return await self._read(self._select, "GROUPS", "*", order="id asc")
+        except Exception as e:
+            raise Exception(f"Failed to fetch groups: {e}")
+
+    async def delete_group(self, group_id: int):
+        try:
+            members = await self.get_group_members(group_id)
+            # GROUP_MEMBER and GROUP_LEADERBOARD rows go with it (on delete cascade)
+            data = await self._write(self._delete, "GROUPS", "id = ?", (group_id,))
+            await self.cache.invalidate(f"group:{group_id}", *(f"groups:{m['user_reference']}" for m in members))
+            return data
+        except Exception as e:
+            raise Exception(f"Failed to delete group: {e}")
+
+    def _add_member(self, conn, group_id: int, user_id: str):
+        now = datetime.now(timezone.utc).isoformat()
+        sql = (
+            'insert into "GROUP_MEMBER" (group_id, user_reference, joined_at) values (?, ?, ?) '
+            "on conflict (group_id, user_reference) do nothing returning *"
+        )
+        return self._rows("GROUP_MEMBER", conn.execute(sql, (group_id, user_id, now)))
+
+    async def add_group_member(self, group_id: int, user_id: str):
+        try:
+            data = await self._write(self._add_member, group_id, user_id)
+            await self.cache.invalidate(f"groups:{user_id}", f"group:{group_id}")
+            return self._first(data)
+        except Exception as e:
+            raise Exception(f"Failed to add group member: {e}")
+
+    def _remove_member(self, conn, group_id: int, user_id: str):
+        conn.execute('delete from "GROUP_LEADERBOARD" where group_id = ? and user_reference = ?', (group_id, user_id))
+        return self._delete(conn, "GROUP_MEMBER", "group_id = ? and user_reference = ?", (group_id, user_id))
+
+    async def remove_group_member(self, group_id: int, user_id: str):
+        try:
+            data = await self._write(self._transaction, self._remove_member, group_id, user_id)
+            await self.cache.invalidate(f"groups:{user_id}", f"group:{group_id}")
+            return data
+        except Exception as e:
+            raise Exception(f"Failed to remove group member: {e}")
+
+    async def get_group_members(self, group_id: int):
+        try:
+            return await self._read(self._select, "GROUP_MEMBER", "*", "group_id = ?", (group_id,), "joined_at asc, user_reference asc")
+        except Exception as e:
+            raise Exception(f"Failed to fetch group members: {e}")
+
+    async def get_user_group_ids(self, user_id: str) -> List[int]:
+        async def load():
+            try:
+                rows = await self._read(self._select, "GROUP_MEMBER", "group_id", "user_reference = ?", (user_id,))
+                return [r["group_id"] for r in rows]
+            except Exception as e:
+                raise Exception(f"Failed to fetch user groups: {e}")
+
+        group_ids, _ = await self.cache.get_or_load(f"groups:{user_id}", "ids", load)
+        return group_ids
+
+    def _apply_deltas(self, conn, table: str, keys: Sequence[str], deltas: list):
+        # Additive upsert of (distance, duration_s, activities); emptied buckets are removed
+        key_columns = ", ".join(keys)
+        upsert = (
+            f"insert into {_quote(table)} ({key_columns}, distance, duration_s, activities) "
+            f"values ({', '.join('?' * (len(keys) + 3))}) "
+            f"on conflict ({key_columns}) do update set "
+            f"distance = {_quote(table)}.distance + excluded.distance, "
+            f"duration_s = {_quote(table)}.duration_s + excluded.duration_s, "
+            f"activities = {_quote(table)}.activities + excluded.activities "
+            "returning activities"
+        )
+        prune = f"delete from {_quote(table)} where " + " and ".join(f"{k} = ?" for k in keys)
+        for d in deltas:
+            key = [d[k] for k in keys]
+            (activities,), = conn.execute(upsert, (*key, d["distance"], d["duration_s"], d["activities"])).fetchall()
+            if activities <= 0:
+                conn.execute(prune, key)
+
+    async def apply_leaderboard_deltas(self, deltas: list):
+        if not deltas:
+            return
+        try:
+            await self._write(
+                self._transaction, self._apply_deltas, "GROUP_LEADERBOARD",
+                ("group_id", "period", "period_start", "user_reference"), deltas,
+            )
+            await self.cache.invalidate(*{f"group:{d['group_id']}" for d in deltas})
+        except Exception as e:
+            raise Exception(f"Failed to apply leaderboard deltas: {e}")
+
+    def _replace_leaderboard(self, conn, group_id: int, rows: list, user_id: Optional[str]):
+        if user_id is None:
+            conn.execute('delete from "GROUP_LEADERBOARD" where group_id = ?', (group_id,))
+        else:
+            conn.execute('delete from "GROUP_LEADERBOARD" where group_id = ? and user_reference = ?', (group_id, user_id))
+        return self._insert_rows(conn, "GROUP_LEADERBOARD", [{**r, "group_id": group_id} for r in rows]) if rows else []
+
+    async def replace_group_leaderboard(self, group_id: int, rows: list, user_id: Optional[str] = None):
+        try:
+            data = await self._write(self._transaction, self._replace_leaderboard, group_id, rows, user_id)
+            await self.cache.invalidate(f"group:{group_id}")
+            return data
+        except Exception as e:
+            raise Exception(f"Failed to replace group leaderboard: {e}")
+
+    async def get_group_leaderboard_with_etag(self, group_id: int, period: str, period_start: str,
+                                              metric: str, limit: int):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown leaderboard metric {metric!r}")
+
+        async def load():
+            try:
+                return await self._read(
+                    self._select, "GROUP_LEADERBOARD", "*", "group_id = ? and period = ? and period_start = ?",
+                    (group_id, period, period_start), f"{_quote(metric)} desc, user_reference asc", limit,
+                )
+            except Exception as e:
+                raise Exception(f"Failed to fetch group leaderboard: {e}")
+
+        return await self.cache.get_or_load(
+            f"group:{group_id}", f"leaderboard:{period}:{period_start}:{metric}:{limit}", load
+        )
+
+    # USER_STATS
+
+    async def apply_user_stats_deltas(self, deltas: list):
+        if not deltas:
+            return
+        try:
+            await self._write(
+                self._transaction, self._apply_deltas, "USER_STATS", ("user_reference", "period", "period_start"), deltas
+            )
+            await self.cache.invalidate(*{f"stats:{d['user_reference']}" for d in deltas})
+        except Exception as e:
+            raise Exception(f"Failed to apply user stats deltas: {e}")
+
+    def _replace_stats(self, conn, user_id: str, rows: list):
+        conn.execute('delete from "USER_STATS" where user_reference = ?', (user_id,))
+        return self._insert_rows(conn, "USER_STATS", [{**r, "user_reference": user_id} for r in rows]) if rows else []
+
+    async def replace_user_stats(self, user_id: str, rows: list):
+        try:
+            data = await self._write(self._transaction, self._replace_stats, user_id, rows)
+            await self.cache.invalidate(f"stats:{user_id}")
+            return data
+        except Exception as e:
+            raise Exception(f"Failed to replace user stats: {e}")
+
+    async def get_user_stats_with_etag(self, user_id: str, period: str, first: str, last: str):
+        async def load():
+            try:
+                return await self._read(
+                    self._select, "USER_STATS", "period_start, distance, duration_s, activities",
+                    "user_reference = ? and period = ? and period_start >= ? and period_start <= ?",
+                    (user_id, period, first, last), "period_start asc",
+                )
+            except Exception as e:
+                raise Exception(f"Failed to fetch user stats: {e}")
+
+        return await self.cache.get_or_load(f"stats:{user_id}", f"{period}:{first}:{last}", load)
+
+    # HEATMAP_CELL
+
+    @staticmethod
+    def _apply_heatmap(conn, deltas: list):
+        keys = [(d["user_reference"], d["zoom"], d["bin_x"], d["bin_y"]) for d in deltas]
+        conn.executemany(
+            'insert into "HEATMAP_CELL" (user_reference, zoom, bin_x, bin_y, count) values (?, ?, ?, ?, ?) '
+            'on conflict (user_reference, zoom, bin_x, bin_y) do update set count = "HEATMAP_CELL".count + excluded.count',
+            [(*key, d["count"]) for key, d in zip(keys, deltas)],
+        )
+        emptied = [key for key, d in zip(keys, deltas) if d["count"] < 0]
+        if emptied:
+            conn.executemany(
+                'delete from "HEATMAP_CELL" where user_reference = ? and zoom = ? and bin_x = ? and bin_y = ? and count <= 0',
+                emptied,
+            )
+
+    async def apply_heatmap_deltas(self, deltas: list):
+        if not deltas:
+            return
+        try:
+            await self._write(self._transaction, self._apply_heatmap, deltas)
+        except Exception as e:
+            raise Exception(f"Failed to apply heatmap deltas: {e}")
+
+    def _replace_heatmap(self, conn, user_id: str, rows: list):
+        conn.execute('delete from "HEATMAP_CELL" where user_reference = ?', (user_id,))
+        self._apply_heatmap(conn, [{**r, "user_reference": user_id} for r in rows])
+
+    async def replace_user_heatmap(self, user_id: str, rows: list):
+        try:
+            await self._write(self._transaction, self._replace_heatmap, user_id, rows)
+        except Exception as e:
+            raise Exception(f"Failed to replace user heatmap: {e}")
+
+    async def get_heatmap_bins(self, user_ids: List[str], zoom: int, min_x: int, max_x: int,
+                               min_y: int, max_y: int) -> List[Dict[str, Any]]:
+        if not user_ids:
+            return []
+        try:
+            return await self._read(lambda conn: self._rows("HEATMAP_CELL", conn.execute(
+                'select bin_x, bin_y, sum(count) as count from "HEATMAP_CELL" '
+                f"where user_reference in ({','.join('?' * len(user_ids))}) and zoom = ? "
+                "and bin_x between ? and ? and bin_y between ? and ? group by bin_x, bin_y",
+                (*user_ids, zoom, min_x, max_x, min_y, max_y),
+            )))
+        except Exception as e:
+            raise Exception(f"Failed to fetch heatmap bins: {e}")
+
+    async def get_route_user_ids(self) -> List[str]:
+        try:
+            rows = await self._read(lambda conn: conn.execute(
+                'select distinct user_reference from "ROUTE" where user_reference is not null order by user_reference'
+            ).fetchall())
+            return [user_id for user_id, in rows]
+        except Exception as e:
+            raise Exception(f"Failed to fetch route owners: {e}")
+
+    async def get_activity_user_ids(self) -> List[str]:
+        try:
+            rows = await self._read(lambda conn: conn.execute(
+                "select distinct user_reference from activities order by user_reference"
+            ).fetchall())
+            return [user_id for user_id, in rows]
+        except Exception as e:
+            raise Exception(f"Failed to fetch activity users: {e}")
@@ -0,0 +1,729 @@
+import os
+from dotenv import load_dotenv
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List
+import httpx
+from aggregates.activity_totals import METRICS
+from storage.base import storage_backend, make_read_cache, index_points, ACTIVITY_KEYSET, ROUTE_KEYSET, ROUTE_POINT_KEYSET
+from geo.spatial import cover_bbox, near_filter
+from .pagination import keyset_params, select_columns, page
+
+# Rows PostgREST returns per request at most (Supabase's `max-rows`, 1000 by default)
+POSTGREST_MAX_ROWS = int(os.getenv("POSTGREST_MAX_ROWS", "1000"))
+
+
+class async_supabase_handler(storage_backend):
+    """Async counterpart of supabase_handler for the request data path.
+
+    Talks to PostgREST (/rest/v1) and GoTrue (/auth/v1) directly through one
+    pooled keep-alive httpx.AsyncClient, so handlers await upstream I/O on the
+    event loop instead of holding a threadpool worker for the round trip.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        key: Optional[str] = None,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        timeout: float = 10.0,
+    ):
+        load_dotenv()
+        url = url or os.getenv("SUPABASE_URL")
+        key = key or os.getenv("SUPABASE_KEY")
+
+        self.rest_url = f"{url}/rest/v1"
+        self.auth_url = f"{url}/auth/v1"
+        self.client = httpx.AsyncClient(
+            headers={
+                "apikey": key,
+                "Authorization": f"Bearer {key}",
+                "Content-Type": "application/json",
+            },
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("SUPABASE_MAX_CONNECTIONS", max_connections)),
+                max_keepalive_connections=int(os.getenv("SUPABASE_MAX_KEEPALIVE", max_keepalive_connections)),
+            ),
+            timeout=timeout,
+        )
+
+        self.cache = make_read_cache()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def _request(self, method: str, table: str, params=None, json=None, prefer: Optional[str] = None) -> List[Dict[str, Any]]:
+        headers = {"Prefer": ",".join(filter(None, ("return=representation", prefer)))} if method != "GET" else None
+        response = await self.client.request(
+            method, f"{self.rest_url}/{table}", params=params, json=json, headers=headers
+        )
+        response.raise_for_status()
+        return response.json() if response.content else []
+
+    async def _request_all(self, method: str, table: str, params: Dict[str, str], keyset) -> List[Dict[str, Any]]:
+        # Every row of a read that must be complete. One request would be cut off at
+        # max-rows without any error, so it goes in keyset pages that stay under it;
+        # `keyset` must be unique per row, and `params` cannot use `or`, which the
+        # keyset filter takes
+        keys = [col for col, _ in keyset]
+        limit = POSTGREST_MAX_ROWS - 1
+        rows, cursor = [], None
+        while True:
+            batch, cursor = page(await self._request(method, table, params={
+                **params, "limit": str(limit + 1), **keyset_params(keyset, cursor),
+            }), limit, keys)
+            rows.extend(batch)
+            if cursor is None:
+                return rows
+
+    @staticmethod
+    def _route_ids(rows):
+        return {r.get("route_id") for r in rows or [] if isinstance(r, dict) and r.get("route_id") is not None}
+
+    async def _invalidate_routes(self, rows):
+        await self.cache.invalidate(*(f"route:{route_id}" for route_id in self._route_ids(rows)))
+
+    @staticmethod
+    def _first(data):
+        return data[0] if isinstance(data, list) and len(data) > 0 else None
+
+    @staticmethod
+    def _session_response(data: Dict[str, Any]) -> Dict[str, Any]:
+        # Shape GoTrue replies like supabase-py's AuthResponse: {"user", "session"}
+        if "access_token" not in data:
+            return {"user": data.get("user", data), "session": None}
+        session = {k: v for k, v in data.items() if k != "user"}
+        return {"user": data.get("user"), "session": session}
+
+    async def sign_up_user(self, email: str, password: str):
+        response = await self.client.post(
+            f"{self.auth_url}/signup", json={"email": email, "password": password}
+        )
+        response.raise_for_status()
+        return self._session_response(response.json())
+
+    async def sign_in_user(self, email: str, password: str):
+        response = await self.client.post(
+            f"{self.auth_url}/token",
+            params={"grant_type": "password"},
+            json={"email": email, "password": password},
+        )
+        response.raise_for_status()
+        return self._session_response(response.json())
+
+    async def create_activity(self, activity_data: dict, user_id: str):
+        try:
+            activity_data["user_reference"] = user_id
+            data = await self._request("POST", "activities", json=activity_data)
+            await self.cache.invalidate(f"activities:{user_id}")
+            await self._track_activity_write(user_id, None, self._first(data))
+            return self._first(data)
+        except Exception as e:
+            raise Exception(f"Failed to create activity: {e}")
+
+    async def get_user_activities(self, user_id: str):
+        try:
+            return await self._request_all(
+                "GET", "activities", {"select": "*", "user_reference": f"eq.{user_id}"}, [("id", "asc")]
+            )
+        except Exception as e:
+            raise Exception(f"Failed to fetch activities: {e}")
+
+    async def get_activities_by_ids(self, activity_ids: List[int], user_id: str):
+        if not activity_ids:
+            return []
+        try:
+            return await self._request("GET", "activities", params={
+                "select": "*",
+                "id": f"in.({','.join(str(int(a)) for a in activity_ids)})",
+                "user_reference": f"eq.{user_id}",
+            })
+        except Exception as e:
+            raise Exception(f"Failed to fetch activities: {e}")
+
+    async def list_user_activities_with_etag(self, user_id: str, limit: int, cursor: Optional[str] = None,
+                                             fields: Optional[List[str]] = None, allowed_fields: Optional[List[str]] = None):
+        keys = [col for col, _ in ACTIVITY_KEYSET]
+        params = {
+            "select": select_columns(fields, allowed_fields or [], keys),
+            "user_reference": f"eq.{user_id}",
+            "limit": str(limit + 1),
+            **keyset_params(ACTIVITY_KEYSET, cursor),
+        }
+
+        async def load():
+            try:
+                rows = await self._request("GET", "activities", params=params)
+            except Exception as e:
+                raise Exception(f"Failed to fetch activities: {e}")
+            return list(page(rows, limit, keys, fields))
+
+        (rows, next_cursor), etag = await self.cache.get_or_load(
+            f"activities:{user_id}", f"list:{limit}:{cursor}:{params['select']}", load
+        )
+        return (rows, next_cursor), etag
+
+    async def get_activity_by_id_with_etag(self, activity_id: int, user_id: str):
+        async def load():
+            try:
+                data = await self._request(
+                    "GET", "activities",
+                    params={"select": "*", "id": f"eq.{activity_id}", "user_reference": f"eq.{user_id}"},
+                )
+                return self._first(data)
+            except Exception as e:
+                raise Exception(f"Failed to fetch activity: {e}")
+
+        return await self.cache.get_or_load(f"activities:{user_id}", f"id:{activity_id}", load)
+
+    async def update_activity(self, activity_id: int, activity_data: dict, user_id: str):
+        try:
+            # The old row comes back from the update itself, for the leaderboard delta (migrations/015)
+            changed = self._first(await self._request("POST", "rpc/update_activity", json={
+                "p_id": activity_id, "p_user_reference": user_id, "p_changes": activity_data,
+            }))
+            await self.cache.invalidate(f"activities:{user_id}")
+            if not changed:
+                return None
+            await self._track_activity_write(user_id, changed["before"], changed["after"])
+            return changed["after"]
+        except Exception as e:
+            raise Exception(f"Failed to update activity: {e}")
+
+    async def delete_activity(self, activity_id: int, user_id: str):
+        try:
+            data = await self._request(
+                "DELETE", "activities",
+                params={"id": f"eq.{activity_id}", "user_reference": f"eq.{user_id}"},
+            )
+            await self.cache.invalidate(f"activities:{user_id}")
+            for row in data:
+                await self._track_activity_write(user_id, row, None)
+            return data
+        except Exception as e:
+            raise Exception(f"Failed to delete activity: {e}")
+
+    # ROUTE management methods
+    async def create_route(self, route_data: dict, user_id: Optional[str] = None):
+        try:
+            if user_id is not None:
+                route_data["user_reference"] = user_id
+            data = await self._request("POST", "ROUTE", json=route_data)
+            await self.cache.invalidate("routes")
+            return self._first(data)
+        except Exception as e:
+            raise Exception(f"Failed to create route: {e}")
+
+    async def get_route_by_id_with_etag(self, route_id: int):
+        async def load():
+            try:
+                data = await self._request("GET", "ROUTE", params={"select": "*", "id": f"eq.{route_id}"})
+                return self._first(data)
+            except Exception as e:
+                raise Exception(f"Failed to fetch route: {e}")
+
+        return await self.cache.get_or_load(f"route:{route_id}", "row", load)
+
+    async def get_all_routes(self):
+        try:
+            return await self._request("GET", "ROUTE", params={"select": "*"})
+        except Exception as e:
+            raise Exception(f"Failed to fetch routes: {e}")
+
+    async def list_routes_with_etag(self, limit: int, cursor: Optional[str] = None,
+                                    fields: Optional[List[str]] = None, allowed_fields: Optional[List[str]] = None):
+        keys = [col for col, _ in ROUTE_KEYSET]
+        params = {
+            "select": select_columns(fields, allowed_fields or [], keys),
+            "limit": str(limit + 1),
+            **keyset_params(ROUTE_KEYSET, cursor),
+        }
+
+        async def load():
+            try:
+                rows = await self._request("GET", "ROUTE", params=params)
+            except Exception as e:
+                raise Exception(f"Failed to fetch routes: {e}")
+            return list(page(rows, limit, keys, fields))
+
+        (rows, next_cursor), etag = await self.cache.get_or_load(
+            "routes", f"list:{limit}:{cursor}:{params['select']}", load
+        )
+        return (rows, next_cursor), etag
+
+    async def get_routes_by_ids(self, route_ids: List[int]):
+        if not route_ids:
+            return []
+        try:
+            return await self._request(
+                "GET", "ROUTE", params={"select": "*", "id": f"in.({','.join(str(int(r)) for r in route_ids)})"}
+            )
+        except Exception as e:
+            raise Exception(f"Failed to fetch routes: {e}")
+
+    async def list_user_routes(self, user_id: str, limit: int, cursor: Optional[str] = None):
+        params = {
+            "select": "*",
+            "user_reference": f"eq.{user_id}",
+            "limit": str(limit + 1),
+            **keyset_params(ROUTE_KEYSET, cursor),
+        }
+        try:
+            rows = await self._request("GET", "ROUTE", params=params)
+        except Exception as e:
+            raise Exception(f"Failed to fetch routes: {e}")
+        return page(rows, limit, [col for col, _ in ROUTE_KEYSET])
+
+    async def update_route(self, route_id: int, route_data: dict):
+        try:
+            data = await self._request("PATCH", "ROUTE", params={"id": f"eq.{route_id}"}, json=route_data)
+            await self.cache.invalidate(f"route:{route_id}", "routes")
+            return self._first(data)
+        except Exception as e:
+            raise Exception(f"Failed to update route: {e}")
+
+    async def delete_route(self, route_id: int):
+        try:
+            data = await self._request("DELETE", "ROUTE", params={"id": f"eq.{route_id}"})
+            await self.cache.invalidate(f"route:{route_id}", "routes")
+            return data
+        except Exception as e:
+            raise Exception(f"Failed to delete route: {e}")
+
+    # POINTS management methods
+    async def create_point(self, point_data: dict):
+        try:
+            data = await self._request("POST", "POINTS", json=index_points([point_data])[0])
+            await self._invalidate_routes(data)
+            await self._track_point_write(data)
+            return self._first(data)
+        except Exception as e:
+            raise Exception(f"Failed to create point: {e}")
+
+    async def create_points_batch(self, points_data: list):
+        try:
+            data = await self._request("POST", "POINTS", json=index_points(points_data))
+            await self._invalidate_routes(points_data)
+            await self._track_point_write(data)
+            return data
+        except Exception as e:
+            raise Exception(f"Failed to create points batch: {e}")
+
+    async def get_point_by_id(self, point_id: int):
+        try:
+            data = await self._request("GET", "POINTS", params={"select": "*", "id": f"eq.{point_id}"})
+            return self._first(data)
+        except Exception as e:
+            raise Exception(f"Failed to fetch point: {e}")
+
+    async def get_points_by_ids(self, point_ids: List[int]):
+        if not point_ids:
+            return []
+        try:
+            return await self._request(
+                "GET", "POINTS", params={"select": "*", "id": f"in.({','.join(str(int(p)) for p in point_ids)})"}
+            )
+        except Exception as e:
+            raise Exception(f"Failed to fetch points: {e}")
+
+    async def get_points_by_route(self, route_id: int):
+        # One GET would be cut off at PostgREST's max-rows without any error, so
+        # the route is read in keyset pages that stay under it
+        points, cursor = [], None
+        while True:
+            rows, cursor = await self.list_route_points(route_id, POSTGREST_MAX_ROWS, cursor)
+            points.extend(rows)
+            if cursor is None:
+                return points
+
+    async def list_route_points(self, route_id: int, limit: int, cursor: Optional[str] = None,
+                                fields: Optional[List[str]] = None):
+        # A `limit + 1` fetch past max-rows would come back short with no cursor; a
+        # smaller page still carries the cursor on
+        limit = min(limit, POSTGREST_MAX_ROWS - 1)
+        keys = [col for col, _ in ROUTE_POINT_KEYSET]
+        params = {
+            "select": select_columns(fields, ["id", "lat", "lng", "timestamp", "route_id", "cell"], keys),
+            "route_id": f"eq.{route_id}",
+            "limit": str(limit + 1),
+            **keyset_params(ROUTE_POINT_KEYSET, cursor),
+        }
+        try:
+            rows = await self._request("GET", "POINTS", params=params)
+        except Exception as e:
+            raise Exception(f"Failed to fetch points for route: {e}")
+        return page(rows, limit, keys, fields)
+
+    async def get_points_in_bbox(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float,
+                                 limit: Optional[int] = None, columns: Optional[List[str]] = None):
+        ranges = ",".join(f"and(cell.gte.{lo},cell.lt.{hi})" for lo, hi in cover_bbox(min_lat, min_lng, max_lat, max_lng))
+        params = {
+            "select": ",".join(columns) if columns else "*",
+            "or": f"({ranges})",
+            # Cells overhang the box, so the exact bounds are checked as well
+            "and": f"(lat.gte.{min_lat},lat.lte.{max_lat},lng.gte.{min_lng},lng.lte.{max_lng})",
+        }
+        # One GET: past max-rows PostgREST returns an arbitrary max-rows subset, which
+        # callers get anyway when more than `limit` points are inside
+        if limit is not None:
+            params["limit"] = str(limit)
+        try:
+            return await self._request("GET", "POINTS", params=params)
+        except Exception as e:
+            raise Exception(f"Failed to fetch points in bounding box: {e}")
+
+    async def nearest_route_points(self, lat: float, lng: float, radius_m: float,
+                                   limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        (min_lat, min_lng, max_lat, max_lng), ranges, kx2, max_d2 = near_filter(lat, lng, radius_m)
+        try:
+            # One row per route, picked in the database (migrations/012)
+            return await self._request("POST", "rpc/nearest_route_points", json={
+                "p_lo": [lo for lo, _ in ranges], "p_hi": [hi for _, hi in ranges],
+                "p_min_lat": min_lat, "p_max_lat": max_lat, "p_min_lng": min_lng, "p_max_lng": max_lng,
+                "p_lat": lat, "p_lng": lng, "p_kx2": kx2, "p_max_d2": max_d2, "p_limit": limit,
+            }) or []
+        except Exception as e:
+            raise Exception(f"Failed to fetch routes near point: {e}")
+
+    async def update_point(self, point_id: int, point_data: dict):
+        try:
+            before = await self._point_before_update(point_id, point_data)
+            point_data = await self._reindex_point_update(point_id, point_data, before)
+            data = await self._request("PATCH", "POINTS", params={"id": f"eq.{point_id}"}, json=point_data)
+            await self._invalidate_routes(data)
+            await self._track_point_update(before, self._first(data))
+            return self._first(data)
+        except Exception as e:
+            raise Exception(f"Failed to update point: {e}")
+
+    async def delete_point(self, point_id: int):
+        try:
+            data = await self._request("DELETE", "POINTS", params={"id": f"eq.{point_id}"})
+            await self._invalidate_routes(data)
+            await self._track_point_write(data or [], -1)
+            return data
+        except Exception as e:
+            raise Exception(f"Failed to delete point: {e}")
+
+    async def append_route_points(self, route_id: int, points_data: list, seq: int) -> int:
+        try:
+            # Points and live_seq in one transaction (migrations/009)
+            inserted = int(await self._request("POST", "rpc/append_live_points", json={
+                "p_route_id": route_id, "p_seq": seq, "p_points": index_points([dict(p) for p in points_data]),
+            }))
+            # Only this route's entries; the route list does not need a refresh per batch
+            await self.cache.invalidate(f"route:{route_id}")
+            if inserted:
+                await self._track_point_write([dict(p, route_id=route_id) for p in points_data])
+            return inserted
+        except Exception as e:
+            raise Exception(f"Failed to append live points: {e}")
+
+    async def delete_route_points_chunk(self, route_id: int, limit: int) -> int:
+        try:
+            # One bounded delete in the database (migrations/008) that returns a count, not the rows
+            deleted = int(await self._request(
+                "POST", "rpc/delete_route_points", json={"p_route_id": route_id, "p_limit": limit}
+            ))
+            if deleted:
+                await self.cache.invalidate(f"route:{route_id}")
+            return deleted
+        except Exception as e:
+            raise Exception(f"Failed to delete points for route: {e}")
+
+    # ROUTE_LOD management methods
+    async def get_route_lod_with_etag(self, route_id: int, max_tolerance_m: float):
+        async def load():
+            try:
+                data = await self._request(
+                    "GET", "ROUTE_LOD",
+                    params={
+                        "select": "*",
+                        "route_id": f"eq.{route_id}",
+                        "tolerance_m": f"lte.{max_tolerance_m}",
+                        "order": "tolerance_m.desc",
+                        "limit": "1",
+                    },
+                )
+                return self._first(data)
+            except Exception as e:
+                raise Exception(f"Failed to fetch route level of detail: {e}")
+
+        return await self.cache.get_or_load(f"route:{route_id}", f"lod:{max_tolerance_m}", load)
+
+    async def replace_route_lods(self, route_id: int, lod_rows: list):
+        try:
+            await self._request("DELETE", "ROUTE_LOD", params={"route_id": f"eq.{route_id}"})
+            data = await self._request("POST", "ROUTE_LOD", json=lod_rows) if lod_rows else []
+            await self.cache.invalidate(f"route:{route_id}")
+            return data
+        except Exception as e:
+            raise Exception(f"Failed to store route levels of detail: {e}")
+
+    # SEGMENT management methods
+    async def create_segment(self, segment_data: dict):
+        try:
+            return self._first(await self._request("POST", "SEGMENT", json=segment_data))
+        except Exception as e:
+            raise Exception(f"Failed to create segment: {e}")
+
+    async def get_segment_by_id(self, segment_id: int):
+        try:
+            return self._first(await self._request("GET", "SEGMENT", params={"select": "*", "id": f"eq.{segment_id}"}))
+        except Exception as e:
+            raise Exception(f"Failed to fetch segment: {e}")
+
+    async def get_segments_by_start_cells(self, cells: List[int]):
+        try:
+            segments = []
+            # Keep each request URL short; a long route can touch thousands of cells
+            for start in range(0, len(cells), 400):
+                chunk = ",".join(str(int(c)) for c in cells[start:start + 400])
+                segments.extend(await self._request("GET", "SEGMENT", params={"select": "*", "start_cell": f"in.({chunk})"}))
+            return segments
+        except Exception as e:
+            raise Exception(f"Failed to fetch segments: {e}")
+
+    async def delete_segment(self, segment_id: int):
+        try:
+            await self._request("DELETE", "SEGMENT_EFFORT", params={"segment_id": f"eq.{segment_id}"})
+            data = await self._request("DELETE", "SEGMENT", params={"id": f"eq.{segment_id}"})
+            await self.cache.invalidate(f"segment:{segment_id}")
+            return data
+        except Exception as e:
+            raise Exception(f"Failed to delete segment: {e}")
+
+    async def record_segment_efforts(self, efforts: list):
+        if not efforts:
+            return []
+        try:
+            # Compared with the current bests and upserted in one statement (migrations/013)
+            kept = await self._request("POST", "rpc/record_segment_efforts", json={"p_efforts": efforts}) or []
+            await self.cache.invalidate(*{f"segment:{e['segment_id']}" for e in kept})
+            return kept
+        except Exception as e:
+            raise Exception(f"Failed to record segment efforts: {e}")
+
+    async def get_segment_leaderboard_with_etag(self, segment_id: int, limit: int):
+        async def load():
+            try:
+                return await self._request("GET", "SEGMENT_EFFORT", params={
+                    "select": "*",
+                    "segment_id": f"eq.{segment_id}",
+                    "order": "elapsed_s.asc,started_at.asc",
+                    "limit": str(limit),
+                })
+            except Exception as e:
+                raise Exception(f"Failed to fetch segment leaderboard: {e}")
+
+        return await self.cache.get_or_load(f"segment:{segment_id}", f"leaderboard:{limit}", load)
+
+    # GROUPS, GROUP_MEMBER and GROUP_LEADERBOARD management methods
+    async def create_group(self, group_data: dict, user_id: str):
+        try:
+            # Group and owner membership in one transaction (migrations/014)
+            group = self._first(await self._request(
+                "POST", "rpc/create_group", json={"p_name": group_data["name"], "p_user_reference": user_id}
+            ))
+            await self.cache.invalidate(f"groups:{user_id}")
+            return group
+        except Exception as e:
+            raise Exception(f"Failed to create group: {e}")
+
+    async def get_group_by_id(self, group_id: int):
+        try:
+            return self._first(await self._request("GET", "GROUPS", params={"select": "*", "id": f"eq.{group_id}"}))
+        except Exception as e:
+            raise Exception(f"Failed to fetch group: {e}")
+
+    async def get_all_groups(self):
+        try:
+            return await self._request_all("GET", "GROUPS", {"select": "*"}, [("id", "asc")])
+        except Exception as e:
+            raise Exception(f"Failed to fetch groups: {e}")
+
+    async def delete_group(self, group_id: int):
+        try:
+            members = await self.get_group_members(group_id)
+            await self._request("DELETE", "GROUP_LEADERBOARD", params={"group_id": f"eq.{group_id}"})
+            await self._request("DELETE", "GROUP_MEMBER", params={"group_id": f"eq.{group_id}"})
+            data = await self._request("DELETE", "GROUPS", params={"id": f"eq.{group_id}"})
+            await self.cache.invalidate(f"group:{group_id}", *(f"groups:{m['user_reference']}" for m in members))
+            return data
+        except Exception as e:
+            raise Exception(f"Failed to delete group: {e}")
+
+    async def add_group_member(self, group_id: int, user_id: str):
+        try:
+            data = await self._request(
+                "POST", "GROUP_MEMBER",
+                params={"on_conflict": "group_id,user_reference"},
+                json={"group_id": group_id, "user_reference": user_id, "joined_at": datetime.now(timezone.utc).isoformat()},
+                prefer="resolution=ignore-duplicates",
+            )
+            await self.cache.invalidate(f"groups:{user_id}", f"group:{group_id}")
+            return self._first(data)
+        except Exception as e:
+            raise Exception(f"Failed to add group member: {e}")
+
+    async def remove_group_member(self, group_id: int, user_id: str):
+        try:
+            match = {"group_id": f"eq.{group_id}", "user_reference": f"eq.{user_id}"}
+            await self._request("DELETE", "GROUP_LEADERBOARD", params=match)
+            data = await self._request("DELETE", "GROUP_MEMBER", params=match)
+            await self.cache.invalidate(f"groups:{user_id}", f"group:{group_id}")
+            return data
+        except Exception as e:
+            raise Exception(f"Failed to remove group member: {e}")
+
+    async def get_group_members(self, group_id: int):
+        try:
+            return await self._request_all(
+                "GET", "GROUP_MEMBER", {"select": "*", "group_id": f"eq.{group_id}"},
+                [("joined_at", "asc"), ("user_reference", "asc")],
+            )
+        except Exception as e:
+            raise Exception(f"Failed to fetch group members: {e}")
+
+    async def get_user_group_ids(self, user_id: str) -> List[int]:
+        async def load():
+            try:
+                rows = await self._request("GET", "GROUP_MEMBER", params={
+                    "select": "group_id", "user_reference": f"eq.{user_id}",
+                })
+                return [r["group_id"] for r in rows]
+            except Exception as e:
+                raise Exception(f"Failed to fetch user groups: {e}")
+
+        group_ids, _ = await self.cache.get_or_load(f"groups:{user_id}", "ids", load)
+        return group_ids
+
+    async def apply_leaderboard_deltas(self, deltas: list):
+        if not deltas:
+            return
+        try:
+            # Additive upsert in the database (migrations/006): concurrent writers cannot lose updates
+            await self._request("POST", "rpc/apply_leaderboard_deltas", json={"deltas": deltas})
+            await self.cache.invalidate(*{f"group:{d['group_id']}" for d in deltas})
+        except Exception as e:
+            raise Exception(f"Failed to apply leaderboard deltas: {e}")
+
+    async def replace_group_leaderboard(self, group_id: int, rows: list, user_id: Optional[str] = None):
+        try:
+            match = {"group_id": f"eq.{group_id}"}
+            if user_id is not None:
+                match["user_reference"] = f"eq.{user_id}"
+            await self._request("DELETE", "GROUP_LEADERBOARD", params=match)
+            data = []
+            for start in range(0, len(rows), 1000):
+                data.extend(await self._request(
+                    "POST", "GROUP_LEADERBOARD", json=[{**r, "group_id": group_id} for r in rows[start:start + 1000]]
+                ))
+            await self.cache.invalidate(f"group:{group_id}")
+            return data
+        except Exception as e:
+            raise Exception(f"Failed to replace group leaderboard: {e}")
+
+    async def get_group_leaderboard_with_etag(self, group_id: int, period: str, period_start: str,
+                                              metric: str, limit: int):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown leaderboard metric {metric!r}")
+
+        async def load():
+            try:
+                return await self._request("GET", "GROUP_LEADERBOARD", params={
+                    "select": "*",
+                    "group_id": f"eq.{group_id}",
+                    "period": f"eq.{period}",
+                    "period_start": f"eq.{period_start}",
+                    "order": f"{metric}.desc,user_reference.asc",
+                    "limit": str(limit),
+                })
+            except Exception as e:
+                raise Exception(f"Failed to fetch group leaderboard: {e}")
+
+        return await self.cache.get_or_load(
+            f"group:{group_id}", f"leaderboard:{period}:{period_start}:{metric}:{limit}", load
+        )
+
+    # USER_STATS management methods
+    async def apply_user_stats_deltas(self, deltas: list):
+        if not deltas:
+            return
+        try:
+            await self._request("POST", "rpc/apply_user_stats_deltas", json={"deltas": deltas})
+            await self.cache.invalidate(*{f"stats:{d['user_reference']}" for d in deltas})
+        except Exception as e:
+            raise Exception(f"Failed to apply user stats deltas: {e}")
+
+    async def replace_user_stats(self, user_id: str, rows: list):
+        try:
+            await self._request("DELETE", "USER_STATS", params={"user_reference": f"eq.{user_id}"})
+            data = []
+            for start in range(0, len(rows), 1000):
+                data.extend(await self._request(
+                    "POST", "USER_STATS", json=[{**r, "user_reference": user_id} for r in rows[start:start + 1000]]
+                ))
+            await self.cache.invalidate(f"stats:{user_id}")
+            return data
+        except Exception as e:
+            raise Exception(f"Failed to replace user stats: {e}")
+
+    async def get_user_stats_with_etag(self, user_id: str, period: str, first: str, last: str):
+        async def load():
+            try:
+                return await self._request("GET", "USER_STATS", params=[
+                    ("select", "period_start,distance,duration_s,activities"),
+                    ("user_reference", f"eq.{user_id}"),
+                    ("period", f"eq.{period}"),
+                    ("period_start", f"gte.{first}"),
+                    ("period_start", f"lte.{last}"),
+                    ("order", "period_start.asc"),
+                ])
+            except Exception as e:
+                raise Exception(f"Failed to fetch user stats: {e}")
+
+        return await self.cache.get_or_load(f"stats:{user_id}", f"{period}:{first}:{last}", load)
+
+    async def apply_heatmap_deltas(self, deltas: list):
+        if not deltas:
+            return
+        try:
+            await self._request("POST", "rpc/apply_heatmap_deltas", json={"deltas": deltas})
+        except Exception as e:
+            raise Exception(f"Failed to apply heatmap deltas: {e}")
+
+    async def replace_user_heatmap(self, user_id: str, rows: list):
+        try:
+            await self._request("DELETE", "HEATMAP_CELL", params={"user_reference": f"eq.{user_id}"})
+            for start in range(0, len(rows), 5000):
+                await self.apply_heatmap_deltas([{**r, "user_reference": user_id} for r in rows[start:start + 5000]])
+        except Exception as e:
+            raise Exception(f"Failed to replace user heatmap: {e}")
+
+    async def get_heatmap_bins(self, user_ids: List[str], zoom: int, min_x: int, max_x: int,
+                               min_y: int, max_y: int) -> List[Dict[str, Any]]:
+        if not user_ids:
+            return []
+        try:
+            # Summed and returned as one JSON value, which max-rows does not cut off (migrations/016)
+            return await self._request("POST", "rpc/heatmap_tile_bins", json={
+                "p_users": list(user_ids), "p_zoom": zoom,
+                "p_min_x": min_x, "p_max_x": max_x, "p_min_y": min_y, "p_max_y": max_y,
+            }) or []
+        except Exception as e:
+            raise Exception(f"Failed to fetch heatmap bins: {e}")
+
+    async def get_route_user_ids(self) -> List[str]:
+        try:
+            rows = await self._request_all("POST", "rpc/route_user_ids", {}, [("user_reference", "asc")])
+            return [r["user_reference"] for r in rows]
+        except Exception as e:
+            raise Exception(f"Failed to fetch route owners: {e}")
+
+    async def get_activity_user_ids(self) -> List[str]:
+        try:
+            rows = await self._request_all("POST", "rpc/activity_user_ids", {}, [("user_reference", "asc")])
+            return [r["user_reference"] for r in rows]
+        except Exception as e:
+            raise Exception(f"Failed to fetch activity users: {e}")
@@ -0,0 +1,163 @@
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+import requests
+from .jwt_cache import build_key_table
+from instrumentation.log import get_logger
+
+logger = get_logger("jwks_manager")
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+class jwks_manager:
+    """Keeps a JWKS document and its kid -> key table fresh.
+
+    - A daemon thread refreshes the key set on the interval advertised by the
+      endpoint's Cache-Control max-age, falling back to `refresh_interval`.
+    - Lookups for unknown kids trigger at most one fetch at a time; concurrent
+      callers wait on the in-flight fetch instead of starting their own.
+    - Fetches are spaced at least `min_refresh_interval` seconds apart.
+    - Kids still missing after a fetch are remembered for `negative_ttl`
+      seconds, so repeated bogus kids never reach the network. A kid looked
+      up while fetches are rate limited is remembered until the next fetch
+      is allowed, so a rotated-in key is still found then.
+    """
+
+    def __init__(
+        self,
+        jwks_url: str,
+        refresh_interval: float = 600.0,
+        min_refresh_interval: float = 10.0,
+        negative_ttl: float = 60.0,
+        max_negative_entries: int = 10000,
+        timeout: float = 5.0,
+        http_get: Optional[Callable[..., Any]] = None,
+    ):
+        self.jwks_url = jwks_url
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.negative_ttl = negative_ttl
+        self.max_negative_entries = max_negative_entries
+        self.timeout = timeout
+        # requests.get-compatible; pass a wrapped one to time or trace every fetch
+        self.http_get = http_get or requests.get
+
+        self.jwks: Dict[str, Any] = {"keys": []}
+        self.keys: Dict[str, Any] = {}
+        self.fetch_count = 0
+
+        self._lock = threading.Lock()
+        self._inflight: Optional[threading.Event] = None
+        self._last_fetch = float("-inf")
+        self._next_refresh = 0.0
+        self._unknown_kids: Dict[str, float] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="jwks-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            delay = max(self._next_refresh - time.monotonic(), self.min_refresh_interval)
+            if self._stop.wait(delay):
+                return
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning("Background JWKS refresh failed", extra={"fields": {"error": str(e)}})
+
+    def load(self, jwks: Dict[str, Any]):
+        # Only rebuild the kid -> key table when the key set actually changed
+        if jwks == self.jwks and self.keys:
+            return
+        keys = build_key_table(jwks)
+        with self._lock:
+            self.jwks = jwks
+            self.keys = keys
+            self._unknown_kids.clear()
+
+    def get_key(self, kid: str):
+        key = self.keys.get(kid)
+        if key is not None:
+            return key
+
+        expires_at = self._unknown_kids.get(kid)
+        if expires_at is not None and expires_at > time.monotonic():
+            return None
+
+        try:
+            refreshed = self.refresh()
+        except Exception as e:
+            logger.warning("Failed to refresh JWKS", extra={"fields": {"error": str(e)}})
+            return None
+        if not refreshed:
+            # Rate limited: the key set is recent, so the kid is simply unknown. Remember
+            # that until the next fetch is allowed, so repeats skip refresh() altogether
+            self._remember_unknown(kid, self._last_fetch + self.min_refresh_interval - time.monotonic())
+            return None
+
+        key = self.keys.get(kid)
+        if key is None:
+            self._remember_unknown(kid)
+        return key
+
+    def _remember_unknown(self, kid: str, ttl: Optional[float] = None):
+        ttl = self.negative_ttl if ttl is None else min(ttl, self.negative_ttl)
+        with self._lock:
+            if len(self._unknown_kids) >= self.max_negative_entries:
+                now = time.monotonic()
+                self._unknown_kids = {k: t for k, t in self._unknown_kids.items() if t > now}
+                if len(self._unknown_kids) >= self.max_negative_entries:
+                    self._unknown_kids.clear()
+            self._unknown_kids[kid] = time.monotonic() + ttl
+
+    def refresh(self) -> bool:
+        """Fetch the JWKS unless rate limited. Returns True if fresh data is available."""
+        with self._lock:
+            event = self._inflight
+            leader = event is None
+            if leader:
+                if time.monotonic() - self._last_fetch < self.min_refresh_interval:
+                    return False
+                event = threading.Event()
+                self._inflight = event
+
+        if not leader:
+            event.wait(self.timeout)
+            return True
+
+        try:
+            self._fetch()
+        finally:
+            with self._lock:
+                self._last_fetch = time.monotonic()
+                self._inflight = None
+            event.set()
+        return True
+
+    def _fetch(self):
+        self.fetch_count += 1
+        resp = self.http_get(self.jwks_url, timeout=self.timeout)
+        resp.raise_for_status()
+        jwks = resp.json()
+
+        interval = self.refresh_interval
+        match = _MAX_AGE_RE.search(resp.headers.get("Cache-Control", ""))
+        if match:
+            interval = max(float(match.group(1)), self.min_refresh_interval)
+        self._next_refresh = time.monotonic() + interval
+
+        self.load(jwks)
@@ -0,0 +1,85 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+from jose import jwk
+
+
+class token_cache:
+    """Bounded LRU of already-verified JWT payloads.
+
+    Entries are keyed by the SHA-256 digest of the raw token (so the token
+    itself is never kept in memory) and expire at the earlier of the token's
+    `exp` claim and `max_ttl` seconds after insertion.
+    """
+
+    def __init__(self, max_entries: int = 4096, max_ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self.digest(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, payload = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, token: str, payload: dict) -> None:
+        now = time.time()
+        expires_at = now + self.max_ttl
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, float(exp))
+        if expires_at <= now:
+            return
+
+        key = self.digest(token)
+        with self._lock:
+            self._entries[key] = (expires_at, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def build_key_table(jwks: Dict[str, Any]) -> Dict[str, Any]:
+    """Map every kid in a JWKS document to a ready-to-use jose key object.
+
+    Keys that cannot be constructed up front (e.g. no `alg` advertised) are
+    kept as their raw JWK dict, which jose accepts as well.
+    """
+    table: Dict[str, Any] = {}
+    for key_data in jwks.get("keys", []):
+        kid = key_data.get("kid")
+        if not kid:
+            continue
+        try:
+            table[kid] = jwk.construct(key_data, key_data.get("alg"))
+        except Exception:
+            table[kid] = key_data
+    return table
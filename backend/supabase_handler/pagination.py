@@ -0,0 +1,108 @@
+"""Keyset (cursor) pagination and column projection helpers for PostgREST queries.
+
+A cursor is the opaque, URL-safe encoding of the sort-key values of the last
+row on a page. The next page continues strictly after that row, so the cost
+of a page does not depend on how deep into the list it is.
+"""
+import base64
+import json
+from typing import List, Optional, Sequence, Dict, Any, Tuple
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise InvalidCursor("Malformed cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor("Malformed cursor")
+    return values
+
+
+def _literal(value: Any) -> str:
+    # Quote strings so dates/timestamps survive PostgREST's logic-tree syntax
+    if isinstance(value, str):
+        return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        raise InvalidCursor("Malformed cursor")
+    return str(value)
+
+
+def keyset_params(keys: Sequence[Tuple[str, str]], cursor: Optional[str]) -> Dict[str, str]:
+    """PostgREST `order` and row-comparison filter for a (column, "asc"|"desc") keyset.
+
+    For keys (a desc, b desc) and cursor (x, y) the filter is
+    `a < x OR (a = x AND b < y)`.
+    """
+    params = {"order": ",".join(f"{col}.{direction}" for col, direction in keys)}
+    if cursor is None:
+        return params
+
+    values = [_literal(v) for v in decode_cursor(cursor, len(keys))]
+    clauses = []
+    for i, (col, direction) in enumerate(keys):
+        op = "lt" if direction == "desc" else "gt"
+        equal = [f"{keys[j][0]}.eq.{values[j]}" for j in range(i)]
+        term = f"{col}.{op}.{values[i]}"
+        clauses.append(f"and({','.join(equal + [term])})" if equal else term)
+    params["or"] = f"({','.join(clauses)})"
+    return params
+
+
+def keyset_sql(keys: Sequence[Tuple[str, str]], cursor: Optional[str]) -> Tuple[str, str, List[Any]]:
+    """SQL equivalent of keyset_params: (ORDER BY clause, WHERE condition, parameters).
+
+    The condition is "" on the first page. Column names must already be trusted.
+    """
+    order = ", ".join(f'"{col}" {direction.upper()}' for col, direction in keys)
+    if cursor is None:
+        return order, "", []
+
+    values = decode_cursor(cursor, len(keys))
+    for value in values:
+        _literal(value)
+    clauses, params = [], []
+    for i, (col, direction) in enumerate(keys):
+        op = "<" if direction == "desc" else ">"
+        terms = [f'"{keys[j][0]}" = ?' for j in range(i)] + [f'"{col}" {op} ?']
+        clauses.append("(" + " AND ".join(terms) + ")")
+        params.extend(values[:i + 1])
+    return order, "(" + " OR ".join(clauses) + ")", params
+
+
+def select_columns(fields: Optional[Sequence[str]], allowed: Sequence[str], required: Sequence[str]) -> str:
+    """Validate a `fields=` projection and return the PostgREST select list.
+
+    Keyset columns in `required` are always selected so the next cursor can
+    be built; `page()` strips them again if they were not asked for.
+    """
+    if not fields:
+        return "*"
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return ",".join(dict.fromkeys([*fields, *required]))
+
+
+def page(rows: List[Dict[str, Any]], limit: int, keys: Sequence[str], fields: Optional[Sequence[str]] = None):
+    """Split a `limit + 1` row fetch into (rows, next_cursor)."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][k] for k in keys])
+    if fields:
+        rows = [{f: row.get(f) for f in fields} for row in rows]
+    return rows, next_cursor
@@ -0,0 +1,129 @@
+"""Read-through cache for PostgREST reads, with scope-based invalidation.
+
+Entries are grouped into scopes ("activities:<user>", "route:<id>",
+"routes"). Every scope has a version number that is part of each entry's
+key; writers bump the version, which makes every entry of that scope
+unreachable at once without having to enumerate them. Stale entries age out
+through TTL/LRU.
+
+In memory the version table is LRU-bounded too. Versions come from one
+counter, and a scope that is not in the table reads the highest version
+evicted so far, so an evicted scope never returns to a version its stale
+entries (or loads in flight) were stored under.
+
+Each entry also carries an ETag computed once at load time, so conditional
+requests can be answered without serializing the body again.
+
+The storage is pluggable: memory_cache_backend (per process, default) or
+redis_cache_backend (shared across workers, needs the `redis` package).
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Tuple
+
+
+def make_etag(value: Any) -> str:
+    body = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+class memory_cache_backend:
+    """Per-process TTL + LRU store."""
+
+    def __init__(self, max_entries: int = 10000, max_scopes: int = 10000):
+        self.max_entries = max_entries
+        self.max_scopes = max_scopes
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._versions: "OrderedDict[str, int]" = OrderedDict()
+        self._last_version = 0
+        # Version of every scope not in _versions
+        self._evicted_version = 0
+        self._lock = threading.Lock()
+
+    async def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def version(self, scope: str) -> int:
+        with self._lock:
+            return self._versions.get(scope, self._evicted_version)
+
+    async def bump(self, scope: str):
+        with self._lock:
+            self._last_version += 1
+            self._versions[scope] = self._last_version
+            self._versions.move_to_end(scope)
+            while len(self._versions) > self.max_scopes:
+                _, version = self._versions.popitem(last=False)
+                self._evicted_version = max(self._evicted_version, version)
+
+
+class redis_cache_backend:
+    """Shared store on Redis; values are JSON encoded."""
+
+    def __init__(self, url: str, prefix: str = "carva:cache:"):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str):
+        raw = await self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: float):
+        await self.client.set(self.prefix + key, json.dumps(value, default=str), px=int(ttl * 1000))
+
+    async def version(self, scope: str) -> int:
+        raw = await self.client.get(f"{self.prefix}v:{scope}")
+        return int(raw) if raw is not None else 0
+
+    async def bump(self, scope: str):
+        await self.client.incr(f"{self.prefix}v:{scope}")
+
+
+class read_cache:
+    def __init__(self, backend=None, ttl: float = 30.0):
+        self.backend = backend or memory_cache_backend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_load(self, scope: str, key: str, loader: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """Return (value, etag) for `key` in `scope`, calling `loader` on a miss.
+
+        Cached values are shared between requests and must not be mutated.
+        """
+        full_key = f"{scope}@{await self.backend.version(scope)}:{key}"
+        entry = await self.backend.get(full_key)
+        if entry is not None:
+            self.hits += 1
+            return entry[0], entry[1]
+
+        self.misses += 1
+        value = await loader()
+        etag = make_etag(value)
+        await self.backend.set(full_key, [value, etag], self.ttl)
+        return value, etag
+
+    async def invalidate(self, *scopes: str):
+        for scope in scopes:
+            await self.backend.bump(scope)
@@ -1,28 +1,42 @@
 import os
 from dotenv import load_dotenv
-from typing import Optional, Dict, Any
-import requests
+from typing import Optional, Any, Callable
 from jose import jwt, JWTError
 from supabase import create_client, Client
+from .jwt_cache import token_cache
+from .jwks_manager import jwks_manager
+from instrumentation.log import get_logger
+
+logger = get_logger("supabase_handler")
 
 class supabase_handler:
-    def __init__(self):
+    def __init__(self, jwks_http_get: Optional[Callable[..., Any]] = None):
         load_dotenv()
         url: str = os.getenv("SUPABASE_URL")
         key: str = os.getenv("SUPABASE_KEY")
         
+        # Verified tokens are cached until their exp (or JWT_CACHE_TTL seconds)
+        self.token_cache = token_cache(
+            max_entries=int(os.getenv("JWT_CACHE_SIZE", "4096")),
+            max_ttl=float(os.getenv("JWT_CACHE_TTL", "300")),
+        )
+
         # Get JWKS from standard Supabase endpoint (for RSA/EC tokens)
         self.jwks_url = f"{url}/auth/v1/.well-known/jwks.json"
-        try:
-            resp = requests.get(self.jwks_url)
-            print(f"Fetched JWKS from {self.jwks_url} - status: {resp.status_code}")
-            self.jwks = resp.json()
-            # print only the list of kids to avoid dumping full key material
-            kids = [k.get("kid") for k in self.jwks.get("keys", [])]
-            print("Initial JWKS kids:", kids)
-        except Exception as e:
-            print(f"Failed to fetch JWKS at startup: {e}")
-            self.jwks = {"keys": []}
+        self.jwks_manager = jwks_manager(
+            self.jwks_url,
+            refresh_interval=float(os.getenv("JWKS_REFRESH_INTERVAL", "600")),
+            min_refresh_interval=float(os.getenv("JWKS_MIN_REFRESH_INTERVAL", "10")),
+            negative_ttl=float(os.getenv("JWKS_NEGATIVE_TTL", "60")),
+            http_get=jwks_http_get,
+        )
+        try:
+            self.jwks_manager.refresh()
+            # log only the list of kids to avoid dumping full key material
+            logger.info("Initial JWKS loaded", extra={"fields": {"kids": list(self.jwks_manager.keys)}})
+        except Exception as e:
+            logger.warning("Failed to fetch JWKS at startup", extra={"fields": {"error": str(e)}})
+        self.jwks_manager.start()
         self.supabase: Client = create_client(url, key)
 
     def get_supabase_client(self) -> Client:
@@ -42,63 +56,40 @@ class supabase_handler:
         })
         return auth_response
 
-    def get_public_key(self, kid: str) -> Dict[str, Any]:
-        print("Getting public key for kid:", kid)
-        # show current JWKS kids
-        current_kids = [k.get("kid") for k in self.jwks.get("keys", [])]
-        print("Current JWKS kids:", current_kids)
-
-        # First try to find the key in current JWKS
-        for key in self.jwks.get("keys", []):
-            if key.get("kid") == kid:
-                print("Found matching key in JWKS")
-                return key
-
-        # If not found, refresh JWKS and try again (cache-busting)
-        print("Key not found, refreshing JWKS...")
-        try:
-            resp = requests.get(self.jwks_url, params={"_": os.urandom(4).hex()})
-            print(f"Refreshed JWKS fetch status: {resp.status_code}")
-            refreshed = resp.json()
-            refreshed_kids = [k.get("kid") for k in refreshed.get("keys", [])]
-            print("Refreshed JWKS kids:", refreshed_kids)
-            # update local cache
-            self.jwks = refreshed
-
-            for key in self.jwks.get("keys", []):
-                if key.get("kid") == kid:
-                    print("Found matching key after refresh")
-                    return key
-        except Exception as e:
-            print(f"Failed to refresh JWKS: {e}")
-
-        raise Exception(f"Matching key not found in JWKS for kid: {kid}")
+    def get_public_key(self, kid: str):
+        # Pre-built key lookup; unknown kids go through the rate-limited,
+        # single-flight refresh and are negatively cached afterwards
+        key = self.jwks_manager.get_key(kid)
+        if key is None:
+            raise Exception(f"Matching key not found in JWKS for kid: {kid}")
+        return key
 
     def verify_jwt(self, token: str) -> dict:
+        # Repeated tokens skip header parsing and signature checks entirely
+        cached = self.token_cache.get(token)
+        if cached is not None:
+            return cached
+        return self.decode_jwt(token)
+
+    def decode_jwt(self, token: str) -> dict:
+        # Full verification, bypassing the cache lookup (result is still cached)
         try:
-            print("Verifying JWT token in supabase_handler...")
             header = jwt.get_unverified_header(token)
             kid = header.get("kid")
             alg = header.get("alg", "RS256")
-            print(f"Token header -> kid: {kid}, alg: {alg}")
-
 
             # Handle RSA/EC tokens with JWKS
-            print("Using JWKS for RSA/EC verification")
-            public_key = None
             if kid:
                 public_key = self.get_public_key(kid)
-                # print only the kid and kty for quick debugging
-                print("Using public key for verification -> kid:", public_key.get("kid"), "kty:", public_key.get("kty"))
 
-                # jose accepts either a JWK dict (for RSA/EC) or a secret (for HMAC)
+                # jose accepts either a key object, a JWK dict (for RSA/EC) or a secret (for HMAC)
                 payload = jwt.decode(
                     token,
-                    public_key or None,
+                    public_key,
                     algorithms=[alg],
                     options={"verify_aud": False}  # set to True and provide audience if used
                 )
-                print("JWT RSA/EC verification succeeded. Payload keys:", list(payload.keys()))
+                self.token_cache.put(token, payload)
                 return payload  # JWT claims as dict
 
         except JWTError as e:
@@ -202,8 +193,7 @@ class supabase_handler:
 
     def get_points_by_route(self, route_id: int):
         try:
-            # Assuming points have a route_id field that links to the route
-            response = self.supabase.table("POINTS").select("*").eq("id", route_id).execute()
+            response = self.supabase.table("POINTS").select("*").eq("route_id", route_id).order("timestamp").execute()
             return response.data
         except Exception as e:
             raise Exception(f"Failed to fetch points for route: {e}")
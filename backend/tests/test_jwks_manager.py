@@ -0,0 +1,102 @@
+"""jwks_manager against a local JWKS endpoint (benchmarks.standins.jwks_standin)."""
+import threading
+import time
+import pytest
+import requests
+from benchmarks.common import make_signing_key
+from benchmarks.standins import jwks_standin
+from supabase_handler.jwks_manager import jwks_manager
+
+
+@pytest.fixture
+def keys():
+    return {kid: make_signing_key(kid)[1] for kid in ("old-key", "new-key")}
+
+
+@pytest.fixture
+def standin(keys):
+    with jwks_standin({"keys": [keys["old-key"]]}) as server:
+        yield server
+
+
+def test_concurrent_lookups_share_one_fetch(keys):
+    with jwks_standin({"keys": [keys["old-key"]]}, latency=0.2) as standin:
+        manager = jwks_manager(standin.url, min_refresh_interval=0)
+        found = []
+        threads = [threading.Thread(target=lambda: found.append(manager.get_key("old-key"))) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert all(key is not None for key in found) and len(found) == 20
+        assert standin.requests == 1
+
+
+def test_fetches_are_rate_limited(standin):
+    manager = jwks_manager(standin.url, min_refresh_interval=60)
+    assert manager.get_key("old-key") is not None
+    assert manager.get_key("bogus-1") is None
+    assert manager.get_key("bogus-2") is None
+    assert standin.requests == 1
+
+
+def test_missing_kid_is_negatively_cached(standin):
+    manager = jwks_manager(standin.url, min_refresh_interval=0, negative_ttl=60)
+    for _ in range(5):
+        assert manager.get_key("bogus") is None
+    assert standin.requests == 1
+
+
+def test_rate_limited_lookup_is_negatively_cached(standin, monkeypatch):
+    manager = jwks_manager(standin.url, min_refresh_interval=60)
+    manager.get_key("old-key")
+    refreshes = []
+    refresh = manager.refresh
+    monkeypatch.setattr(manager, "refresh", lambda: refreshes.append(1) or refresh())
+    for _ in range(5):
+        assert manager.get_key("bogus") is None
+    assert len(refreshes) == 1
+    assert standin.requests == 1
+
+
+def test_rotated_key_is_found_once_fetches_resume(standin, keys):
+    manager = jwks_manager(standin.url, min_refresh_interval=0.3, negative_ttl=60)
+    assert manager.get_key("old-key") is not None
+    standin.jwks = {"keys": [keys["new-key"]]}
+
+    # Within the rate limit the new kid is unknown, and stays so without another fetch
+    assert manager.get_key("new-key") is None
+    assert manager.get_key("new-key") is None
+    assert standin.requests == 1
+
+    time.sleep(0.35)
+    assert manager.get_key("new-key") is not None
+    assert manager.get_key("old-key") is None
+    assert standin.requests == 2
+
+
+def test_background_refresh_follows_max_age(keys):
+    with jwks_standin({"keys": [keys["old-key"]]}, max_age=0) as standin:
+        manager = jwks_manager(standin.url, min_refresh_interval=0.1)
+        manager.refresh()
+        standin.jwks = {"keys": [keys["new-key"]]}
+        manager.start()
+        try:
+            deadline = time.monotonic() + 2
+            while "new-key" not in manager.keys and time.monotonic() < deadline:
+                time.sleep(0.02)
+        finally:
+            manager.stop()
+        assert "new-key" in manager.keys and "old-key" not in manager.keys
+
+
+def test_fetches_go_through_http_get(standin):
+    calls = []
+
+    def http_get(url, **kwargs):
+        calls.append(url)
+        return requests.get(url, **kwargs)
+
+    manager = jwks_manager(standin.url, http_get=http_get)
+    assert manager.get_key("old-key") is not None
+    assert calls == [standin.url]